@@ -0,0 +1,34 @@
+import time
+from typing import Callable, Dict, List
+import numpy as np
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    """Summarize latency samples (milliseconds) as mean/p50/p95/p99"""
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    if arr.size == 0:
+        return {"n": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    return {
+        "n": int(arr.size),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+    }
+
+def time_calls(fn: Callable, args_list: List, repeat: int = 1, warmup: int = 3) -> List[float]:
+    """Call `fn(arg)` for every arg, `repeat` times, returning per-call latencies in ms"""
+    for arg in args_list[:warmup]:
+        fn(arg)
+    samples = []
+    for _ in range(repeat):
+        for arg in args_list:
+            start = time.perf_counter()
+            fn(arg)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def print_summary_table(rows: Dict[str, Dict[str, float]]):
+    """Print a small fixed-width table of latency summaries keyed by label"""
+    print(f"{'mode':<28}{'n':>8}{'mean ms':>12}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for label, s in rows.items():
+        print(f"{label:<28}{s['n']:>8}{s['mean_ms']:>12.3f}{s['p50_ms']:>12.3f}{s['p95_ms']:>12.3f}{s['p99_ms']:>12.3f}")
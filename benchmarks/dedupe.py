@@ -0,0 +1,122 @@
+"""Throughput and accuracy of near-duplicate detection on a synthetic corpus.
+
+Builds --chunks sections from the snapshot's real sections. A --dup-rate share
+of them are copies of an earlier original with up to --edit-rate of their words
+replaced; the originals are new texts (real sections with their words shuffled
+and mixed with random tokens). Every section is then run through
+`ChunkDeduper.check` as at ingest time, without persistence.
+
+A copy counts as a true duplicate when the exact Jaccard similarity of its
+shingles with its source reaches the threshold. Reports sections/s,
+per-section latency, recall on true duplicates, how many copies below the
+threshold were flagged anyway, and the share of originals wrongly flagged.
+Section texts are generated before timing starts.
+
+Usage: python -m benchmarks.dedupe [--chunks 100000] [--dup-rate 0.3] [--edit-rate 0.02]
+                                   [--threshold 0.7 0.85 0.95] [--num-perm 64] [--out results.json]
+"""
+import json
+import time
+import argparse
+from typing import Dict, List
+import numpy as np
+from bs4 import BeautifulSoup
+from benchmarks.common import latency_summary
+from benchmarks.rag_suite import load_pages
+from utils.scraper import extract_main_content, html_to_xml, extract_sections_from_xml
+from utils.dedupe import ChunkDeduper, shingle_hashes
+
+
+def snapshot_sections() -> List[str]:
+    sections = []
+    for page in load_pages():
+        xml = html_to_xml(extract_main_content(BeautifulSoup(page["html"], "html.parser")), page["url"])
+        sections.extend(s["content"] for s in extract_sections_from_xml(xml) if len(s["content"].split()) >= 20)
+    return sections
+
+
+def jaccard(a: str, b: str) -> float:
+    x, y = shingle_hashes(a), shingle_hashes(b)
+    return len(np.intersect1d(x, y)) / len(np.union1d(x, y))
+
+
+def synthetic_corpus(n: int, dup_rate: float, edit_rate: float, seed: int = 0):
+    """(texts, similarity) where similarity is the exact Jaccard of a copy with its source, NaN for originals"""
+    rng = np.random.default_rng(seed)
+    templates = [s.split() for s in snapshot_sections()]
+    texts, originals = [], []
+    similarity = np.full(n, np.nan)
+    for i in range(n):
+        if originals and rng.random() < dup_rate:
+            source = texts[originals[rng.integers(len(originals))]]
+            words = source.split()
+            for j in np.flatnonzero(rng.random(len(words)) < rng.uniform(0, edit_rate)):
+                words[j] = f"w{rng.integers(1 << 30)}"
+            texts.append(" ".join(words))
+            similarity[i] = jaccard(source, texts[-1])
+        else:
+            words = list(templates[rng.integers(len(templates))])
+            rng.shuffle(words)
+            words[::7] = [f"w{rng.integers(1 << 30)}" for _ in words[::7]]
+            originals.append(i)
+            texts.append(" ".join(words))
+    return texts, similarity
+
+
+def run(texts: List[str], similarity: np.ndarray, threshold: float, num_perm: int) -> Dict:
+    deduper = ChunkDeduper("", mode="skip", threshold=threshold, num_perm=num_perm)
+    flagged = np.zeros(len(texts), dtype=bool)
+    samples = []
+    start = time.perf_counter()
+    for i, text in enumerate(texts):
+        t = time.perf_counter()
+        keep, _ = deduper.check(f"doc_{i}", [{"content": text}])
+        samples.append((time.perf_counter() - t) * 1000)
+        flagged[i] = not keep
+    seconds = time.perf_counter() - start
+    original = np.isnan(similarity)
+    duplicate = ~original & (np.nan_to_num(similarity) >= threshold)
+    below = ~original & ~duplicate
+    return {
+        "seconds": seconds, "chunks_per_s": len(texts) / seconds,
+        "bands": deduper.bands, "rows": deduper.rows,
+        "true_duplicates": int(duplicate.sum()),
+        "recall": float(flagged[duplicate].mean()) if duplicate.any() else None,
+        "flagged_below_threshold": float(flagged[below].mean()) if below.any() else None,
+        "false_positive_rate": float(flagged[original].mean()) if original.any() else None,
+        "flagged": int(flagged.sum()),
+        "latency": latency_summary(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dup-rate", type=float, default=0.3)
+    parser.add_argument("--edit-rate", type=float, default=0.02, help="Max share of words changed in a copy")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.7, 0.85, 0.95])
+    parser.add_argument("--num-perm", type=int, default=64)
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    texts, similarity = synthetic_corpus(args.chunks, args.dup_rate, args.edit_rate)
+    words = np.mean([len(t.split()) for t in texts])
+    copies = similarity[~np.isnan(similarity)]
+    print(f"Corpus: {len(texts)} sections ({copies.size} copies, median Jaccard {np.median(copies):.2f}), "
+          f"{words:.0f} words on average")
+    results = {f"threshold {t}": run(texts, similarity, t, args.num_perm) for t in args.threshold}
+
+    print(f"\n{'mode':<18}{'bands x rows':>14}{'sections/s':>12}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'dups':>8}{'recall':>9}{'below':>8}{'false +':>9}")
+    for label, r in results.items():
+        print(f"{label:<18}{r['bands']:>8} x {r['rows']:<3}{r['chunks_per_s']:>12.0f}"
+              f"{r['latency']['p50_ms']:>9.3f}{r['latency']['p99_ms']:>9.3f}{r['true_duplicates']:>8}"
+              f"{r['recall'] or 0:>9.3f}{r['flagged_below_threshold'] or 0:>8.3f}{r['false_positive_rate']:>9.4f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
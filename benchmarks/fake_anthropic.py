@@ -0,0 +1,114 @@
+"""Local stand-in for the Anthropic Messages API, for load tests without API credits.
+
+Serves POST /v1/messages in both non-streaming and streaming (SSE) form with
+a configurable time-to-first-token and output rate. Point the app at it with:
+
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake uv run chunk_data.py
+
+--error-rate makes a share of requests fail with 429 (rate limited) or, with
+--error-status 529, "overloaded", to exercise the app's retry and admission paths.
+
+Usage: python -m benchmarks.fake_anthropic [--port 8765] [--ttft-ms 400] [--tokens-per-s 60] [--output-tokens 300]
+"""
+import json
+import uuid
+import random
+import asyncio
+import argparse
+import itertools
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+WORDS = ("FastHTML routes return FT components which render to HTML and HTMX swaps them into "
+         "the page so most apps need very little JavaScript at all").split()
+
+# Mutable so the CLI (or a test) can adjust behaviour before serving
+CONFIG = {"ttft_ms": 400.0, "tokens_per_s": 60.0, "output_tokens": 300, "error_rate": 0.0, "error_status": 429,
+          "haiku_speedup": 3.0}
+
+
+def _fake_tokens(n: int):
+    """Deterministic filler text, one word per token"""
+    return [word + " " for word in itertools.islice(itertools.cycle(WORDS), n)]
+
+
+def _input_tokens(body: dict) -> int:
+    """Rough prompt size (about 4 characters per token), good enough for usage reporting"""
+    text = str(body.get("system", "")) + json.dumps(body.get("messages", []))
+    return max(1, len(text) // 4)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def messages(request: Request):
+    body = await request.json()
+    model = body.get("model", "claude-fake")
+    max_tokens = int(body.get("max_tokens", 1024))
+    n_tokens = min(max_tokens, CONFIG["output_tokens"])
+    stop_reason = "max_tokens" if n_tokens == max_tokens else "end_turn"
+    tokens = _fake_tokens(n_tokens)
+    input_tokens = _input_tokens(body)
+    message_id = f"msg_fake_{uuid.uuid4().hex[:24]}"
+    # Smaller models answer faster, so routing decisions show up in latency
+    speedup = CONFIG["haiku_speedup"] if "haiku" in model else 1.0
+    token_interval = 1.0 / (CONFIG["tokens_per_s"] * speedup) if CONFIG["tokens_per_s"] > 0 else 0.0
+
+    if random.random() < CONFIG["error_rate"]:
+        overloaded = CONFIG["error_status"] == 529
+        error_type = "overloaded_error" if overloaded else "rate_limit_error"
+        return JSONResponse({"type": "error", "error": {"type": error_type, "message": "Fake upstream refused"}},
+                            status_code=CONFIG["error_status"], headers={"retry-after": "1"})
+
+    if not body.get("stream"):
+        await asyncio.sleep(CONFIG["ttft_ms"] / 1000 / speedup + n_tokens * token_interval)
+        return JSONResponse({
+            "id": message_id, "type": "message", "role": "assistant", "model": model,
+            "content": [{"type": "text", "text": "".join(tokens)}],
+            "stop_reason": stop_reason, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": n_tokens},
+        })
+
+    async def stream():
+        yield _sse("message_start", {"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": model,
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1}}})
+        await asyncio.sleep(CONFIG["ttft_ms"] / 1000 / speedup)
+        yield _sse("content_block_start", {"type": "content_block_start", "index": 0,
+                                           "content_block": {"type": "text", "text": ""}})
+        for token in tokens:
+            yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                               "delta": {"type": "text_delta", "text": token}})
+            await asyncio.sleep(token_interval)
+        yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield _sse("message_delta", {"type": "message_delta",
+                                     "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                                     "usage": {"output_tokens": n_tokens}})
+        yield _sse("message_stop", {"type": "message_stop"})
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+app = Starlette(routes=[Route("/v1/messages", messages, methods=["POST"])])
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=CONFIG["ttft_ms"])
+    parser.add_argument("--tokens-per-s", type=float, default=CONFIG["tokens_per_s"])
+    parser.add_argument("--output-tokens", type=int, default=CONFIG["output_tokens"])
+    parser.add_argument("--haiku-speedup", type=float, default=CONFIG["haiku_speedup"],
+                        help="How much faster haiku models answer")
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"], help="Share of requests to refuse")
+    parser.add_argument("--error-status", type=int, default=CONFIG["error_status"], choices=[429, 529])
+    args = parser.parse_args()
+    CONFIG.update(ttft_ms=args.ttft_ms, tokens_per_s=args.tokens_per_s, output_tokens=args.output_tokens,
+                  error_rate=args.error_rate, error_status=args.error_status, haiku_speedup=args.haiku_speedup)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
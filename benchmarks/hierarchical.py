@@ -0,0 +1,122 @@
+"""Flat vs. two-stage (document -> section) retrieval on a large synthetic corpus.
+
+Ingests the page snapshot into a scratch database, then pads it with synthetic
+documents until it holds --docs documents. Each synthetic document copies the
+vectors of a real one with Gaussian noise added, so its sections compete with
+the real sections instead of sitting far away in embedding space. The labeled
+questions are then searched flat and hierarchically (top --top-docs documents
+first) through the LanceDB and NumPy backends.
+
+Reports recall@k, MRR and search latency. Query embedding is excluded from the
+timings since it is the same for every mode.
+
+Usage: python -m benchmarks.hierarchical [--docs 2000] [--chunks-per-doc 40] [--top-docs 3 5 10]
+                                         [--noise 2.0] [--k 5] [--repeat 3] [--out results.json]
+"""
+import json
+import shutil
+import argparse
+import tempfile
+from typing import Dict, List
+import numpy as np
+import pyarrow as pa
+from benchmarks.common import latency_summary, time_calls
+from benchmarks.rag_suite import load_pages, load_questions, bench_ingest, section_id
+
+
+def add_synthetic_documents(db, n_docs: int, chunks_per_doc: int, noise: float, seed: int = 0) -> int:
+    """Pad the corpus with noisy copies of the real documents; returns how many were added"""
+    rng = np.random.default_rng(seed)
+    docs = db.docs_table.to_arrow().select(["id", "vector"]).to_pylist()
+    chunks = db.chunks_table.to_arrow().select(["doc_id", "vector"]).to_pylist()
+    doc_chunks: Dict[str, List] = {}
+    for chunk in chunks:
+        doc_chunks.setdefault(chunk["doc_id"], []).append(chunk["vector"])
+    templates = [d for d in docs if d["id"] in doc_chunks]
+    dim = len(templates[0]["vector"])
+
+    def perturb(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        noisy = vectors + noise * rng.standard_normal(vectors.shape).astype(np.float32) / np.sqrt(dim)
+        return noisy / np.linalg.norm(noisy, axis=-1, keepdims=True)
+
+    to_add = max(0, n_docs - len(docs))
+    for start in range(0, to_add, 200):
+        doc_rows, chunk_rows = [], []
+        for i in range(start, min(start + 200, to_add)):
+            template = templates[rng.integers(len(templates))]
+            doc_id = f"doc_synthetic_{i}"
+            url = f"synthetic://doc/{i}"
+            doc_rows.append({"id": doc_id, "url": url, "title": f"Synthetic {i}", "xml_content": "",
+                             "url_hash": doc_id, "vector": perturb(template["vector"]).tolist()})
+            source = doc_chunks[template["id"]]
+            picks = rng.integers(len(source), size=chunks_per_doc)
+            for j, vector in enumerate(perturb([source[p] for p in picks])):
+                chunk_rows.append({"id": f"{doc_id}_chunk_{j}", "doc_id": doc_id, "url": url,
+                                   "section_title": f"Section {j}", "section_level": 2,
+                                   "content": "synthetic", "vector": vector.tolist()})
+        db.docs_table.add(pa.Table.from_pylist(doc_rows, schema=db.docs_table.schema))
+        db.chunks_table.add(pa.Table.from_pylist(chunk_rows, schema=db.chunks_table.schema))
+    return to_add
+
+
+def evaluate(db, embeddings, questions: List[Dict], k: int, repeat: int) -> Dict:
+    recall = mrr = 0.0
+    for embedding, q in zip(embeddings, questions):
+        retrieved = [section_id(r) for r in db.search_vector(embedding, k)]
+        relevant = set(q["relevant"])
+        rank = next((i + 1 for i, sid in enumerate(retrieved) if sid in relevant), None)
+        recall += len(relevant & set(retrieved)) / len(relevant) if relevant else 0.0
+        mrr += 1.0 / rank if rank else 0.0
+    n = max(1, len(questions))
+    return {"recall_at_k": recall / n, "mrr": mrr / n,
+            "latency": latency_summary(time_calls(lambda e: db.search_vector(e, k), embeddings, repeat))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000, help="Total documents after padding")
+    parser.add_argument("--chunks-per-doc", type=int, default=40)
+    parser.add_argument("--top-docs", type=int, nargs="+", default=[3, 5, 10],
+                        help="Documents kept by the coarse stage (one run per value)")
+    parser.add_argument("--noise", type=float, default=2.0, help="Norm of the noise added to copied vectors")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase
+
+    scratch_dir = tempfile.mkdtemp(prefix="fastrag-hierarchical-")
+    results = {}
+    try:
+        db = FastHTMLDatabase(scratch_dir, index_mode="lancedb")
+        bench_ingest(db, load_pages())
+        added = add_synthetic_documents(db, args.docs, args.chunks_per_doc, args.noise)
+        print(f"Corpus: {db.get_document_count()} documents ({added} synthetic), {db.get_chunk_count()} chunks")
+        db.ensure_scalar_indexes()
+
+        questions = load_questions()
+        embeddings = list(db.model.encode([q["question"] for q in questions]))
+        for backend in ("lancedb", "numpy"):
+            backend_db = db if backend == "lancedb" else FastHTMLDatabase(scratch_dir, index_mode="numpy")
+            for top_docs in [None] + args.top_docs:
+                backend_db.search_mode = "flat" if top_docs is None else "hierarchical"
+                backend_db.search_docs = top_docs or 0
+                label = f"{backend} {'flat' if top_docs is None else f'top {top_docs} docs'}"
+                results[label] = evaluate(backend_db, embeddings, questions, args.k, args.repeat)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(f"\n{'mode':<24}{'recall@k':>10}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, r in results.items():
+        print(f"{label:<24}{r['recall_at_k']:>10.3f}{r['mrr']:>8.3f}"
+              f"{r['latency']['p50_ms']:>10.2f}{r['latency']['p95_ms']:>10.2f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Concurrent load generator for the RAG web app.
+
+Each virtual user repeatedly posts a question to /search-and-generate and then
+consumes the answer stream from /generate-answer-streaming (plus
+/generate-answer-no-rag-streaming with --compare), passing the id of its own
+search so concurrent users never stream each other's answers. Reports
+throughput, time to first byte, time to first token and tail latency per endpoint.
+
+Run the app against the local Claude stand-in so no API credits are used:
+
+    python -m benchmarks.fake_anthropic --ttft-ms 400 --tokens-per-s 60 &
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake uv run chunk_data.py &
+    python -m benchmarks.load_test --users 20 --duration 60
+
+Usage: python -m benchmarks.load_test [--url http://127.0.0.1:5001] [--users 10] [--duration 30] [--compare] [--out report.json]
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Dict, List
+import httpx
+from benchmarks.common import latency_summary
+
+SEARCH_ID = re.compile(r'data-search-id="([0-9a-f]+)"')
+
+QUESTIONS = [
+    "How do I implement WebSocket real-time communication in FastHTML?",
+    "What's the best way to integrate Alpine.js for client-side reactivity?",
+    "How can I handle file uploads and image processing with FastHTML?",
+    "How do I implement JWT authentication and session management?",
+    "What's the recommended approach for database integration and ORM usage?",
+    "How can I build a responsive SPA with FastHTML and modern CSS frameworks?",
+    "What does hx_swap_oob do?",
+    "How do I define a route that accepts POST data?",
+]
+
+
+class Recorder:
+    """Collects per-endpoint timings and errors"""
+
+    def __init__(self):
+        self.samples: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.completed: Dict[str, int] = defaultdict(int)
+
+    def add(self, endpoint: str, **timings_ms):
+        self.completed[endpoint] += 1
+        for name, value in timings_ms.items():
+            if value is not None:
+                self.samples[endpoint][name].append(value)
+
+    def report(self, elapsed_s: float) -> Dict:
+        endpoints = {}
+        for endpoint in sorted(set(self.completed) | set(self.errors)):
+            endpoints[endpoint] = {
+                "completed": self.completed[endpoint],
+                "errors": self.errors[endpoint],
+                "throughput_rps": self.completed[endpoint] / elapsed_s if elapsed_s else 0.0,
+                **{name: latency_summary(values) for name, values in self.samples[endpoint].items()},
+            }
+        return {"elapsed_s": elapsed_s, "endpoints": endpoints}
+
+
+async def post_search(client: httpx.AsyncClient, recorder: Recorder, query: str, compare: bool) -> str:
+    """Post a question; returns the id the answer streams are opened with ("" on failure)"""
+    endpoint = "/search-and-generate"
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", endpoint, data={"query": query, **({"compare": "on"} if compare else {})}) as response:
+            ttfb = (time.perf_counter() - start) * 1000
+            body = await response.aread()
+            response.raise_for_status()
+        recorder.add(endpoint, ttfb_ms=ttfb, total_ms=(time.perf_counter() - start) * 1000)
+    except httpx.HTTPError:
+        recorder.errors[endpoint] += 1
+        return ""
+    match = SEARCH_ID.search(body.decode(errors="replace"))
+    return match.group(1) if match else ""
+
+
+async def consume_stream(client: httpx.AsyncClient, recorder: Recorder, endpoint: str, search_id: str):
+    """Read an SSE answer stream to the end, timing first byte and first token"""
+    start = time.perf_counter()
+    ttfb = first_token = None
+    failed = False
+    try:
+        async with client.stream("GET", endpoint, params={"search_id": search_id}) as response:
+            ttfb = (time.perf_counter() - start) * 1000
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = line[len("data: "):]
+                if payload == "[DONE]":
+                    break
+                event = json.loads(payload)
+                if event.get("type") == "chunk" and first_token is None:
+                    first_token = (time.perf_counter() - start) * 1000
+                elif event.get("type") == "error":
+                    failed = True
+    except (httpx.HTTPError, json.JSONDecodeError):
+        failed = True
+
+    if failed:
+        recorder.errors[endpoint] += 1
+    else:
+        recorder.add(endpoint, ttfb_ms=ttfb, ttft_ms=first_token, total_ms=(time.perf_counter() - start) * 1000)
+
+
+async def virtual_user(base_url: str, recorder: Recorder, deadline: float, compare: bool, think_time: float):
+    # Each user keeps its own connection pool, like a separate browser
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(120.0)) as client:
+        while time.perf_counter() < deadline:
+            search_id = await post_search(client, recorder, random.choice(QUESTIONS), compare)
+            if search_id:  # no id: no results, or no answer to stream
+                streams = [consume_stream(client, recorder, "/generate-answer-streaming", search_id)]
+                if compare:
+                    streams.append(consume_stream(client, recorder, "/generate-answer-no-rag-streaming", search_id))
+                await asyncio.gather(*streams)
+            if think_time:
+                await asyncio.sleep(random.uniform(0, think_time))
+
+
+async def run(args) -> Dict:
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    users = []
+    for _ in range(args.users):
+        users.append(asyncio.create_task(virtual_user(args.url, recorder, deadline, args.compare, args.think_time)))
+        await asyncio.sleep(args.ramp_up / max(1, args.users))
+    await asyncio.gather(*users)
+    report = recorder.report(time.perf_counter() - start)
+    report["config"] = {"url": args.url, "users": args.users, "duration_s": args.duration, "compare": args.compare}
+    return report
+
+
+def print_report(report: Dict):
+    print(f"{report['config']['users']} users, {report['elapsed_s']:.1f}s\n")
+    print(f"{'endpoint':<36}{'metric':<10}{'n':>6}{'err':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in report["endpoints"].items():
+        for metric in ("ttfb_ms", "ttft_ms", "total_ms"):
+            if metric not in stats:
+                continue
+            s = stats[metric]
+            print(f"{endpoint:<36}{metric[:-3]:<10}{s['n']:>6}{stats['errors']:>6}{stats['throughput_rps']:>8.2f}"
+                  f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5001")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep generating load")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which users are started")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between a user's questions")
+    parser.add_argument("--compare", action="store_true", help="Also stream the no-RAG answer")
+    parser.add_argument("--out", default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
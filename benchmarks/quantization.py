@@ -0,0 +1,67 @@
+"""Recall and latency trade-offs of quantized vector storage.
+
+Compares float16, int8 and binary-prefiltered search against exact float32
+search. Uses the chunk vectors from the database when available, otherwise a
+synthetic corpus of random unit vectors with near-duplicate queries.
+
+Usage: python -m benchmarks.quantization [--db ./lancedb] [--synthetic 100000] [--k 10]
+"""
+import argparse
+import numpy as np
+from utils.vector_index import QuantizedMatrix, normalize_rows
+from benchmarks.common import latency_summary, time_calls
+
+def load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        return normalize_rows(rng.standard_normal((args.synthetic, args.dim)).astype(np.float32))
+    from utils.database import FastHTMLDatabase
+    db = FastHTMLDatabase(args.db)
+    arrow_table = db.chunks_table.to_arrow().select(["vector"])
+    return normalize_rows(np.asarray(arrow_table.column("vector").to_pylist(), dtype=np.float32))
+
+def make_queries(vectors: np.ndarray, n: int, noise: float) -> np.ndarray:
+    """Perturbed copies of random corpus rows, so each query has a meaningful neighbourhood"""
+    rng = np.random.default_rng(1)
+    picks = vectors[rng.integers(0, len(vectors), n)]
+    return normalize_rows(picks + noise * rng.standard_normal(picks.shape).astype(np.float32))
+
+def recall_at_k(exact: list, approx: list) -> float:
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact, approx))
+    return hits / max(1, sum(len(e) for e in exact))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of the database")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    queries = list(make_queries(vectors, args.queries, args.noise))
+    print(f"Corpus: {len(vectors)} x {vectors.shape[1]}, {len(queries)} queries, k={args.k}\n")
+
+    baseline = QuantizedMatrix.build(vectors, "float32")
+    exact = [baseline.search(q, args.k)[0] for q in queries]
+
+    configs = [("float32", False, 10), ("float16", False, 10), ("int8", False, 10)]
+    configs += [(dtype, True, factor) for dtype in ("float32", "int8") for factor in (4, 10, 40)]
+
+    print(f"{'storage':<26}{'bytes/vec':>10}{'RAM/vec':>10}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for dtype, binary, factor in configs:
+        matrix = QuantizedMatrix.build(vectors, dtype, binary, rescore_factor=factor)
+        approx = [matrix.search(q, args.k)[0] for q in queries]
+        summary = latency_summary(time_calls(lambda q: matrix.search(q, args.k), queries))
+        label = f"{dtype} + binary x{factor}" if binary else dtype
+        print(f"{label:<26}{matrix.nbytes / len(matrix):>10.1f}{matrix.search_nbytes / len(matrix):>10.1f}"
+              f"{recall_at_k(exact, approx):>10.3f}{summary['p50_ms']:>10.3f}{summary['p99_ms']:>10.3f}")
+    print("\nbytes/vec is the stored (and memory-mapped) size, RAM/vec what searches hold. float16 is")
+    print("upcast to a float32 copy on the first search, as converting half floats on every query is")
+    print("slow: it halves the stored size and keeps float32 latency, but searches hold at least as")
+    print("much memory as float32. int8 keeps its 1-byte rows in memory at the cost of a little recall.")
+
+if __name__ == "__main__":
+    main()
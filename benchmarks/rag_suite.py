@@ -0,0 +1,206 @@
+"""Offline retrieval-quality and latency benchmark for the RAG pipeline.
+
+Ingests the checked-in page snapshot (benchmarks/fixtures/pages) into a
+scratch LanceDB through the normal scraper and storage path, then runs the
+labeled question set (benchmarks/fixtures/questions.json) against
+`search_similar`. Relevant sections are identified as "<url>#<section title>".
+
+Reports recall@k, MRR, p50/p95/p99 search latency, chunker and ingest
+throughput and peak memory. Results are written to JSON; pass an earlier
+results file as --baseline to print the deltas.
+
+No network access is needed once the embedding model is in the local
+Hugging Face cache (set HF_HUB_OFFLINE=1 to enforce it).
+
+Usage: python -m benchmarks.rag_suite [--k 5] [--repeat 5] [--out results.json] [--baseline old.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from typing import List, Dict, Optional
+from bs4 import BeautifulSoup
+from utils.scraper import extract_main_content, html_to_xml, extract_sections_from_xml
+from benchmarks.common import latency_summary
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_pages() -> List[Dict]:
+    """The saved pages of the snapshot, as {url, html} dicts"""
+    with open(os.path.join(FIXTURES_DIR, "pages.json")) as f:
+        index = json.load(f)
+    pages = []
+    for entry in index:
+        with open(os.path.join(FIXTURES_DIR, "pages", entry["file"]), "rb") as f:
+            pages.append({"url": entry["url"], "html": f.read()})
+    return pages
+
+
+def load_questions() -> List[Dict]:
+    with open(os.path.join(FIXTURES_DIR, "questions.json")) as f:
+        return json.load(f)
+
+
+def section_id(result: Dict) -> str:
+    return f"{result.get('url', '')}#{result.get('section_title', '')}"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None where unsupported)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_chunker(pages: List[Dict]) -> Dict:
+    """Time html -> xml -> sections without touching the database"""
+    sections = 0
+    start = time.perf_counter()
+    for page in pages:
+        soup = BeautifulSoup(page["html"], "html.parser")
+        xml_content = html_to_xml(extract_main_content(soup), page["url"])
+        sections += len(extract_sections_from_xml(xml_content))
+    seconds = time.perf_counter() - start
+    return {"pages": len(pages), "sections": sections, "seconds": seconds,
+            "pages_per_s": len(pages) / seconds if seconds else 0.0}
+
+
+def bench_ingest(db, pages: List[Dict]) -> Dict:
+    """Time the full store path (parse, embed, write) into the scratch database"""
+    from utils.batch import store_page
+    chunks = 0
+    start = time.perf_counter()
+    for page in pages:
+        result = store_page(db, page["url"], BeautifulSoup(page["html"], "html.parser"))
+        chunks += result.get("sections", 0)
+    seconds = time.perf_counter() - start
+    return {"pages": len(pages), "chunks": chunks, "seconds": seconds,
+            "pages_per_s": len(pages) / seconds if seconds else 0.0,
+            "chunks_per_s": chunks / seconds if seconds else 0.0,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_retrieval(db, questions: List[Dict], k: int, repeat: int) -> Dict:
+    """Recall@k and MRR over the labeled questions, plus search latency"""
+    per_question = []
+    latencies = []
+    for q in questions:
+        results = db.search_similar(q["question"], limit=k)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            db.search_similar(q["question"], limit=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        retrieved = [section_id(r) for r in results]
+        relevant = set(q["relevant"])
+        hits = relevant & set(retrieved)
+        rank = next((i + 1 for i, sid in enumerate(retrieved) if sid in relevant), None)
+        per_question.append({
+            "id": q["id"],
+            "recall": len(hits) / len(relevant) if relevant else 0.0,
+            "reciprocal_rank": 1.0 / rank if rank else 0.0,
+            "retrieved": retrieved,
+        })
+
+    n = max(1, len(per_question))
+    return {
+        "k": k,
+        "questions": len(per_question),
+        "recall_at_k": sum(q["recall"] for q in per_question) / n,
+        "mrr": sum(q["reciprocal_rank"] for q in per_question) / n,
+        "latency": latency_summary(latencies),
+        "per_question": per_question,
+    }
+
+
+def print_report(report: Dict, baseline: Optional[Dict] = None):
+    metrics = [
+        ("recall@k", ("retrieval", "recall_at_k")),
+        ("MRR", ("retrieval", "mrr")),
+        ("search p50 ms", ("retrieval", "latency", "p50_ms")),
+        ("search p95 ms", ("retrieval", "latency", "p95_ms")),
+        ("search p99 ms", ("retrieval", "latency", "p99_ms")),
+        ("chunker pages/s", ("chunker", "pages_per_s")),
+        ("ingest pages/s", ("ingest", "pages_per_s")),
+        ("ingest chunks/s", ("ingest", "chunks_per_s")),
+        ("peak RSS MB", ("ingest", "peak_rss_mb")),
+    ]
+
+    def lookup(data, path):
+        for key in path:
+            data = data.get(key) if isinstance(data, dict) else None
+        return data
+
+    print(f"{'metric':<20}{'value':>12}{'baseline':>12}{'delta':>12}")
+    for label, path in metrics:
+        value = lookup(report, path)
+        base = lookup(baseline, path) if baseline else None
+        value_s = f"{value:.4f}" if isinstance(value, float) else str(value)
+        if isinstance(value, (int, float)) and isinstance(base, (int, float)):
+            print(f"{label:<20}{value_s:>12}{base:>12.4f}{value - base:>+12.4f}")
+        else:
+            print(f"{label:<20}{value_s:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions per question")
+    parser.add_argument("--index-mode", default="lancedb", choices=["lancedb", "numpy"])
+    parser.add_argument("--out", default=None, help="Results JSON path (default: benchmarks/results/rag_suite-<time>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    pages = load_pages()
+    questions = load_questions()
+
+    # Importing the database module loads the embedding model; keep that out of the timings
+    from utils.database import FastHTMLDatabase
+
+    scratch_dir = tempfile.mkdtemp(prefix="fastrag-bench-")
+    try:
+        db = FastHTMLDatabase(scratch_dir, index_mode=args.index_mode)
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "config": {"k": args.k, "repeat": args.repeat, "index_mode": args.index_mode,
+                       "pages": len(pages), "questions": len(questions)},
+            "chunker": bench_chunker(pages),
+            "ingest": bench_ingest(db, pages),
+        }
+        report["retrieval"] = bench_retrieval(db, questions, args.k, args.repeat)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    out = args.out or os.path.join("benchmarks", "results", f"rag_suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
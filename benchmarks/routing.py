@@ -0,0 +1,74 @@
+"""Offline check of the model routing policy on the labeled questions.
+
+Builds a scratch database from the page snapshot (as rag_suite does), routes
+every question in fixtures/questions.json and, unless --dry-run, answers it
+through ClaudeService against the local Claude stand-in. Reports how many
+questions each route took and its latency, token use and estimated cost.
+
+    python -m benchmarks.fake_anthropic &
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake python -m benchmarks.routing
+
+Usage: python -m benchmarks.routing [--policy policy.json] [--dry-run] [--k 5] [--out report.json]
+"""
+import json
+import shutil
+import argparse
+import tempfile
+from benchmarks.rag_suite import load_pages, load_questions, bench_ingest
+
+
+def _fmt(value, spec: str) -> str:
+    return format(value, spec) if isinstance(value, (int, float)) else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--policy", default=None,
+                        help="Routing policy JSON (default: FASTRAG_ROUTING_POLICY or the built-in policy)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dry-run", action="store_true", help="Only show routing decisions, no API calls")
+    parser.add_argument("--out", default=None, help="Write decisions and per-route stats as JSON")
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase
+    from utils.claude_service import ClaudeService, summarize_answer_stats
+    from utils.routing import ModelRouter
+
+    claude = ClaudeService()
+    claude.router = ModelRouter(args.policy)
+    if not args.dry_run and not claude.is_available():
+        parser.error("ANTHROPIC_API_KEY is not set (use --dry-run, or point ANTHROPIC_BASE_URL at the stand-in)")
+
+    scratch_dir = tempfile.mkdtemp(prefix="fastrag-routing-")
+    decisions = []
+    try:
+        db = FastHTMLDatabase(scratch_dir)
+        bench_ingest(db, load_pages())
+        for q in load_questions():
+            results = db.search_similar(q["question"], limit=args.k)
+            decision = claude.router.route(q["question"], results)
+            decisions.append({"id": q["id"], "question": q["question"], **decision})
+            similarity = _fmt(decision["features"]["top_similarity"], ".2f")
+            print(f"{decision['route']:<10}{decision['max_tokens']:>6}  sim={similarity}  {q['question']}")
+            if not args.dry_run:
+                claude.generate_answer(q["question"], results)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    routes = summarize_answer_stats("route") if not args.dry_run else {}
+    counts = {}
+    for d in decisions:
+        counts[d["route"]] = counts.get(d["route"], 0) + 1
+    print(f"\n{'route':<10}{'questions':>10}{'p50 ms':>10}{'avg in':>10}{'avg out':>10}{'cost $':>10}")
+    for route, n in sorted(counts.items()):
+        s = routes.get(route, {})
+        print(f"{route:<10}{n:>10}{_fmt(s.get('p50_duration_ms'), '.0f'):>10}{_fmt(s.get('avg_input_tokens'), '.0f'):>10}"
+              f"{_fmt(s.get('avg_output_tokens'), '.0f'):>10}{_fmt(s.get('total_cost_usd'), '.4f'):>10}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"policy": claude.router.policy, "decisions": decisions, "routes": routes}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Search latency as the number of corpora (shards) a query fans out to grows.
+
+Writes --max-shards corpora of --chunks-per-shard synthetic chunks each into a
+scratch database, plus one corpus holding all of them in a single table. Chunk
+vectors are drawn around random topic centers; queries are noisy copies of
+stored chunks. Each query then searches 1, 2, 4, ... of the shards in parallel
+(and sequentially, with one fan-out thread), and the whole corpus through the
+single table.
+
+Reports p50/p95 latency per mode, and for the full fan-out the share of
+queries whose merged top k matches the single table's exactly. Query
+embedding is excluded since it is the same for every mode.
+
+Usage: python -m benchmarks.shards [--max-shards 16] [--chunks-per-shard 10000] [--queries 100]
+                                   [--index-mode lancedb numpy] [--workers 8] [--k 5] [--out results.json]
+"""
+import json
+import shutil
+import argparse
+import tempfile
+from typing import Dict, List
+import numpy as np
+import pyarrow as pa
+from benchmarks.common import latency_summary, time_calls
+
+
+def synthetic_chunks(n: int, dim: int, prefix: str, rng, topics: np.ndarray) -> List[Dict]:
+    vectors = topics[rng.integers(len(topics), size=n)] + 0.5 * rng.standard_normal((n, dim)) / np.sqrt(dim)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [{"id": f"{prefix}_chunk_{i}", "doc_id": f"{prefix}_doc_{i // 20}", "url": f"synthetic://{prefix}/{i // 20}",
+             "section_title": f"Section {i % 20}", "section_level": 2, "content": "synthetic",
+             "vector": vector.astype(np.float32).tolist()} for i, vector in enumerate(vectors)]
+
+
+def build_corpora(scratch_dir: str, shards: int, chunks_per_shard: int, seed: int = 0) -> np.ndarray:
+    """Write shard_0..shard_{n-1} and "all"; returns the stored vectors to draw queries from"""
+    from utils.database import FastHTMLDatabase
+    rng = np.random.default_rng(seed)
+    combined = FastHTMLDatabase(scratch_dir, index_mode="lancedb", corpus="all")
+    dim = combined.chunks_table.schema.field("vector").type.list_size
+    topics = rng.standard_normal((64, dim)) / np.sqrt(dim)
+    samples = []
+    for s in range(shards):
+        shard = FastHTMLDatabase(scratch_dir, index_mode="lancedb", corpus=f"shard_{s}")
+        rows = synthetic_chunks(chunks_per_shard, dim, f"shard_{s}", rng, topics)
+        for start in range(0, len(rows), 5000):
+            batch = pa.Table.from_pylist(rows[start:start + 5000], schema=shard.chunks_table.schema)
+            shard.chunks_table.add(batch)
+            combined.chunks_table.add(batch)
+        samples.extend(rows[i]["vector"] for i in rng.integers(len(rows), size=20))
+    return np.asarray(samples, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-shards", type=int, default=16)
+    parser.add_argument("--chunks-per-shard", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--index-mode", nargs="+", default=["lancedb", "numpy"], choices=["lancedb", "numpy"])
+    parser.add_argument("--workers", type=int, default=8, help="Fan-out threads for the parallel runs")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase
+
+    scratch_dir = tempfile.mkdtemp(prefix="fastrag-shards-")
+    results = {}
+    try:
+        stored = build_corpora(scratch_dir, args.max_shards, args.chunks_per_shard)
+        print(f"Corpus: {args.max_shards} shards x {args.chunks_per_shard} chunks "
+              f"(+ a single {args.max_shards * args.chunks_per_shard}-chunk table)")
+        rng = np.random.default_rng(1)
+        queries = stored[rng.integers(len(stored), size=args.queries)]
+        queries = queries + 0.5 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+        queries = list(queries / np.linalg.norm(queries, axis=1, keepdims=True))
+        counts = [n for n in (1, 2, 4, 8, 16, 32, 64) if n < args.max_shards] + [args.max_shards]
+        every_shard = [f"shard_{s}" for s in range(args.max_shards)]
+
+        for backend in args.index_mode:
+            combined = FastHTMLDatabase(scratch_dir, index_mode=backend, corpus="all")
+            results[f"{backend} single table"] = {"shards": 1, "latency": latency_summary(
+                time_calls(lambda q: combined.search_vector(q, args.k), queries, args.repeat))}
+            for workers in (args.workers, 1):
+                db = FastHTMLDatabase(scratch_dir, index_mode=backend, corpus="shard_0")
+                db.shard_workers = workers
+                for n in counts:
+                    corpora = every_shard[:n]
+                    label = f"{backend} {n} shards, {'parallel' if workers > 1 else 'sequential'}"
+                    results[label] = {"shards": n, "workers": workers, "latency": latency_summary(
+                        time_calls(lambda q: db.search_vector(q, args.k, corpora=corpora), queries, args.repeat))}
+                if workers > 1:
+                    same = [[hit["id"] for hit in db.search_vector(q, args.k, corpora=every_shard)] ==
+                            [hit["id"] for hit in combined.search_vector(q, args.k)] for q in queries]
+                    results[label]["matches_single_table"] = float(np.mean(same))
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(f"\n{'mode':<36}{'p50 ms':>10}{'p95 ms':>10}{'same top k':>12}")
+    for label, r in results.items():
+        same = r.get("matches_single_table")
+        print(f"{label:<36}{r['latency']['p50_ms']:>10.2f}{r['latency']['p95_ms']:>10.2f}"
+              f"{'' if same is None else f'{same:.0%}':>12}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Size and lookup latency of the API symbol index.
+
+Extracts the sections (with their symbols) of the snapshot's pages and copies
+them until there are --chunks of them, renaming each copy's symbols so that
+posting lists stay as long as in the real docs while the vocabulary grows.
+Builds a `SymbolIndex` over the copies, then times finding and looking up the
+symbols of --queries questions like "what does `hx_swap_oob` do" naming 1 to 3
+indexed symbols. A filtered lookup (sections of one level) is timed as well.
+Extraction time per page is reported separately, since it runs at ingest time.
+
+Usage: python -m benchmarks.symbols [--chunks 100000] [--queries 1000] [--out results.json]
+"""
+import json
+import time
+import argparse
+import numpy as np
+from bs4 import BeautifulSoup
+from benchmarks.common import latency_summary, time_calls
+from benchmarks.rag_suite import load_pages
+from utils.scraper import extract_main_content, html_to_xml, extract_sections_from_xml
+from utils.symbols import SymbolIndex, query_symbols
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    sections, extract_ms = [], []
+    for page in load_pages():
+        start = time.perf_counter()
+        xml = html_to_xml(extract_main_content(BeautifulSoup(page["html"], "html.parser")), page["url"])
+        sections.extend(extract_sections_from_xml(xml))
+        extract_ms.append((time.perf_counter() - start) * 1000)
+
+    copies = [sections[i % len(sections)] for i in range(args.chunks)]
+    renamed = [[f"{name}_{i // len(sections)}" if i >= len(sections) else name for name in s["symbols"]]
+               for i, s in enumerate(copies)]
+    start = time.perf_counter()
+    index = SymbolIndex([f"doc_{i // 20}_chunk_{i % 20}" for i in range(len(copies))],
+                        [f"doc_{i // 20}" for i in range(len(copies))],
+                        [s["level"] for s in copies], renamed)
+    build_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    symbols = sorted(index.postings)
+    picks = [rng.integers(len(symbols), size=rng.integers(1, 4)) for _ in range(args.queries)]
+    queries = [f"what does {' and '.join(f'`{symbols[i]}`' for i in pick)} do" for pick in picks]
+    results = {
+        "symbols": len(index), "postings_bytes": index.nbytes, "build_seconds": build_seconds,
+        "extract_per_page": latency_summary(extract_ms),
+        "lookup": latency_summary(time_calls(lambda q: index.lookup(query_symbols(q)), queries, args.repeat)),
+        "lookup_level_2": latency_summary(time_calls(lambda q: index.lookup(query_symbols(q), section_level=2),
+                                                     queries, args.repeat)),
+    }
+
+    print(f"Index: {results['symbols']} symbols over {len(copies)} chunks, "
+          f"{results['postings_bytes'] / 1e6:.1f} MB of postings, built in {build_seconds:.2f}s")
+    print(f"Extraction (html_to_xml + sections): p50 {results['extract_per_page']['p50_ms']:.1f} ms per page")
+    print(f"\n{'mode':<24}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}")
+    for label in ("lookup", "lookup_level_2"):
+        r = results[label]
+        print(f"{label:<24}{r['p50_ms'] * 1000:>10.1f}{r['p95_ms'] * 1000:>10.1f}{r['p99_ms'] * 1000:>10.1f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
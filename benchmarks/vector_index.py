@@ -0,0 +1,49 @@
+"""Compare search latency of `chunks_table.search` against the in-memory NumPy index.
+
+Usage: python -m benchmarks.vector_index [--db ./lancedb] [--limit 5] [--repeat 20]
+"""
+import argparse
+from utils.database import FastHTMLDatabase
+from utils.vector_index import NumpyVectorIndex
+from utils.quantization import STORAGE_DTYPES
+from benchmarks.common import latency_summary, time_calls, print_summary_table
+
+QUERIES = [
+    "How do I implement WebSocket real-time communication in FastHTML?",
+    "How do I define a route that accepts POST data?",
+    "What does hx_swap_oob do?",
+    "How can I handle file uploads?",
+    "How do I add OAuth login?",
+    "How do I run background tasks?",
+    "What response types can a handler return?",
+    "How does live reload work?",
+    "How do I define a custom xt component?",
+    "How do I use FastHTML in a Jupyter notebook?",
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    db = FastHTMLDatabase(args.db, index_mode="lancedb")
+    print(f"Corpus: {db.get_chunk_count()} chunks")
+    embeddings = list(db.model.encode(QUERIES))
+
+    rows = {
+        "lancedb chunks_table.search": latency_summary(time_calls(
+            lambda q: db.chunks_table.search(q).limit(args.limit).to_list(), embeddings, args.repeat)),
+    }
+    for dtype in STORAGE_DTYPES:
+        for binary in (False, True):
+            index = NumpyVectorIndex(db.chunks_table, cache_dir=f"{args.db}/_numpy_index", dtype=dtype, binary=binary)
+            index.load()
+            label = f"numpy index ({dtype}{' + binary' if binary else ''})"
+            rows[label] = latency_summary(time_calls(lambda q: index.search(q, args.limit), embeddings, args.repeat))
+
+    print_summary_table(rows)
+
+if __name__ == "__main__":
+    main()
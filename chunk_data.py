@@ -1,13 +1,28 @@
 from fasthtml.common import *
 from fasthtml.components import Zero_md
 from utils.database import FastHTMLDatabase
-from utils.claude_service import ClaudeService
-from utils.batch import fasthtml_doc_urls, process_single_url
+from utils.claude_service import ClaudeService, GenerationTimeout, summarize_answer_stats
+from utils.admission import AdmissionRejected
+from utils.batch import DOC_CATEGORIES
+from utils.metrics import MetricsMiddleware, render_prometheus
+from utils.sse import until_disconnected
+from utils.coalesce import SingleFlight, StreamCoalescer, normalize_query, answer_key
+from utils.profiling import profiled, is_enabled, list_profiles, profile_path, profile_summary
+from utils.answer_cache import AnswerCache, SAMPLE_QUESTIONS, replay_answer
+from utils.jobs import JobStore, jobs_path, follow_job, start_worker
+from utils.crawler import crawl_settings
 import time
 import asyncio
 import os
+from contextlib import aclosing
 import json
-from starlette.responses import StreamingResponse
+import hmac
+import uuid
+import threading
+from collections import OrderedDict
+from starlette.responses import StreamingResponse, PlainTextResponse, FileResponse, JSONResponse
+from starlette.websockets import WebSocketDisconnect
+from websockets.exceptions import ConnectionClosed
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -79,25 +94,128 @@ hdrs = (
                 setTimeout(() => updateXmlContent(content), 100);
             }
         }
+
+        // Answer streams of the current search; a new search closes them so the server stops generating
+        let answerStreams = [];
+        function closeAnswerStreams() {
+            answerStreams.forEach(stream => stream.close());
+            answerStreams = [];
+        }
+
+        // One-line summary of a streamed answer's token usage and timing
+        function formatAnswerStats(stats) {
+            const parts = [`${stats.input_tokens} in / ${stats.output_tokens} out tokens`];
+            if (stats.cached) parts.unshift('precomputed answer');
+            if (stats.cache_read_input_tokens) parts.push(`${stats.cache_read_input_tokens} cached`);
+            if (stats.ttft_ms !== null) parts.push(`first token ${(stats.ttft_ms / 1000).toFixed(2)}s`);
+            parts.push(`total ${(stats.duration_ms / 1000).toFixed(2)}s`);
+            if (stats.stop_reason) parts.push(stats.stop_reason);
+            if (stats.model) parts.push(`${stats.model} (${stats.route})`);
+            if (stats.cost_usd !== null) parts.push(`~$${stats.cost_usd.toFixed(4)}`);
+            return `<p class="text-xs text-gray-500 mt-2">📈 ${parts.join(' · ')}</p>`;
+        }
         """)
 )
 
 app = FastHTML(hdrs=hdrs, pico=False, exts='ws')
+# Per-route latency histograms; Server-Timing headers too when FASTRAG_DEBUG=1
+app.add_middleware(MetricsMiddleware)
 
 # --- FIX: Create a single, global instance of the database ---
 # This ensures the DB connection and ML model are loaded only ONCE.
-db = FastHTMLDatabase()
+# Searches read the last published table versions while ingestion writes new ones.
+db = FastHTMLDatabase(pinned=True)
 
 # Initialize Claude service
 claude = ClaudeService()
 
-# Global variable for progress tracking
-batch_running = False
+# Identical questions asked at the same time share one search and one Claude stream
+search_flight = SingleFlight("search")
+answer_streams = StreamCoalescer("answer")
+
+# Precomputed results and answers for the sample (hot) questions, per corpus version
+answer_cache = AnswerCache(db, claude)
+answer_cache.watch()
+
+def search_filters(url_prefix: str = "", category: str = "", section_level: str = "", corpus: list = None) -> dict:
+    """Optional search filters from form fields (blank fields, and the default corpora, are left out)"""
+    filters = {}
+    corpora = sorted(set(corpus or []))
+    if corpora and corpora != sorted(db.search_corpora):
+        unknown = set(corpora) - set(db.corpora())
+        if unknown:
+            raise ValueError(f"Unknown corpus '{sorted(unknown)[0]}'")
+        filters["corpora"] = corpora
+    if url_prefix.strip():
+        filters["url_prefix"] = url_prefix.strip()
+    if category:
+        if category not in DOC_CATEGORIES:
+            raise ValueError(f"Unknown docs category '{category}'")
+        filters["category"] = category
+    if section_level:
+        filters["section_level"] = int(section_level)
+    return filters
+
+def search_chunks(query: str, filters: dict) -> list:
+    """Top 5 chunks for a question: precomputed for hot questions, shared between identical concurrent searches"""
+    results = None if filters else answer_cache.search(query)
+    if results is None:
+        key = f"5:{json.dumps(filters, sort_keys=True)}:{normalize_query(query)}"
+        results = search_flight.do(key, lambda: db.search_similar(query, limit=5, **filters))
+    return results
+
+# Ingestion runs as jobs in a separate worker process; every websocket
+# watching a job shares one tail of its progress events
+job_store = JobStore(jobs_path(db.db_path))
+job_feeds = StreamCoalescer("job")
+worker_process = None
+
+def ensure_worker():
+    """Start the ingestion worker unless the one we started is still running"""
+    global worker_process
+    if worker_process is None or worker_process.poll() is not None:
+        worker_process = start_worker(db.db_path)
+
+# Operator endpoints (metrics, profiles, job cancellation) need this bearer token when
+# it is set; without one they only answer requests from this machine
+ADMIN_TOKEN = os.getenv("FASTRAG_ADMIN_TOKEN", "")
+
+def operator_denied(req):
+    """A 403 response unless the request may use the operator endpoints, else None"""
+    if ADMIN_TOKEN:
+        allowed = hmac.compare_digest(req.headers.get("authorization", ""), f"Bearer {ADMIN_TOKEN}")
+    else:
+        allowed = req.client is not None and req.client.host in ("127.0.0.1", "::1")
+    return None if allowed else PlainTextResponse("Forbidden", status_code=403)
 
 # Global variables for search results (simple session storage)
 last_search_results = []
 last_query = ""
 
+# Searches by id, so each answer stream reads the results of the search that started it
+# rather than whichever search ran last; the newest FASTRAG_RECENT_SEARCHES are kept
+RECENT_SEARCHES = int(os.getenv("FASTRAG_RECENT_SEARCHES", "256"))
+recent_searches = OrderedDict()
+recent_searches_lock = threading.Lock()
+
+def remember_search(query, results):
+    """Keep a search for the answer streams; returns its id"""
+    global last_search_results, last_query
+    last_search_results, last_query = results, query
+    search_id = uuid.uuid4().hex
+    with recent_searches_lock:
+        recent_searches[search_id] = (query, results)
+        while len(recent_searches) > RECENT_SEARCHES:
+            recent_searches.popitem(last=False)
+    return search_id
+
+def recall_search(search_id=""):
+    """(query, results) of a search by id, or of the last search when no id is given"""
+    if not search_id:
+        return last_query, last_search_results
+    with recent_searches_lock:
+        return recent_searches.get(search_id, ("", []))
+
 # Markdown rendering function using zero-md
 def render_markdown(content, css=''):
     """Render markdown content using zero-md component"""
@@ -334,11 +452,15 @@ def MainLayout(content, current_route="/", **kwargs):
         **kwargs
     )
 
+# Button colours for the sample questions on the home page
+SAMPLE_COLORS = ["blue", "green", "purple", "amber", "rose", "indigo"]
+
 @app.get('/')
 def home():
     """Main RAG interface"""
     doc_count = db.get_document_count()
     chunk_count = db.get_chunk_count()
+    corpora = db.corpora()
     
     content = Div(
         # Header Section
@@ -410,63 +532,56 @@ def home():
                     Div(
                         P("💡 Try these sample questions:", cls="text-sm font-medium text-gray-700 mb-3"),
                         Div(
-                            Button(
-                                "How do I implement WebSocket real-time communication in FastHTML?",
-                                type="button",
-                                hx_post="/set-query",
-                                hx_vals='{"query": "How do I implement WebSocket real-time communication in FastHTML?"}',
-                                hx_target="#query-input",
-                                hx_swap="outerHTML",
-                                cls="text-left px-4 py-2 bg-blue-50 hover:bg-blue-100 text-blue-700 rounded-lg border border-blue-200 transition-colors duration-200 text-sm"
-                            ),
-                            Button(
-                                "What's the best way to integrate Alpine.js for client-side reactivity?",
+                            *[Button(
+                                question,
                                 type="button",
                                 hx_post="/set-query",
-                                hx_vals='{"query": "What\'s the best way to integrate Alpine.js for client-side reactivity?"}',
+                                hx_vals=json.dumps({"query": question}),
                                 hx_target="#query-input",
                                 hx_swap="outerHTML",
-                                cls="text-left px-4 py-2 bg-green-50 hover:bg-green-100 text-green-700 rounded-lg border border-green-200 transition-colors duration-200 text-sm"
+                                cls=f"text-left px-4 py-2 bg-{color}-50 hover:bg-{color}-100 text-{color}-700 rounded-lg border border-{color}-200 transition-colors duration-200 text-sm"
+                            ) for question, color in zip(SAMPLE_QUESTIONS, SAMPLE_COLORS)],
+                            cls="grid grid-cols-1 md:grid-cols-2 gap-2 mb-6"
+                        ),
+                        cls="mb-4"
+                    ),
+                    
+                    # Optional filters to restrict which docs the answer draws on
+                    Details(
+                        Summary("🔎 Limit sources", cls="text-sm font-medium text-gray-700 cursor-pointer mb-3"),
+                        Div(
+                            Select(
+                                Option("All docs", value=""),
+                                *[Option(category.title(), value=category) for category in DOC_CATEGORIES],
+                                name="category",
+                                cls="p-2 border-2 border-gray-200 rounded-lg text-sm text-gray-700 focus:border-blue-500 focus:outline-none"
                             ),
-                            Button(
-                                "How can I handle file uploads and image processing with FastHTML?",
-                                type="button",
-                                hx_post="/set-query",
-                                hx_vals='{"query": "How can I handle file uploads and image processing with FastHTML?"}',
-                                hx_target="#query-input",
-                                hx_swap="outerHTML",
-                                cls="text-left px-4 py-2 bg-purple-50 hover:bg-purple-100 text-purple-700 rounded-lg border border-purple-200 transition-colors duration-200 text-sm"
+                            Input(
+                                type="text",
+                                name="url_prefix",
+                                placeholder="URL prefix, e.g. https://www.fastht.ml/docs/api/",
+                                cls="p-2 border-2 border-gray-200 rounded-lg text-sm text-gray-700 focus:border-blue-500 focus:outline-none"
                             ),
-                            Button(
-                                "How do I implement JWT authentication and session management?",
-                                type="button",
-                                hx_post="/set-query",
-                                hx_vals='{"query": "How do I implement JWT authentication and session management?"}',
-                                hx_target="#query-input",
-                                hx_swap="outerHTML",
-                                cls="text-left px-4 py-2 bg-amber-50 hover:bg-amber-100 text-amber-700 rounded-lg border border-amber-200 transition-colors duration-200 text-sm"
+                            Select(
+                                Option("Any heading level", value=""),
+                                *[Option(f"Level {level} sections", value=str(level)) for level in range(1, 5)],
+                                name="section_level",
+                                cls="p-2 border-2 border-gray-200 rounded-lg text-sm text-gray-700 focus:border-blue-500 focus:outline-none"
                             ),
-                            Button(
-                                "What's the recommended approach for database integration and ORM usage?",
-                                type="button",
-                                hx_post="/set-query",
-                                hx_vals='{"query": "What\'s the recommended approach for database integration and ORM usage?"}',
-                                hx_target="#query-input",
-                                hx_swap="outerHTML",
-                                cls="text-left px-4 py-2 bg-rose-50 hover:bg-rose-100 text-rose-700 rounded-lg border border-rose-200 transition-colors duration-200 text-sm"
-                            ),
-                            Button(
-                                "How can I build a responsive SPA with FastHTML and modern CSS frameworks?",
-                                type="button",
-                                hx_post="/set-query",
-                                hx_vals='{"query": "How can I build a responsive SPA with FastHTML and modern CSS frameworks?"}',
-                                hx_target="#query-input",
-                                hx_swap="outerHTML",
-                                cls="text-left px-4 py-2 bg-indigo-50 hover:bg-indigo-100 text-indigo-700 rounded-lg border border-indigo-200 transition-colors duration-200 text-sm"
-                            ),
-                            cls="grid grid-cols-1 md:grid-cols-2 gap-2 mb-6"
+                            cls="grid grid-cols-1 md:grid-cols-3 gap-2"
                         ),
-                        cls="mb-4"
+                        # Searched in parallel and merged; only shown once there is more than one corpus
+                        Div(
+                            Span("Corpora:", cls="text-sm text-gray-600 mr-2"),
+                            *[Label(
+                                Input(type="checkbox", name="corpus", value=name, checked=name in db.search_corpora,
+                                      cls="mr-1 w-4 h-4"),
+                                Span(name, cls="text-sm text-gray-700"),
+                                cls="inline-flex items-center mr-4 cursor-pointer"
+                            ) for name in corpora],
+                            cls="flex flex-wrap items-center mt-3"
+                        ) if len(corpora) > 1 else "",
+                        cls="mb-6"
                     ),
                     Div(
                         Div(
@@ -535,6 +650,7 @@ def source_data():
     # Use the global `db` instance for a much faster initial load
     doc_count = db.get_document_count()
     chunk_count = db.get_chunk_count()
+    seed_urls = crawl_settings()["seeds"]
     
     content = Div(
         # Header Section
@@ -583,7 +699,7 @@ def source_data():
                 Div(
                     Div(
                         H2("Process Documentation URLs", cls="text-2xl font-bold text-gray-900 mb-2"),
-                        P(f"Process {len(fasthtml_doc_urls)} FastHTML documentation URLs to build the knowledge base", 
+                        P(f"Crawl the FastHTML documentation from {len(seed_urls)} seed URLs to build the knowledge base", 
                           cls="text-gray-600 mb-4"),
                         Button(
                             Span("👁️ View URLs", cls="mr-2"),
@@ -598,14 +714,14 @@ def source_data():
                     
                     Div(
                         Div(
-                            H3(f"URLs to Process ({len(fasthtml_doc_urls)})", cls="text-lg font-semibold text-gray-800 mb-4"),
+                            H3(f"Seed URLs ({len(seed_urls)})", cls="text-lg font-semibold text-gray-800 mb-4"),
                             Div(
                                 *[Div(
                                     Span(f"{i+1}.", cls="text-gray-500 font-mono text-sm mr-3"),
                                     Span(url.split('/')[-1] or url.split('/')[-2], cls="font-medium text-gray-800"),
                                     Div(url, cls="text-xs text-gray-500 mt-1"),
                                     cls="p-3 border-b border-gray-100 last:border-b-0 hover:bg-gray-50 transition-colors duration-150"
-                                ) for i, url in enumerate(fasthtml_doc_urls)],
+                                ) for i, url in enumerate(seed_urls)],
                                 cls="bg-white rounded-lg border border-gray-200 max-h-60 overflow-y-auto"
                             ),
                             cls="mb-6"
@@ -639,7 +755,8 @@ def source_data():
     return MainLayout(content, current_route="/source-data")
 
 @app.post('/search-only')
-def search_only(query: str):
+def search_only(query: str, profile: bool = False, url_prefix: str = "", category: str = "",
+                section_level: str = "", corpus: list[str] = None):
     """Search for similar chunks and return only search results"""
     if not query.strip():
         return Div(
@@ -654,7 +771,8 @@ def search_only(query: str):
     
     try:
         # Perform similarity search
-        results = db.search_similar(query, limit=5)
+        with profiled(query, "query", enabled=is_enabled("query", profile)):
+            results = search_chunks(query, search_filters(url_prefix, category, section_level, corpus))
         
         if not results:
             return Div(
@@ -667,10 +785,8 @@ def search_only(query: str):
                 cls="bg-white rounded-xl shadow-sm border border-gray-200 p-8"
             )
         
-        # Store results globally for streaming endpoints
-        global last_search_results, last_query
-        last_search_results = results
-        last_query = query
+        # Store results for the answer endpoints
+        remember_search(query, results)
         
         # Return only search results
         return Div(
@@ -697,7 +813,8 @@ def search_only(query: str):
         )
 
 @app.post('/search-and-generate')
-def search_and_generate(query: str, compare: bool = False):
+def search_and_generate(query: str, compare: bool = False, profile: bool = False, url_prefix: str = "",
+                        category: str = "", section_level: str = "", corpus: list[str] = None):
     """Combined search and answer generation with proper HTMX SSE streaming"""
     if not query.strip():
         return Div(
@@ -712,7 +829,8 @@ def search_and_generate(query: str, compare: bool = False):
     
     try:
         # Perform similarity search
-        results = db.search_similar(query, limit=5)
+        with profiled(query, "query", enabled=is_enabled("query", profile)):
+            results = search_chunks(query, search_filters(url_prefix, category, section_level, corpus))
         
         if not results:
             return Div(
@@ -725,10 +843,8 @@ def search_and_generate(query: str, compare: bool = False):
                 cls="bg-white rounded-xl shadow-sm border border-gray-200 p-8"
             )
         
-        # Store results globally for streaming endpoints
-        global last_search_results, last_query
-        last_search_results = results
-        last_query = query
+        # Store results for the streaming endpoints, which get the id in their URL
+        search_id = remember_search(query, results)
         
         # Build the response layout with HTMX SSE streaming
         if not claude.is_available():
@@ -774,7 +890,7 @@ def search_and_generate(query: str, compare: bool = False):
                         Div(
                             H4("🎯 With RAG Context", cls="text-lg font-bold text-green-700 text-center mb-4"),
                             Div(
-                                Div(id="rag-answer", cls="p-6 bg-white min-h-[300px]"),
+                                Div(id="rag-answer", data_search_id=search_id, cls="p-6 bg-white min-h-[300px]"),
                                 cls="prose prose-sm max-w-none bg-gradient-to-br from-green-50 to-green-100 p-6 rounded-xl border border-green-200 min-h-[300px] overflow-y-auto"
                             ),
                             cls="w-1/2 pr-3"
@@ -784,7 +900,7 @@ def search_and_generate(query: str, compare: bool = False):
                         Div(
                             H4("🧠 Default Claude", cls="text-lg font-bold text-blue-700 text-center mb-4"),
                             Div(
-                                Div(id="no-rag-answer", cls="p-6 bg-white min-h-[300px]"),
+                                Div(id="no-rag-answer", data_search_id=search_id, cls="p-6 bg-white min-h-[300px]"),
                                 cls="prose prose-sm max-w-none bg-gradient-to-br from-blue-50 to-blue-100 p-6 rounded-xl border border-blue-200 min-h-[300px] overflow-y-auto"
                             ),
                             cls="w-1/2 pl-3"
@@ -870,6 +986,7 @@ def search_and_generate(query: str, compare: bool = False):
                     Script("""
                     // Auto-start both streams immediately
                     function startComparisonStreaming() {
+                        closeAnswerStreams();
                         startSingleStream('rag-answer', '/generate-answer-streaming', 'RAG');
                         startSingleStream('no-rag-answer', '/generate-answer-no-rag-streaming', 'Default Claude');
                     }
@@ -900,8 +1017,9 @@ def search_and_generate(query: str, compare: bool = False):
                         zeroMdElement.appendChild(scriptElement);
                         streamingContent.appendChild(zeroMdElement);
 
-                        // Create EventSource for Server-Sent Events
-                        const eventSource = new EventSource(endpoint);
+                        // Create EventSource for Server-Sent Events, for the search that rendered this answer
+                        const eventSource = new EventSource(endpoint + '?search_id=' + answerDiv.dataset.searchId);
+                        answerStreams.push(eventSource);
                         
                         eventSource.onmessage = function(event) {
                             if (event.data === '[DONE]') {
@@ -929,6 +1047,8 @@ def search_and_generate(query: str, compare: bool = False):
                                     // Update title
                                     const title = answerDiv.querySelector('h5');
                                     if (title) title.textContent = `🤖 ${answerType}`;
+                                } else if (data.type === 'stats') {
+                                    answerDiv.querySelector('.prose').insertAdjacentHTML('afterend', formatAnswerStats(data.content));
                                 } else if (data.type === 'error') {
                                     console.error('Streaming error:', data.content);
                                     streamingContent.innerHTML = '<div class="text-red-500 p-4 bg-red-50 rounded border-l-4 border-red-400">❌ ' + data.content + '</div>';
@@ -968,7 +1088,7 @@ def search_and_generate(query: str, compare: bool = False):
                 Div(
                     H3("🤖 AI Generated Answer", cls="text-2xl font-bold text-green-700 mb-4"),
                     Div(
-                        Div(id="ai-answer", cls="mt-4"),
+                        Div(id="ai-answer", data_search_id=search_id, cls="mt-4"),
                         cls="prose max-w-none min-h-[200px]"
                     ),
                     P("💡 This answer is being streamed in real-time using context from the search results below.", 
@@ -1041,7 +1161,9 @@ def search_and_generate(query: str, compare: bool = False):
                     streamingContent.appendChild(zeroMdElement);
 
                     // Create EventSource for Server-Sent Events
-                    const eventSource = new EventSource('/generate-answer-streaming');
+                    closeAnswerStreams();
+                    const eventSource = new EventSource('/generate-answer-streaming?search_id=' + answerDiv.dataset.searchId);
+                    answerStreams.push(eventSource);
                     
                     eventSource.onmessage = function(event) {
                         if (event.data === '[DONE]') {
@@ -1069,6 +1191,8 @@ def search_and_generate(query: str, compare: bool = False):
                                 // Update title
                                 const title = answerDiv.querySelector('h3');
                                 if (title) title.textContent = '🤖 AI Generated Answer (with RAG)';
+                            } else if (data.type === 'stats') {
+                                answerDiv.insertAdjacentHTML('beforeend', formatAnswerStats(data.content));
                             } else if (data.type === 'error') {
                                 console.error('Streaming error:', data.content);
                                 streamingContent.innerHTML = '<div class="text-red-500 p-4 bg-red-50 rounded border-l-4 border-red-400">❌ ' + data.content + '</div>';
@@ -1102,14 +1226,28 @@ def search_and_generate(query: str, compare: bool = False):
             cls="bg-red-50 border border-red-200 rounded-xl p-8"
         )
 
+def NeighborSections(context):
+    """Titles of a hit's parent, previous, next and child sections"""
+    items = []
+    for relation, neighbors in context.items():
+        titles = [n.get('section_title') or 'Untitled Section'
+                  for n in (neighbors if isinstance(neighbors, list) else [neighbors]) if n]
+        if titles:
+            items.append(Li(Span(f"{relation.capitalize()}: ", cls="font-medium"), ", ".join(titles)))
+    return Ul(*items, cls="text-sm text-gray-600 mb-4 space-y-1") if items else ""
+
 def SearchResultModern(result, index):
     """Display a single search result with modern styling"""
-    # Calculate similarity percentage (LanceDB returns distance, lower is better)
+    # Calculate similarity percentage (LanceDB returns distance, lower is better);
+    # exact API symbol matches found without embedding the query have no distance
     distance = result.get('_distance', 1.0)
-    similarity = max(0, (1 - distance) * 100)
+    similarity = max(0, (1 - distance) * 100) if distance is not None else None
     
     # Determine similarity color and badge style
-    if similarity >= 80:
+    if similarity is None:
+        badge_cls = "bg-amber-50 text-amber-700 border-amber-200"
+        similarity_icon = "🔣"
+    elif similarity >= 80:
         badge_cls = "bg-green-100 text-green-800 border-green-200"
         similarity_icon = "🎯"
     elif similarity >= 60:
@@ -1129,11 +1267,17 @@ def SearchResultModern(result, index):
                 Div(
                     Span(f"#{index}", cls="text-lg font-bold text-indigo-600 mr-3"),
                     Span(result.get('section_title', 'Untitled Section'), cls="text-lg font-semibold text-gray-900"),
+                    Span(result['corpus'], cls="ml-3 px-2 py-0.5 rounded bg-indigo-50 text-indigo-700 text-xs font-medium")
+                    if result.get('corpus') else "",
+                    Span("API match", cls="ml-3 px-2 py-0.5 rounded bg-amber-50 text-amber-700 text-xs font-medium")
+                    if result.get('symbols_matched') else "",
                     cls="flex items-center"
                 ),
                 Div(
                     Span(similarity_icon, cls="mr-1"),
-                    Span(f"{similarity:.1f}% match", cls="font-medium"),
+                    Span(f"{similarity:.1f}% match" if similarity is not None
+                         else f"{result['symbols_matched']} API symbol{'s' if result['symbols_matched'] != 1 else ''}",
+                         cls="font-medium"),
                     cls=f"px-3 py-1 rounded-full text-sm border {badge_cls}"
                 ),
                 cls="flex justify-between items-start mb-4"
@@ -1145,6 +1289,9 @@ def SearchResultModern(result, index):
                 cls="bg-gradient-to-r from-gray-50 to-gray-100 rounded-lg p-4 mb-4 border-l-4 border-indigo-400"
             ),
             
+            # Neighbouring sections attached by the search
+            NeighborSections(result.get('context', {})),
+            
             # Footer with source link
             Div(
                 A(
@@ -1332,9 +1479,9 @@ def load_doc(doc_id: str):
     )
 
 @app.get('/generate-answer-streaming')
-async def generate_answer_streaming():
+async def generate_answer_streaming(req, search_id: str = ""):
     """Generate AI answer with streaming response using Server-Sent Events - ORIGINAL WORKING VERSION"""
-    global last_search_results, last_query
+    query, results = recall_search(search_id)
     
     if not claude.is_available():
         return StreamingResponse(
@@ -1343,7 +1490,7 @@ async def generate_answer_streaming():
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
         )
     
-    if not last_search_results:
+    if not results:
         return StreamingResponse(
             generate_error_stream("No search results available. Please perform a search first."),
             media_type="text/event-stream",
@@ -1355,20 +1502,36 @@ async def generate_answer_streaming():
             yield "data: " + json.dumps({"type": "start", "content": ""}) + "\n\n"
             
             full_response = ""
-            async for chunk in claude.generate_answer_streaming(last_query, last_search_results):
-                full_response += chunk
-                yield "data: " + json.dumps({"type": "chunk", "content": chunk}) + "\n\n"
-                await asyncio.sleep(0.01)  # Small delay for smoother streaming
+            stats = None
+            key = answer_key(query, results)
+            cached = answer_cache.answer(key)
+            answer = replay_answer(cached) if cached else answer_streams.stream(
+                key, lambda: claude.generate_answer_streaming(query, results, include_stats=True))
+            # Closing the subscription when this response ends lets the upstream stop
+            async with aclosing(answer):
+                async for chunk in answer:
+                    if isinstance(chunk, dict):
+                        stats = chunk
+                        continue
+                    full_response += chunk
+                    yield "data: " + json.dumps({"type": "chunk", "content": chunk}) + "\n\n"
+                    await asyncio.sleep(0.01)  # Small delay for smoother streaming
             
-            # Send complete markdown content
+            # Send complete markdown content, then token usage and timing
             yield "data: " + json.dumps({"type": "complete", "content": full_response}) + "\n\n"
+            if stats:
+                yield "data: " + json.dumps({"type": "stats", "content": stats}) + "\n\n"
             yield "data: [DONE]\n\n"
             
+        except (AdmissionRejected, GenerationTimeout) as e:
+            yield "data: " + json.dumps({"type": "error", "content": str(e)}) + "\n\n"
+            yield "data: [DONE]\n\n"
         except Exception as e:
             yield "data: " + json.dumps({"type": "error", "content": f"Error generating answer: {str(e)}"}) + "\n\n"
+            yield "data: [DONE]\n\n"
     
     return StreamingResponse(
-        generate(), 
+        until_disconnected(req, generate(), route="/generate-answer-streaming"),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache", 
@@ -1429,9 +1592,9 @@ def generate_answer_streaming_post():
 
 # No-RAG Streaming Endpoint
 @app.get('/generate-answer-no-rag-streaming')
-async def generate_answer_no_rag_streaming():
+async def generate_answer_no_rag_streaming(req, search_id: str = ""):
     """Generate AI answer WITHOUT RAG context with streaming response using Server-Sent Events"""
-    global last_query
+    query, _ = recall_search(search_id)
     
     if not claude.is_available():
         return StreamingResponse(
@@ -1440,7 +1603,7 @@ async def generate_answer_no_rag_streaming():
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
         )
     
-    if not last_query:
+    if not query:
         return StreamingResponse(
             generate_error_stream("No query available. Please perform a search first."),
             media_type="text/event-stream",
@@ -1452,25 +1615,109 @@ async def generate_answer_no_rag_streaming():
             yield "data: " + json.dumps({"type": "start", "content": ""}) + "\n\n"
             
             full_response = ""
+            stats = None
             # Generate answer WITHOUT RAG context (pass None instead of results)
-            async for chunk in claude.generate_answer_streaming(last_query, None):
-                full_response += chunk
-                yield "data: " + json.dumps({"type": "chunk", "content": chunk}) + "\n\n"
-                await asyncio.sleep(0.01)
+            key = answer_key(query, mode="no_rag")
+            cached = answer_cache.answer(key)
+            answer = replay_answer(cached) if cached else answer_streams.stream(
+                key, lambda: claude.generate_answer_streaming(query, None, include_stats=True))
+            # Closing the subscription when this response ends lets the upstream stop
+            async with aclosing(answer):
+                async for chunk in answer:
+                    if isinstance(chunk, dict):
+                        stats = chunk
+                        continue
+                    full_response += chunk
+                    yield "data: " + json.dumps({"type": "chunk", "content": chunk}) + "\n\n"
+                    await asyncio.sleep(0.01)
             
             yield "data: " + json.dumps({"type": "complete", "content": full_response}) + "\n\n"
+            if stats:
+                yield "data: " + json.dumps({"type": "stats", "content": stats}) + "\n\n"
             yield "data: [DONE]\n\n"
             
+        except (AdmissionRejected, GenerationTimeout) as e:
+            yield "data: " + json.dumps({"type": "error", "content": str(e)}) + "\n\n"
+            yield "data: [DONE]\n\n"
         except Exception as e:
             yield "data: " + json.dumps({"type": "error", "content": f"Error generating answer: {str(e)}"}) + "\n\n"
             yield "data: [DONE]\n\n"
     
     return StreamingResponse(
-        generate(),
+        until_disconnected(req, generate(), route="/generate-answer-no-rag-streaming"),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
 
+@app.get('/metrics')
+def metrics(req):
+    """Prometheus text exposition of the app's counters and latency histograms"""
+    denied = operator_denied(req)
+    if denied:
+        return denied
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get('/answer-stats')
+def answer_stats(by: str = "mode"):
+    """Token usage, latency, cost and stop reasons of recent answers, by mode, route or model"""
+    if by not in ("mode", "route", "model"):
+        return JSONResponse({"error": "by must be one of mode, route, model"}, status_code=400)
+    return JSONResponse(summarize_answer_stats(by))
+
+@app.get('/profiles')
+def profiles(req):
+    """List stored profiler captures with download links"""
+    denied = operator_denied(req)
+    if denied:
+        return denied
+    captures = list_profiles()
+    rows = [Tr(
+        Td(c["created"], cls="px-4 py-2 text-sm text-gray-600 whitespace-nowrap"),
+        Td(c["kind"], cls="px-4 py-2 text-sm"),
+        Td(c["label"], cls="px-4 py-2 text-sm break-all"),
+        Td(f"{c['seconds'] * 1000:.1f} ms", cls="px-4 py-2 text-sm text-right whitespace-nowrap"),
+        Td(A("summary", href=f"/profiles/{c['name']}/summary", cls="text-indigo-600 hover:underline mr-3"),
+           A(".prof", href=f"/profiles/{c['name']}", cls="text-indigo-600 hover:underline"),
+           cls="px-4 py-2 text-sm whitespace-nowrap"),
+        cls="border-t border-gray-100"
+    ) for c in captures]
+    
+    content = Div(
+        H2("Profiles", cls="text-2xl font-bold text-gray-800 mb-2"),
+        P("Enable with FASTRAG_PROFILE=ingest,query or add profile=1 to a search request.",
+          cls="text-gray-600 mb-6"),
+        Table(
+            Thead(Tr(*[Th(h, cls="px-4 py-2 text-left text-xs font-semibold text-gray-500 uppercase")
+                       for h in ("Created", "Kind", "Label", "Time", "")])),
+            Tbody(*rows),
+            cls="w-full bg-white rounded-xl shadow-sm border border-gray-200"
+        ) if rows else P("No captures yet.", cls="text-gray-500 italic"),
+        cls="p-8"
+    )
+    return MainLayout(content, current_route="/profiles")
+
+@app.get('/profiles/{name}')
+def download_profile(req, name: str):
+    """Download a capture as a pstats .prof file"""
+    denied = operator_denied(req)
+    if denied:
+        return denied
+    path = profile_path(name)
+    if path is None:
+        return PlainTextResponse("Profile not found", status_code=404)
+    return FileResponse(path, filename=f"{name}.prof", media_type="application/octet-stream")
+
+@app.get('/profiles/{name}/summary')
+def profile_summary_text(req, name: str):
+    """Top functions of a capture by cumulative time"""
+    denied = operator_denied(req)
+    if denied:
+        return denied
+    summary = profile_summary(name)
+    if summary is None:
+        return PlainTextResponse("Profile not found", status_code=404)
+    return PlainTextResponse(summary)
+
 # HTMX Toggle and Utility Endpoints
 @app.post('/toggle-viewer')
 def toggle_viewer():
@@ -1502,19 +1749,19 @@ def toggle_viewer():
 @app.post('/toggle-urls')
 def toggle_urls():
     """Toggle URLs list visibility"""
-    from utils.batch import fasthtml_doc_urls
+    seed_urls = crawl_settings()["seeds"]
     
     # Return the URLs content in hidden state
     return Div(
         Div(
-            H3(f"URLs to Process ({len(fasthtml_doc_urls)})", cls="text-lg font-semibold text-gray-800 mb-4"),
+            H3(f"Seed URLs ({len(seed_urls)})", cls="text-lg font-semibold text-gray-800 mb-4"),
             Div(
                 *[Div(
                     Span(f"{i+1}.", cls="text-gray-500 font-mono text-sm mr-3"),
                     Span(url.split('/')[-1] or url.split('/')[-2], cls="font-medium text-gray-800"),
                     Div(url, cls="text-xs text-gray-500 mt-1"),
                     cls="p-3 border-b border-gray-100 last:border-b-0 hover:bg-gray-50 transition-colors duration-150"
-                ) for i, url in enumerate(fasthtml_doc_urls)],
+                ) for i, url in enumerate(seed_urls)],
                 cls="bg-white rounded-lg border border-gray-200 max-h-60 overflow-y-auto"
             ),
             cls="mb-6"
@@ -1550,65 +1797,110 @@ def clear_log():
     """Clear log content"""
     return ""  # Return empty content to clear the log
 
-@app.ws('/ws')
-async def ws(msg: str, send):
-    global batch_running
-    
-    if not batch_running:
-        batch_running = True
-        await send(Div(LogContainer(), id="log-section", style="display: block;", hx_swap_oob='true'))
-        await send(StartButton(disabled=True, hx_swap_oob='true'))
-        
-        total = len(fasthtml_doc_urls)
-        
-        # --- FIX: Get initial counts ONCE before the loop ---
-        doc_count = db.get_document_count()
-        chunk_count = db.get_chunk_count()
-        
-        for i, url in enumerate(fasthtml_doc_urls):
-            start_time = time.time()
-            
-            result = await asyncio.to_thread(process_single_url, db, url)
-            
-            end_time = time.time()
-            
-            progress = int(((i + 1) / total) * 100)
-            current_text = f"Processing {url.split('/')[-1]}"
-            if i + 1 == total:
-                current_text = "Batch processing complete!"
-            
-            await send(ProgressDisplay(
-                progress=progress, text=current_text, current=i+1, total=total, hx_swap_oob='true'
-            ))
-            
-            if result["status"] == "cached": 
-                message = "Skipped (cached)"
-                status_cls = 'bg-yellow-100 text-yellow-800'
-            elif result["status"] == "processed": 
-                message = f"Processed in {end_time - start_time:.2f}s ({result.get('sections', 0)} sections)"
-                status_cls = 'bg-green-100 text-green-800'
-                # --- FIX: Update counts in memory for a fast UI response ---
-                doc_count += 1
-                chunk_count += result.get('sections', 0)
-            else: 
-                message = f"Error: {result['error']}"
-                status_cls = 'bg-red-100 text-red-800'
-            
-            log_entry = Div(
-                Div(url, cls="font-semibold"), 
-                Div(message, cls="text-sm"), 
-                cls=f"p-2 mb-2 rounded {status_cls}", 
-                hx_swap_oob="afterbegin:#log-content"
-            )
-            await send(log_entry)
-        
-            # --- FIX: Send the in-memory stats, don't re-query the database ---
-            await send(DatabaseStats(doc_count, chunk_count, hx_swap_oob='true'))
+async def job_feed(job_id: int):
+    """A job's progress events, read once and shared by every websocket watching it"""
+    async for event in follow_job(job_store, job_id):
+        if event["type"] == "finished":
+            # New chunks make the precomputed sample answers stale (checked once per job, not per watcher)
+            answer_cache.refresh_if_stale()
+        yield event
+
+async def relay_job(job_id: int, send):
+    """Push a job's progress to one websocket until the job finishes or the socket closes"""
+    await send(Div(LogContainer(), id="log-section", style="display: block;", hx_swap_oob='true'))
+    await send(StartButton(disabled=True, hx_swap_oob='true'))
+    events = job_feeds.stream(str(job_id), lambda: job_feed(job_id))
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "page":
+                done, total = event["done"], event["total"]
+                current_text = f"Processing {event['url'].rstrip('/').split('/')[-1]}"
+                if done == total:
+                    current_text = "Batch processing complete!"
+                await send(ProgressDisplay(
+                    progress=int(done / total * 100), text=current_text, current=done, total=total, hx_swap_oob='true'
+                ))
+                
+                if event["status"] == "cached": 
+                    message = "Skipped (cached)"
+                    status_cls = 'bg-yellow-100 text-yellow-800'
+                elif event["status"] == "skipped":
+                    message = f"Skipped ({event['error']})"
+                    status_cls = 'bg-yellow-100 text-yellow-800'
+                elif event["status"] == "processed": 
+                    message = f"Processed in {event['seconds']:.2f}s ({event['sections']} sections)"
+                    status_cls = 'bg-green-100 text-green-800'
+                else: 
+                    message = f"Error: {event['error']}"
+                    status_cls = 'bg-red-100 text-red-800'
+                
+                await send(Div(
+                    Div(event["url"], cls="font-semibold"), 
+                    Div(message, cls="text-sm"), 
+                    cls=f"p-2 mb-2 rounded {status_cls}", 
+                    hx_swap_oob="afterbegin:#log-content"
+                ))
+                await send(DatabaseStats(event["doc_count"], event["chunk_count"], hx_swap_oob='true'))
+            elif event["type"] == "finished":
+                if event["status"] != "done":
+                    text = f"Job {event['status']}" + (f": {event['error']}" if event["error"] else "")
+                    await send(ProgressDisplay(text=text, hx_swap_oob='true'))
+                # Refresh the XML document viewer (dropdown) with updated documents
+                await send(DocumentViewerModern(hx_swap_oob='true'))
+                await send(StartButton(disabled=False, hx_swap_oob='true'))
+
+# The job each open websocket is currently following
+job_watchers = {}
+
+def watch_job(job_id: int, ws, send):
+    if job_watchers.get(ws) == job_id:
+        return
+    job_watchers[ws] = job_id
+    async def run():
+        try:
+            await relay_job(job_id, send)
+        except (WebSocketDisconnect, ConnectionClosed):
+            pass  # The socket closed; the job itself keeps running in the worker
+        except Exception as e:
+            print(f"Stopped relaying job {job_id}: {e!r}")
+        finally:
+            if job_watchers.get(ws) == job_id:
+                del job_watchers[ws]
+    asyncio.create_task(run())
+
+async def ws_connect(ws, send):
+    """Show progress of an ingestion that is already running, e.g. one started from another browser"""
+    job = job_store.active_job()
+    if job:
+        watch_job(job["id"], ws, send)
+        ensure_worker()
+
+@app.ws('/ws', conn=ws_connect)
+async def ws(msg: str, ws, send):
+    job = job_store.active_job()
+    if job is None:
+        params = dict(crawl_settings(), corpus=db.corpus)
+        job = job_store.get(job_store.submit("crawl", params, total=len(params["seeds"])))
+    watch_job(job["id"], ws, send)
+    ensure_worker()
+
+@app.get('/jobs')
+def jobs(limit: int = 20):
+    """Recent jobs, newest first"""
+    return JSONResponse(job_store.list_jobs(limit))
 
-        # Refresh the XML document viewer (dropdown) with updated documents
-        await send(DocumentViewerModern(hx_swap_oob='true'))
+@app.get('/jobs/{job_id}')
+def job_status(job_id: int):
+    job = job_store.get(job_id)
+    return JSONResponse(job) if job else JSONResponse({"error": "Unknown job"}, status_code=404)
 
-        batch_running = False
-        await send(StartButton(disabled=False, hx_swap_oob='true'))
+@app.post('/jobs/{job_id}/cancel')
+def cancel_job(req, job_id: int):
+    denied = operator_denied(req)
+    if denied:
+        return denied
+    if job_store.get(job_id) is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    return JSONResponse({"cancelled": job_store.cancel(job_id)})
 
 serve()
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""Shared fixtures.
+
+The sentence-transformers model is swapped for a deterministic bag-of-words
+encoder before `utils.database` loads it, so the tests run offline and texts
+sharing words get similar vectors.
+"""
+import re
+import zlib
+import numpy as np
+import pytest
+import sentence_transformers
+
+DIM = 64
+
+
+class HashingEncoder:
+    """Each word adds 1 to one dimension picked by its hash; rows are L2-normalized"""
+
+    def __init__(self, name, *args, **kwargs):
+        self.name = name
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.zeros((1 if single else len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate([texts] if single else texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % DIM] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        return vectors[0] if single else vectors
+
+
+sentence_transformers.SentenceTransformer = HashingEncoder
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "lancedb")
+
+
+@pytest.fixture
+def db(db_path):
+    from utils.database import FastHTMLDatabase
+    return FastHTMLDatabase(db_path)
@@ -0,0 +1,74 @@
+import asyncio
+import random
+import threading
+import time
+import pytest
+from utils.admission import AdmissionController, AdmissionRejected, backoff_delay
+
+
+def hold_slot(controller):
+    """Take a slot in a thread; returns (acquired, release) events"""
+    acquired, release = threading.Event(), threading.Event()
+
+    def run():
+        with controller.slot():
+            acquired.set()
+            release.wait(5)
+
+    threading.Thread(target=run, daemon=True).start()
+    assert acquired.wait(5)
+    return release
+
+
+def test_a_full_queue_rejects_right_away():
+    controller = AdmissionController("test-full", max_concurrent=1, max_queue=1, queue_timeout=5)
+    release = hold_slot(controller)
+    queued = threading.Thread(target=lambda: controller.slot().__enter__(), daemon=True)
+    queued.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.slot():
+            pass
+    assert rejected.value.reason == "queue_full" and time.monotonic() - start < 1
+
+    release.set()
+    queued.join(5)
+    assert not queued.is_alive()  # the queued caller got the released slot
+
+
+def test_waiting_past_the_queue_timeout_is_rejected():
+    controller = AdmissionController("test-timeout", max_concurrent=1, max_queue=4, queue_timeout=0.05)
+    release = hold_slot(controller)
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.slot():
+            pass
+    assert rejected.value.reason == "timeout"
+    release.set()
+
+
+def test_async_callers_are_admitted_in_order():
+    async def run():
+        controller = AdmissionController("test-async", max_concurrent=1, max_queue=8, queue_timeout=5)
+        order = []
+
+        async def call(i):
+            async with controller.async_slot():
+                order.append(i)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call(i) for i in range(4)))
+        return order, controller._active
+
+    assert asyncio.run(run()) == ([0, 1, 2, 3], 0)
+
+
+def test_backoff_delay_bounds():
+    random.seed(0)
+    for attempt in range(8):
+        for _ in range(50):
+            assert 0 <= backoff_delay(attempt, base=0.5, cap=8.0) <= min(8.0, 0.5 * 2 ** attempt)
+    # A longer Retry-After wins, but never past the cap
+    assert all(3.0 <= backoff_delay(0, retry_after=3.0) <= 8.0 for _ in range(50))
+    assert backoff_delay(0, cap=8.0, retry_after=120.0) == 8.0
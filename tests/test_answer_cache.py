@@ -0,0 +1,113 @@
+import os
+import asyncio
+import pytest
+from utils.answer_cache import AnswerCache, replay_answer
+from utils.coalesce import answer_key
+from utils.embedding_cache import _file_lock
+
+QUERY = "How do I create routes?"
+RESULTS = [{"id": "doc_chunk_0", "content": "Routes map paths to handlers.", "_distance": 0.2}]
+
+
+class FakeDB:
+    def __init__(self, path):
+        self.db_path = path
+        self.version = "v1"
+        self.searches = 0
+
+    def corpus_version(self):
+        return self.version
+
+    def search_similar(self, query, limit=5):
+        self.searches += 1
+        return RESULTS
+
+
+class FakeClaude:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def is_available(self):
+        return True
+
+    def generate_answer(self, query, context, include_stats=False):
+        self.calls += 1
+        return (None if self.fail else f"answer {self.calls}"), {"input_tokens": 1}
+
+
+@pytest.fixture
+def fake_db(tmp_path):
+    return FakeDB(str(tmp_path))
+
+
+def test_warm_answers_are_served_until_the_corpus_changes(fake_db):
+    cache = AnswerCache(fake_db, FakeClaude(), queries=[QUERY])
+
+    assert cache.warm() == {"warmed": 1, "fresh": 0, "no_results": 0, "failed": 0}
+    assert cache.search("how do i  create ROUTES?") == RESULTS
+    assert cache.answer(answer_key(QUERY, RESULTS))["text"] == "answer 1"
+    assert AnswerCache(fake_db, FakeClaude(), queries=[QUERY]).search(QUERY) == RESULTS  # persisted
+
+    fake_db.version = "v2"
+    assert cache.search(QUERY) is None and cache.answer(answer_key(QUERY, RESULTS)) is None
+    assert cache.stale_queries() == [QUERY]
+
+
+def test_replay_streams_the_stored_answer():
+    text = "routes " * 100
+
+    async def collect():
+        return [chunk async for chunk in replay_answer({"text": text, "stats": {"input_tokens": 1}})]
+    *chunks, stats = asyncio.run(collect())
+
+    assert len(chunks) > 1 and "".join(chunks) == text
+    assert stats["cached"] and stats["input_tokens"] == 1
+
+
+def test_failed_warm_ups_back_off(fake_db, monkeypatch):
+    monkeypatch.setenv("FASTRAG_ANSWER_CACHE_BACKOFF_SECONDS", "60")
+    claude = FakeClaude(fail=True)
+    cache = AnswerCache(fake_db, claude, queries=[QUERY])
+
+    assert cache.warm()["failed"] == 1
+    assert cache.backing_off() and not cache.refresh_if_stale()
+    cache.warm()
+    assert cache.failures["v1"][0] == 2  # a second failure doubles the delay
+
+    fake_db.version = "v2"  # a new corpus version is tried right away
+    assert not cache.backing_off()
+    claude.fail = False
+    assert cache.warm()["warmed"] == 1 and "v2" not in cache.failures
+
+
+def test_processes_share_entries_and_failures(fake_db):
+    first_claude, second_claude = FakeClaude(), FakeClaude()
+    first = AnswerCache(fake_db, first_claude, queries=[QUERY, "What is HTMX?"])
+    second = AnswerCache(fake_db, second_claude, queries=[QUERY, "What is HTMX?"])
+
+    first.warm()
+    assert second.search(QUERY) == RESULTS  # reloaded once the file changed
+    assert second.warm()["fresh"] == 2 and second_claude.calls == 0
+
+    fake_db.version = "v2"
+    first_claude.fail = True
+    first.warm()
+    assert second.backing_off() and not second.refresh_if_stale()
+
+
+def test_a_warm_up_in_another_process_is_not_repeated(fake_db):
+    claude = FakeClaude()
+    cache = AnswerCache(fake_db, claude, queries=[QUERY])
+    os.makedirs(os.path.dirname(cache.lock_path), exist_ok=True)
+    with _file_lock(cache.lock_path):  # a second open file, as another process would hold
+        assert cache.warm() is None
+    assert claude.calls == 0 and fake_db.searches == 0
+    assert cache.warm()["warmed"] == 1
+
+
+def test_entries_from_other_processes_are_kept(fake_db):
+    AnswerCache(fake_db, FakeClaude(), queries=[QUERY]).warm()
+    other = AnswerCache(fake_db, FakeClaude(), queries=["What is HTMX?"])
+    other.warm()
+    assert AnswerCache(fake_db, FakeClaude(), queries=[QUERY]).search(QUERY) == RESULTS
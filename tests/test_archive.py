@@ -0,0 +1,42 @@
+import pytest
+from utils.archive import ArchiveWriter, archive_kind, import_archives, iter_archive
+
+PAGES = {
+    "https://example.org/docs/": b"<html><body><main id='quarto-document-content'><h1>Home</h1><p>Welcome.</p></main></body></html>",
+    "https://example.org/docs/routes.html": "<html><body><h1>Routes</h1><p>Café routes.</p></body></html>".encode(),
+}
+
+
+def read(path):
+    pages = {}
+    for page in iter_archive(path):
+        if "html" in page:
+            pages[page["url"]] = page["html"]
+        else:
+            with open(page["path"], "rb") as f:
+                pages[page["url"]] = f.read()
+    return pages
+
+
+@pytest.mark.parametrize("name, kind", [("pages", "directory"), ("pages.tar.gz", "tar"),
+                                        ("pages.tar", "tar"), ("pages.warc.gz", "warc"), ("pages.warc", "warc")])
+def test_round_trip(tmp_path, name, kind):
+    path = str(tmp_path / name)
+    with ArchiveWriter(path) as writer:
+        for url, html in PAGES.items():
+            writer.add(url, html)
+        writer.add("https://example.org/docs/", b"a second copy is skipped")
+
+    assert archive_kind(path) == kind
+    assert read(path) == PAGES
+
+
+def test_import_stores_every_page_once(db, tmp_path):
+    path = str(tmp_path / "pages.tar.gz")
+    with ArchiveWriter(path) as writer:
+        for url, html in PAGES.items():
+            writer.add(url, html)
+
+    assert import_archives(db, [path], workers=1) == {"processed": 2, "cached": 0, "error": 0}
+    assert all(db.url_exists(url) for url in PAGES)
+    assert import_archives(db, [path], workers=1) == {"processed": 0, "cached": 2, "error": 0}
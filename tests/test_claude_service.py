@@ -0,0 +1,182 @@
+import asyncio
+import httpx
+import pytest
+from collections import deque
+from types import SimpleNamespace
+from anthropic import APIStatusError
+from utils import claude_service
+from utils.claude_service import ClaudeService, GenerationTimeout, summarize_answer_stats
+
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+def api_error(status_code, retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    return APIStatusError(f"status {status_code}", response=httpx.Response(status_code, headers=headers,
+                                                                          request=REQUEST), body=None)
+
+
+def message(text="Routes map paths to handlers."):
+    usage = SimpleNamespace(input_tokens=10, output_tokens=5, cache_read_input_tokens=0,
+                            cache_creation_input_tokens=0)
+    return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage, model="claude-test",
+                           stop_reason="end_turn")
+
+
+class FakeStream:
+    def __init__(self, texts, error=None, final_delay=0.0):
+        self.texts, self.error, self.final_delay = texts, error, final_delay
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        async def texts():
+            for text in self.texts:
+                yield text
+            if self.error:
+                raise self.error
+        return texts()
+
+    async def get_final_message(self):
+        await asyncio.sleep(self.final_delay)
+        return message("".join(self.texts))
+
+
+class FakeMessages:
+    """Plays back one scripted outcome (an exception or a response) per call"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def create(self, **kwargs):
+        return self._next()
+
+    def stream(self, **kwargs):
+        return self._next()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("FASTRAG_CLAUDE_RETRIES", "2")
+    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+    sleeps = []
+    monkeypatch.setattr(claude_service.time, "sleep", sleeps.append)
+    service = ClaudeService()
+    service.api_key = "test"
+    service.sleeps = sleeps
+    return service
+
+
+def use(service, outcomes):
+    messages = FakeMessages(outcomes)
+    service.client = service.async_client = SimpleNamespace(messages=messages)
+    return messages
+
+
+def collect(service, **kwargs):
+    async def run():
+        return [item async for item in service.generate_answer_streaming("How do routes work?", **kwargs)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("status_code", [429, 529])
+def test_rate_limits_and_overloads_are_retried(service, status_code):
+    messages = use(service, [api_error(status_code), api_error(status_code), message()])
+    assert service.generate_answer("How do routes work?") == "Routes map paths to handlers."
+    assert messages.calls == 3 and len(service.sleeps) == 2
+
+
+def test_retries_stop_after_the_limit(service):
+    messages = use(service, [api_error(429)] * 5)
+    assert service.generate_answer("How do routes work?") is None
+    assert messages.calls == 3  # the first try and FASTRAG_CLAUDE_RETRIES=2 retries
+
+
+@pytest.mark.parametrize("status_code", [400, 500])
+def test_other_errors_are_not_retried(service, status_code):
+    messages = use(service, [api_error(status_code), message()])
+    assert service.generate_answer("How do routes work?") is None
+    assert messages.calls == 1 and service.sleeps == []
+
+
+def test_retry_after_is_honoured(service):
+    use(service, [api_error(429, retry_after=3), message()])
+    service.generate_answer("How do routes work?")
+    assert 3 <= service.sleeps[0] <= 8
+
+
+def test_streams_are_retried_before_the_first_token(service):
+    messages = use(service, [api_error(529), FakeStream(["Routes ", "map paths."])])
+    items = collect(service, include_stats=True)
+    assert items[:2] == ["Routes ", "map paths."] and items[2]["status"] == "ok"
+    assert messages.calls == 2
+
+
+def test_streams_are_not_retried_after_the_first_token(service):
+    messages = use(service, [FakeStream(["Routes "], error=api_error(529)), FakeStream(["again"])])
+    with pytest.raises(APIStatusError):
+        collect(service)
+    assert messages.calls == 1
+
+
+def test_stream_errors_are_raised_not_yielded_as_text(service):
+    use(service, [api_error(400)])
+    with pytest.raises(APIStatusError):
+        collect(service)
+
+
+def test_the_final_message_counts_against_the_generation_timeout(service):
+    service.generation_timeout = 0.1
+    use(service, [FakeStream(["Routes "], final_delay=5)])
+    with pytest.raises(GenerationTimeout):
+        collect(service)
+
+
+def answer_stats(mode="rag", status="ok", ttft_ms=100.0, stop_reason="end_turn", cost_usd=0.01, **overrides):
+    stats = {"mode": mode, "route": "default", "model": "claude-test", "status": status, "stop_reason": stop_reason,
+             "ttft_ms": ttft_ms, "duration_ms": 400.0, "input_tokens": 100, "output_tokens": 50,
+             "cache_read_input_tokens": 0, "cost_usd": cost_usd}
+    return dict(stats, **overrides)
+
+
+def test_streamed_answers_report_usage_and_timing(service, monkeypatch):
+    monkeypatch.setattr(claude_service, "RECENT_ANSWER_STATS", deque(maxlen=10))
+    use(service, [FakeStream(["Routes ", "map paths."])])
+    stats = collect(service, include_stats=True)[-1]
+
+    assert stats["input_tokens"] == 10 and stats["output_tokens"] == 5 and stats["stop_reason"] == "end_turn"
+    assert 0 <= stats["ttft_ms"] <= stats["duration_ms"]
+    assert list(claude_service.RECENT_ANSWER_STATS) == [stats]
+
+
+def test_answer_stats_are_summarized_per_group(monkeypatch):
+    monkeypatch.setattr(claude_service, "RECENT_ANSWER_STATS", deque([
+        answer_stats(ttft_ms=100.0),
+        answer_stats(ttft_ms=300.0, stop_reason="max_tokens", input_tokens=300),
+        answer_stats(status="error", ttft_ms=None, stop_reason=None, cost_usd=None),
+        answer_stats(mode="no_rag", ttft_ms=None, cost_usd=None, model="claude-other"),
+    ]))
+
+    summary = summarize_answer_stats()
+
+    assert set(summary) == {"rag", "no_rag"}
+    rag = summary["rag"]
+    assert rag["answers"] == 3 and rag["errors"] == 1
+    assert rag["avg_input_tokens"] == 200 and rag["p50_ttft_ms"] == 300.0 and rag["p95_ttft_ms"] == 300.0
+    assert rag["total_cost_usd"] == pytest.approx(0.02)
+    assert rag["stop_reasons"] == {"end_turn": 1, "max_tokens": 1}
+    assert summary["no_rag"]["p50_ttft_ms"] is None and summary["no_rag"]["total_cost_usd"] is None
+    assert set(summarize_answer_stats("model")) == {"claude-test", "claude-other"}
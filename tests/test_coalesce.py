@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils.coalesce import SingleFlight, StreamCoalescer, answer_key
+
+
+def test_answer_key_ignores_case_and_whitespace_but_not_the_context():
+    results = [{"id": "a_chunk_0"}]
+    assert answer_key("How do  routes work?", results) == answer_key("how do routes work? ", results)
+    assert answer_key("How do routes work?", results) != answer_key("How do routes work?", [{"id": "b_chunk_0"}])
+    assert answer_key("How do routes work?") != answer_key("How do routes work?", mode="no_rag")
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight("search")
+    calls = []
+    release = threading.Event()
+
+    def search():
+        calls.append(1)
+        assert release.wait(5)
+        return ["result"]
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.do, "routes", search) for _ in range(4)]
+        time.sleep(0.1)  # let every thread reach do()
+        release.set()
+        assert [f.result() for f in futures] == [["result"]] * 4
+
+    assert len(calls) == 1
+    assert flight.do("routes", lambda: ["again"]) == ["again"]  # finished calls are not reused
+
+
+def test_a_leader_error_reaches_every_waiter():
+    flight = SingleFlight("search")
+    release = threading.Event()
+
+    def search():
+        assert release.wait(5)
+        raise RuntimeError("index unavailable")
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flight.do, "routes", search) for _ in range(3)]
+        time.sleep(0.1)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="index unavailable"):
+                future.result()
+
+
+async def tokens(gate: asyncio.Event, log: list, fail: bool = False):
+    try:
+        yield "a"
+        yield "b"
+        await gate.wait()
+        if fail:
+            raise RuntimeError("upstream failed")
+        yield "c"
+    finally:
+        log.append("closed")
+
+
+def test_late_joiner_gets_the_prefix_then_the_live_tail():
+    async def run():
+        coalescer = StreamCoalescer()
+        gate, log, starts = asyncio.Event(), [], []
+
+        def factory():
+            starts.append(1)
+            return tokens(gate, log)
+
+        first = coalescer.stream("key", factory)
+        assert [await anext(first), await anext(first)] == ["a", "b"]
+        late = coalescer.stream("key", factory)
+        assert coalescer.in_flight() == 1
+        gate.set()
+        return [item async for item in first], [item async for item in late], starts, coalescer.in_flight()
+
+    first_tail, late_items, starts, in_flight = asyncio.run(run())
+    assert first_tail == ["c"]
+    assert late_items == ["a", "b", "c"]
+    assert len(starts) == 1 and in_flight == 0
+
+
+def test_an_upstream_error_reaches_every_subscriber():
+    async def run():
+        coalescer = StreamCoalescer()
+        gate = asyncio.Event()
+        streams = [coalescer.stream("key", lambda: tokens(gate, [], fail=True)) for _ in range(3)]
+
+        async def consume(stream):
+            items = []
+            try:
+                async for item in stream:
+                    items.append(item)
+            except RuntimeError as e:
+                return items, str(e)
+            return items, None
+
+        tasks = [asyncio.create_task(consume(s)) for s in streams]
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == [(["a", "b"], "upstream failed")] * 3
+
+
+def test_upstream_is_cancelled_when_the_last_subscriber_leaves():
+    async def run():
+        coalescer = StreamCoalescer()
+        gate, log = asyncio.Event(), []
+        first = coalescer.stream("key", lambda: tokens(gate, log))
+        second = coalescer.stream("key", lambda: tokens(gate, log))
+        await anext(first)
+        await anext(second)
+
+        await first.aclose()
+        await asyncio.sleep(0.01)
+        still_running = log == []
+        await second.aclose()
+        await asyncio.sleep(0.01)
+        return still_running, log, coalescer.in_flight()
+
+    still_running, log, in_flight = asyncio.run(run())
+    assert still_running  # one subscriber left keeps the upstream alive
+    assert log == ["closed"] and in_flight == 0
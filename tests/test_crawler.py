@@ -0,0 +1,35 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils import crawler
+from utils.crawler import Crawler, Frontier, canonicalize_url, frontier_path
+
+
+def test_canonicalize_url():
+    assert canonicalize_url("HTTPS://Example.org:443//docs/index.html?utm_source=x&b=2&a=1#top") == \
+        "https://example.org/docs/?a=1&b=2"
+    assert canonicalize_url("../api/", base="https://example.org/docs/tutorials/") == "https://example.org/docs/api/"
+    assert canonicalize_url("mailto:someone@example.org") is None
+
+
+def test_robots_is_fetched_once_per_site_and_a_slow_site_blocks_no_other(db_path, monkeypatch):
+    slow_site = threading.Event()
+    fetched = []
+
+    def fetch_html(url):
+        fetched.append(url)
+        if url.startswith("https://slow.example.org"):
+            assert slow_site.wait(5)
+        return b"User-agent: *\nDisallow: /private/\n"
+
+    monkeypatch.setattr(crawler, "fetch_html", fetch_html)
+    spider = Crawler(None, Frontier(frontier_path(db_path)), rate=1000)
+
+    with ThreadPoolExecutor(4) as pool:
+        slow = [pool.submit(spider.allowed, "https://slow.example.org/docs/") for _ in range(2)]
+        assert spider.allowed("https://fast.example.org/docs/")
+        assert not spider.allowed("https://fast.example.org/private/page.html")
+        assert not any(future.done() for future in slow)
+        slow_site.set()
+        assert all(future.result() for future in slow)
+
+    assert sorted(fetched) == ["https://fast.example.org/robots.txt", "https://slow.example.org/robots.txt"]
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+from utils.dedupe import ChunkDeduper
+
+ALPHA = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu"
+DIGITS = "one two three four five six seven eight nine ten eleven twelve"
+COLOURS = "red orange yellow green blue indigo violet black white grey pink brown"
+
+
+def store(deduper, doc_id, contents):
+    keep, links = deduper.check(doc_id, [{"content": c, "title": "", "level": 1} for c in contents])
+    deduper.commit([f"{doc_id}_chunk_{i}" for i in keep], links)
+    return keep, links
+
+
+def test_duplicates_are_found_after_reload(tmp_path):
+    path = str(tmp_path / "dedupe")
+    store(ChunkDeduper(path, "link"), "doc_a", [ALPHA, DIGITS])
+
+    keep, links = store(ChunkDeduper(path, "link"), "doc_b", [COLOURS, ALPHA])
+    assert keep == [0]
+    assert [link["canonical_id"] for link in links] == ["doc_a_chunk_0"]
+    assert ChunkDeduper(path, "link").links["doc_b"][0]["id"] == "doc_b_chunk_1"
+
+
+def test_torn_signature_rows_are_dropped_before_appending(tmp_path):
+    path = str(tmp_path / "dedupe")
+    deduper = ChunkDeduper(path, "link")
+    store(deduper, "doc_a", [ALPHA])
+    # A writer crashed after appending doc_b's signature but before its id
+    deduper.check("doc_b", [{"content": DIGITS}])
+    with open(os.path.join(path, "signatures.u32"), "ab") as f:
+        f.write(deduper.signatures["doc_b_chunk_0"].tobytes())
+
+    store(ChunkDeduper(path, "link"), "doc_c", [COLOURS])
+
+    reloaded = ChunkDeduper(path, "link")
+    assert sorted(reloaded.signatures) == ["doc_a_chunk_0", "doc_c_chunk_0"]
+    assert np.array_equal(reloaded.signatures["doc_c_chunk_0"], reloaded.hasher.signature(COLOURS))
+
+
+def test_forgetting_a_document_unlinks_its_duplicates(tmp_path):
+    path = str(tmp_path / "dedupe")
+    deduper = ChunkDeduper(path, "link")
+    store(deduper, "doc_a", [ALPHA])
+    store(deduper, "doc_b", [ALPHA])
+    assert deduper.links["doc_b"]
+
+    deduper.forget_doc("doc_a")
+
+    assert deduper.links["doc_b"] == []
+    assert ChunkDeduper(path, "link").links["doc_b"] == []
+    keep, _ = store(deduper, "doc_c", [ALPHA])
+    assert keep == [0]
+
+
+def test_the_database_deduper_follows_other_writers(db_path, monkeypatch):
+    monkeypatch.setenv("FASTRAG_DEDUPE", "link")
+    monkeypatch.setenv("FASTRAG_READ_CONSISTENCY_SECONDS", "0")
+    from utils.database import FastHTMLDatabase
+    writer, other = FastHTMLDatabase(db_path), FastHTMLDatabase(db_path)
+    assert other.deduper.signatures == {}  # loaded before the writer stores anything
+
+    section = [{"title": "Greek", "level": 1, "content": ALPHA}]
+    writer.store_parsed_document("https://example.org/a", "<document/>", "A", section)
+    doc_b = writer.store_parsed_document("https://example.org/b", "<document/>", "B", section)
+
+    assert other.get_document_chunks(doc_b)[0]["duplicate_of"].endswith("_chunk_0")
+    doc_c = other.store_parsed_document("https://example.org/c", "<document/>", "C", section)
+    assert other.get_document_chunks(doc_c)[0]["duplicate_of"] == writer.get_document_chunks(doc_b)[0]["duplicate_of"]
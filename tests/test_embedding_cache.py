@@ -0,0 +1,102 @@
+import os
+import multiprocessing
+import numpy as np
+from utils.embedding_cache import EmbeddingCache, _file_lock
+
+DIM = 8
+MODEL = "test-model"
+
+
+def fake_encode(texts):
+    """A vector per text that any process computes the same way"""
+    return np.asarray([[len(text) + i for i in range(DIM)] for text in texts], dtype=np.float32)
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts += texts
+        return fake_encode(texts)
+
+
+def test_cached_texts_skip_the_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), MODEL, DIM)
+    encoder = CountingEncoder()
+    first = cache.encode(["Routes map paths.", "Forms post fields."], encoder)
+
+    again = cache.encode(["Routes  map paths.\n", "Sessions use cookies."], encoder)
+
+    assert encoder.texts == ["Routes map paths.", "Forms post fields.", "Sessions use cookies."]
+    np.testing.assert_array_equal(again[0], first[0])  # whitespace is normalized away
+    assert (cache.hits, cache.misses) == (1, 3)
+    # Another instance (e.g. a new process) reads the stored rows
+    reopened = EmbeddingCache(str(tmp_path), MODEL, DIM)
+    assert len(reopened) == 3 and reopened.encode(["Forms post fields."], encoder)[0].tolist() == first[1].tolist()
+    assert len(EmbeddingCache(str(tmp_path), "other-model", DIM)) == 0
+
+
+def append_texts(path, prefix, count):
+    cache = EmbeddingCache(path, MODEL, DIM)
+    for i in range(count):
+        cache.encode([f"{prefix} text {i}", "shared text"], fake_encode)
+
+
+def test_processes_share_one_cache(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=append_texts, args=(str(tmp_path), f"worker{w}", 30)) for w in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    cache = EmbeddingCache(str(tmp_path), MODEL, DIM)
+    texts = [f"worker{w} text {i}" for w in range(3) for i in range(30)] + ["shared text"]
+    encoder = CountingEncoder()
+    np.testing.assert_array_equal(cache.encode(texts, encoder), fake_encode(texts))
+    assert encoder.texts == [] and cache._rows == len(texts)  # every row is whole and none is duplicated
+
+
+def hold_lock(path, locked, release):
+    with _file_lock(path):
+        locked.set()
+        release.wait(10)
+
+
+def test_the_file_lock_excludes_other_processes(tmp_path):
+    path = str(tmp_path / "lock")
+    context = multiprocessing.get_context("fork")
+    locked, release = context.Event(), context.Event()
+    holder = context.Process(target=hold_lock, args=(path, locked, release))
+    holder.start()
+    assert locked.wait(10)
+
+    with _file_lock(path, blocking=False) as taken:
+        assert not taken
+    release.set()
+    holder.join(10)
+    with _file_lock(path, blocking=False) as taken:
+        assert taken
+
+
+def test_a_torn_tail_is_ignored_then_truncated(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), MODEL, DIM)
+    cache.encode(["Routes map paths."], fake_encode)
+    # A writer crashed after its vector and half its key
+    with open(cache.vectors_path, "ab") as f:
+        f.write(fake_encode(["lost"]).tobytes())
+    with open(cache.keys_path, "ab") as f:
+        f.write(b"\x01" * 7)
+
+    reopened = EmbeddingCache(str(tmp_path), MODEL, DIM)
+    assert len(reopened) == 1
+    reopened.encode(["Forms post fields."], fake_encode)
+
+    assert os.path.getsize(cache.vectors_path) == 2 * 4 * DIM
+    assert os.path.getsize(cache.keys_path) == 2 * 16
+    final = EmbeddingCache(str(tmp_path), MODEL, DIM)
+    np.testing.assert_array_equal(final.encode(["Forms post fields.", "Routes map paths."], CountingEncoder()),
+                                  fake_encode(["Forms post fields.", "Routes map paths."]))
+    assert final.misses == 0
@@ -0,0 +1,67 @@
+import pytest
+from utils.database import FastHTMLDatabase
+from utils.snapshot import export_snapshot
+
+PAGES = {
+    "https://example.org/docs/ref/routes.html": [
+        ("Routes", 1, "Routes map paths to handlers."),
+        ("Route parameters", 2, "Path parameters reach the route handler.")],
+    "https://example.org/docs/tutorials/routes_intro.html": [
+        ("Routes tutorial", 1, "Add routes to handle paths."),
+        ("Route methods", 2, "Routes answer GET and POST.")],
+    # `_` in a url_prefix is matched literally, not as a LIKE wildcard
+    "https://example.org/docs/tutorials/routesXintro.html": [
+        ("Routes again", 1, "Routes handle paths too.")],
+    "https://example.org/docs/explains/routes.html": [
+        ("How routes work", 1, "Routes are matched in order.")],
+}
+QUERY = "routes handle paths"
+
+
+@pytest.fixture(params=["lancedb", "numpy", "snapshot"])
+def searcher(request, db, db_path, tmp_path):
+    for url, sections in PAGES.items():
+        db.store_parsed_document(url, "<document/>", sections[0][0],
+                                 [{"title": title, "level": level, "content": content}
+                                  for title, level, content in sections])
+    if request.param == "numpy":
+        return FastHTMLDatabase(db_path, index_mode="numpy")
+    if request.param == "snapshot":
+        export_snapshot(db, str(tmp_path / "snapshot"))
+        return FastHTMLDatabase(db_path, snapshot_path=str(tmp_path / "snapshot"))
+    return db
+
+
+def urls(hits):
+    return {hit["url"] for hit in hits}
+
+
+def test_category_filter(searcher):
+    hits = searcher.search_similar(QUERY, limit=10, category="tutorials")
+    assert urls(hits) == {"https://example.org/docs/tutorials/routes_intro.html",
+                          "https://example.org/docs/tutorials/routesXintro.html"}
+
+
+def test_url_prefix_filter(searcher):
+    hits = searcher.search_similar(QUERY, limit=10, url_prefix="https://example.org/docs/tutorials/routes_")
+    assert urls(hits) == {"https://example.org/docs/tutorials/routes_intro.html"}
+    assert searcher.search_similar(QUERY, limit=10, url_prefix="https://example.org/docs/it's") == []
+
+
+def test_section_level_filter(searcher):
+    hits = searcher.search_similar(QUERY, limit=10, section_level=2)
+    assert len(hits) == 2 and {hit["section_level"] for hit in hits} == {2}
+    hits = searcher.search_similar(QUERY, limit=10, category="tutorials", section_level=2)
+    assert [hit["section_title"] for hit in hits] == ["Route methods"]
+
+
+def test_indexes_cover_rows_added_after_an_empty_start(db):
+    db.store_parsed_document("https://example.org/docs/ref/routes.html", "<document/>", "Routes",
+                             [{"title": "Routes", "level": 1, "content": "Routes map paths to handlers."}])
+    db.publish()
+    for name, columns in (("fasthtml_docs", {"url", "category"}),
+                          ("fasthtml_chunks", {"id", "doc_id", "url", "category", "section_level"})):
+        table = db.db.open_table(name)
+        indexes = {index.columns[0]: index.name for index in table.list_indices()}
+        assert columns <= set(indexes)
+        assert all(table.index_stats(indexes[column]).num_unindexed_rows == 0 for column in columns)
@@ -0,0 +1,57 @@
+import pytest
+from utils.database import FastHTMLDatabase
+
+DOCS = {
+    "websockets": ("WebSockets and realtime updates", [
+        ("WebSockets", "Open a websocket and push realtime updates to the page."),
+        ("Sessions in websockets", "Sessions and cookies are shared with the websocket handler.")]),
+    "sessions": ("Sessions and cookies", [
+        ("Sessions", "Sessions keep user state in signed cookies."),
+        ("Cookies", "Set cookies on the response to remember the user.")]),
+    "styling": ("Styling with Pico CSS", [
+        ("Pico CSS", "Pico CSS styles semantic HTML without classes.")]),
+}
+
+
+def store_docs(db):
+    ids = {}
+    for name, (title, sections) in DOCS.items():
+        xml = (f"<document><metadata><title>{title}</title></metadata>"
+               + "".join(f"<section title='{section}' level='1'/>" for section, _ in sections) + "</document>")
+        ids[name] = db.store_parsed_document(f"https://example.org/docs/{name}.html", xml, title,
+                                             [{"title": section, "level": 1, "content": content}
+                                              for section, content in sections])
+    return ids
+
+
+@pytest.fixture
+def hierarchical(db_path, monkeypatch):
+    monkeypatch.setenv("FASTRAG_SEARCH_DOCS", "1")
+    db = FastHTMLDatabase(db_path, search_mode="hierarchical")
+    return db, store_docs(db)
+
+
+def test_documents_are_ranked_by_their_outline(hierarchical):
+    db, ids = hierarchical
+    query = db.model.encode("sessions and cookies")
+
+    assert db.search_documents(query, limit=2) == [ids["sessions"], ids["websockets"]]
+    assert db.search_documents(query, limit=2, candidates=[ids["styling"], ids["websockets"]])[0] == ids["websockets"]
+
+
+@pytest.mark.parametrize("index_mode", ["lancedb", "numpy"])
+def test_only_sections_of_the_best_documents_are_searched(hierarchical, db_path, index_mode):
+    db, ids = hierarchical
+    db = FastHTMLDatabase(db_path, index_mode=index_mode, search_mode="hierarchical")
+    flat = FastHTMLDatabase(db_path, index_mode=index_mode)
+
+    hits = db.search_similar("sessions and cookies", limit=3)
+
+    assert {hit["doc_id"] for hit in hits} == {ids["sessions"]}
+    assert ids["websockets"] in {hit["doc_id"] for hit in flat.search_similar("sessions and cookies", limit=3)}
+
+
+def test_filters_narrow_the_document_shortlist(hierarchical):
+    db, ids = hierarchical
+    hits = db.search_similar("sessions and cookies", limit=3, url_prefix="https://example.org/docs/websockets")
+    assert {hit["doc_id"] for hit in hits} == {ids["websockets"]}
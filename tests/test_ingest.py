@@ -0,0 +1,46 @@
+from utils import batch
+from utils.manifest import IngestManifest
+
+URL = "https://example.org/docs/routes.html"
+HTML = b"""<html><body><main id="quarto-document-content">
+<h1>Routes</h1><p>Routes map paths to handler functions.</p>
+<h2>Parameters</h2><p>Path parameters are passed to the handler.</p>
+</main></body></html>"""
+
+
+def no_network(url, *args, **kwargs):
+    raise AssertionError(f"fetched {url}")
+
+
+def test_ingest_resumes_from_fetched_html(db, db_path, monkeypatch):
+    manifest = IngestManifest(db_path)
+    manifest.save_html(URL, HTML)
+    monkeypatch.setattr(batch, "fetch_html", no_network)
+
+    result = batch.process_single_url(db, URL, manifest=manifest)
+
+    assert result["status"] == "processed" and result["resumed_from"] == "fetched"
+    assert manifest.stage(URL) == "stored"
+    assert db.url_exists(URL)
+    assert batch.process_single_url(db, URL, manifest=manifest)["status"] == "cached"
+
+
+def test_ingest_resumes_from_parsed_sections(db, db_path, monkeypatch):
+    manifest = IngestManifest(db_path)
+    manifest.save_parsed(URL, "<document/>", "Routes", [
+        {"title": "Routes", "level": 1, "content": "Routes map paths to handler functions."}])
+    monkeypatch.setattr(batch, "fetch_html", no_network)
+
+    result = batch.process_single_url(db, URL, manifest=manifest)
+
+    assert result["resumed_from"] == "parsed" and result["sections"] == 1
+
+
+def test_unreadable_checkpoint_starts_over(db, db_path, monkeypatch):
+    manifest = IngestManifest(db_path)
+    manifest.mark(URL, "fetched")  # but the page was never saved
+    monkeypatch.setattr(batch, "fetch_html", lambda url: HTML)
+
+    result = batch.process_single_url(db, URL, manifest=manifest)
+
+    assert result["status"] == "processed" and result["resumed_from"] is None
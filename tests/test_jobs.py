@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from utils.jobs import JobStore, jobs_path
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_claim_takes_the_oldest_queued_job(tmp_path):
+    store = JobStore(jobs_path(str(tmp_path)))
+    first = store.submit("ingest_urls", {"urls": ["https://example.org/a"]}, total=1)
+    second = store.submit("ingest_urls", {"urls": ["https://example.org/b"]}, total=1)
+
+    job = store.claim(os.getpid())
+
+    assert job["id"] == first
+    assert job["status"] == "running" and job["worker_pid"] == os.getpid()
+    assert store.claim(os.getpid())["id"] == second
+    assert store.claim(os.getpid()) is None
+
+
+def test_jobs_of_a_dead_worker_are_requeued(tmp_path):
+    store = JobStore(jobs_path(str(tmp_path)))
+    job_id = store.submit("ingest_urls", {"urls": []})
+    store.claim(dead_pid())
+
+    job = store.claim(os.getpid())
+
+    assert job["id"] == job_id
+    assert job["worker_pid"] == os.getpid()
+
+
+def test_cancel(tmp_path):
+    store = JobStore(jobs_path(str(tmp_path)))
+    running = store.submit("ingest_urls", {"urls": []})
+    queued = store.submit("ingest_urls", {"urls": []})
+    store.claim(os.getpid())
+
+    assert store.cancel(queued)
+    assert store.get(queued)["status"] == "cancelled"
+    assert store.events(queued)[-1][1] == {"type": "finished", "status": "cancelled", "error": None}
+    assert store.cancel(running)
+    assert store.get(running)["status"] == "running" and store.cancel_requested(running)
+
+    store.finish(running, "cancelled")
+    assert not store.cancel(running)
@@ -0,0 +1,78 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from utils.metrics import (HTTP_REQUEST_SECONDS, MetricsMiddleware, Registry, Counter, Histogram, counter,
+                           histogram, record_stage, render_prometheus, timer)
+
+
+def test_counter_exposition_and_labels():
+    calls = Counter("test_calls_total", "Calls", labels=("model", "status"))
+    calls.inc(model="haiku", status="ok")
+    calls.inc(2, model="haiku", status="ok")
+    calls.inc(model='say "hi"\n', status="error")
+    calls.inc(model="sonnet")  # a missing label renders empty
+
+    assert calls.value(model="haiku", status="ok") == 3
+    assert calls.render() == [
+        "# HELP test_calls_total Calls",
+        "# TYPE test_calls_total counter",
+        'test_calls_total{model="haiku",status="ok"} 3.0',
+        'test_calls_total{model="say \\"hi\\"\\n",status="error"} 1.0',
+        'test_calls_total{model="sonnet",status=""} 1.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    seconds = Histogram("test_seconds", "Durations", labels=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        seconds.observe(value, stage="search")
+
+    assert seconds.snapshot(stage="search") == {"sum": 3.05, "count": 4}
+    assert seconds.render()[2:] == [
+        'test_seconds_bucket{stage="search",le="0.1"} 1.0',
+        'test_seconds_bucket{stage="search",le="1.0"} 3.0',
+        'test_seconds_bucket{stage="search",le="+Inf"} 4.0',
+        'test_seconds_sum{stage="search"} 3.05',
+        'test_seconds_count{stage="search"} 4.0',
+    ]
+
+
+def test_metrics_are_registered_once_per_name():
+    registry = Registry()
+    first = registry.get_or_create(Counter, "test_once_total", "Once")
+    assert registry.get_or_create(Counter, "test_once_total", "Once") is first
+    with pytest.raises(ValueError):
+        registry.get_or_create(Histogram, "test_once_total", "Once")
+
+    counter("test_registered_total", "Registered").inc()
+    assert "test_registered_total 1.0" in render_prometheus()
+
+
+def test_timer_observes_and_only_records_stages_of_timed_requests():
+    seconds = histogram("test_timer_seconds", "Timed", labels=("op",))
+    with timer(seconds, stage="embed", op="query"):
+        pass
+    record_stage("search", 0.1)  # no request is being timed: dropped
+    assert seconds.snapshot(op="query")["count"] == 1
+
+
+def test_requests_are_labelled_by_route_template():
+    async def job(request):
+        with timer(histogram("test_job_seconds", "Job lookups"), stage="lookup"):
+            return PlainTextResponse(request.path_params["job_id"])
+
+    app = Starlette(routes=[Route("/jobs/{job_id}", job)], middleware=[Middleware(MetricsMiddleware, debug=True)])
+    client = TestClient(app)
+    before = HTTP_REQUEST_SECONDS.snapshot(method="GET", route="/jobs/{job_id}", status=200)["count"]
+
+    response = client.get("/jobs/1")
+    client.get("/jobs/2")
+    client.get("/missing")
+
+    assert HTTP_REQUEST_SECONDS.snapshot(method="GET", route="/jobs/{job_id}", status=200)["count"] == before + 2
+    assert HTTP_REQUEST_SECONDS.snapshot(method="GET", route="<unmatched>", status=404)["count"] >= 1
+    assert response.headers["server-timing"].startswith("lookup;dur=")
+    assert "total;dur=" in response.headers["server-timing"]
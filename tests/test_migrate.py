@@ -0,0 +1,69 @@
+import lancedb
+import pyarrow as pa
+from utils.database import FastHTMLDatabase
+from conftest import DIM
+
+URL = "https://example.org/docs/ref/routes.html"
+XML = "<document><metadata><title>Routes</title></metadata><section title='Routes' level='1'/></document>"
+
+
+def create_old_tables(db_path):
+    """Tables as stored before document vectors, section links and symbols existed"""
+    conn = lancedb.connect(db_path)
+    conn.create_table("fasthtml_docs", data=pa.Table.from_pylist(
+        [{"id": "doc_a", "url": URL, "title": "Routes", "xml_content": XML, "url_hash": "a"}]))
+    vector = pa.list_(pa.float32(), DIM)
+    conn.create_table("fasthtml_chunks", data=pa.Table.from_pylist([
+        {"id": "doc_a_chunk_0", "doc_id": "doc_a", "url": URL, "section_title": "Routes", "section_level": 1,
+         "content": "Decorate handlers with `app.route`.", "vector": [0.1] * DIM},
+        {"id": "doc_a_chunk_1", "doc_id": "doc_a", "url": URL, "section_title": "Parameters", "section_level": 2,
+         "content": "Path parameters reach the handler.", "vector": [0.2] * DIM},
+    ], schema=pa.schema([("id", pa.string()), ("doc_id", pa.string()), ("url", pa.string()),
+                         ("section_title", pa.string()), ("section_level", pa.int32()),
+                         ("content", pa.string()), ("vector", vector)])))
+
+
+def versions(db):
+    return db.db.open_table("fasthtml_docs").version, db.db.open_table("fasthtml_chunks").version
+
+
+def test_readers_leave_old_tables_alone(db_path, capsys):
+    create_old_tables(db_path)
+    before = versions(FastHTMLDatabase(db_path, pinned=True))
+
+    reader = FastHTMLDatabase(db_path, pinned=True)
+
+    assert versions(reader) == before
+    assert "fasthtml_chunks.parent_index" in reader.pending_migrations()
+    assert "utils.publish migrate" in capsys.readouterr().out
+
+
+def test_readers_filter_categories_before_migration(db_path):
+    create_old_tables(db_path)
+    reader = FastHTMLDatabase(db_path, pinned=True)
+
+    assert "fasthtml_chunks.category" in reader.pending_migrations()
+    assert {hit["id"] for hit in reader.search_similar("handlers", limit=5, category="ref")} == {
+        "doc_a_chunk_0", "doc_a_chunk_1"}
+    assert reader.search_similar("handlers", limit=5, category="api") == []
+
+
+def test_writers_migrate_and_publish(db_path):
+    create_old_tables(db_path)
+    writer = FastHTMLDatabase(db_path)
+    writer.publish()
+    reader = FastHTMLDatabase(db_path, pinned=True)
+
+    added = writer.migrate()
+
+    assert {"fasthtml_docs.vector", "fasthtml_docs.category", "fasthtml_chunks.symbols",
+            "fasthtml_chunks.category"} <= set(added)
+    assert writer.pending_migrations() == [] and writer.migrate() == []
+    # The migrated versions are published, so pinned readers move to them
+    assert reader.pending_migrations() == []
+    rows = sorted(reader.chunks_table.search().select(["id", "parent_index", "symbols"]).limit(None).to_list(),
+                  key=lambda row: row["id"])
+    assert [row["parent_index"] for row in rows] == [-1, 0]
+    assert rows[0]["symbols"] == ["app.route"]
+    assert {"doc_id", "id", "section_level", "category"} <= {column for index in writer.chunks_table.list_indices()
+                                                  for column in index.columns}
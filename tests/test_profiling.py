@@ -0,0 +1,34 @@
+import os
+from utils.profiling import is_enabled, list_profiles, profile_path, profile_summary, profiled
+
+
+def work():
+    return sum(i * i for i in range(1000))
+
+
+def test_disabled_profiling_writes_nothing(tmp_path):
+    profile_dir = str(tmp_path / "profiles")
+    with profiled("how do routes work", "query", enabled=False, profile_dir=profile_dir):
+        work()
+    assert not os.path.exists(profile_dir) and list_profiles(profile_dir) == []
+    assert is_enabled("query", requested=True)
+
+
+def test_captures_are_written_and_listed(tmp_path):
+    profile_dir = str(tmp_path / "profiles")
+    with profiled("https://example.org/docs/a", "ingest", enabled=True, profile_dir=profile_dir):
+        work()
+
+    [capture] = list_profiles(profile_dir)
+    assert capture["kind"] == "ingest" and capture["label"] == "https://example.org/docs/a"
+    assert capture["name"].endswith("-ingest-https-example-org-docs-a") and capture["seconds"] >= 0
+    assert profile_path(capture["name"], profile_dir).endswith(".prof")
+    assert "work" in profile_summary(capture["name"], profile_dir=profile_dir)
+
+
+def test_unknown_or_unsafe_names_are_not_served(tmp_path):
+    profile_dir = str(tmp_path)
+    (tmp_path / "secret.prof").write_text("")
+    assert profile_path("missing", profile_dir) is None
+    assert profile_path("../secret", profile_dir) is None
+    assert profile_summary("missing", profile_dir=profile_dir) is None
@@ -0,0 +1,59 @@
+import os
+from utils.database import FastHTMLDatabase
+
+
+def store(db, name):
+    db.store_parsed_document(f"https://example.org/{name}", "<document/>", name,
+                             [{"title": name, "level": 1, "content": f"{name} page about routes"}])
+
+
+def test_pinned_reads_only_see_published_versions(db, db_path, monkeypatch):
+    monkeypatch.setenv("FASTRAG_READ_CONSISTENCY_SECONDS", "0")
+    store(db, "first")
+    db.publish()
+    app = FastHTMLDatabase(db_path, pinned=True)
+    assert app.chunks_table.count_rows() == 1
+
+    store(db, "second")
+    assert app.chunks_table.count_rows() == 1
+    assert not app.url_exists("https://example.org/second")
+
+    db.publish()
+    assert app.chunks_table.count_rows() == 2
+    assert app.url_exists("https://example.org/second")
+
+
+def test_published_versions_are_the_latest(db, monkeypatch):
+    monkeypatch.setenv("FASTRAG_VERSION_GRACE_SECONDS", "0")
+    for name in ("first", "second", "third"):
+        store(db, name)
+        record = db.publish()
+        docs = db.db.open_table(f"{db.corpus}_docs")
+        chunks = db.db.open_table(f"{db.corpus}_chunks")
+        # Pruning compacts the tables before the pointer is written
+        assert (record["docs_version"], record["chunks_version"]) == (docs.version, chunks.version)
+    assert db.publish() == record
+
+
+def test_numpy_index_keeps_caches_newer_than_the_published_version(db_path, monkeypatch):
+    monkeypatch.setenv("FASTRAG_INDEX_MODE", "numpy")
+    monkeypatch.setenv("FASTRAG_READ_CONSISTENCY_SECONDS", "0")
+    writer = FastHTMLDatabase(db_path)
+    store(writer, "first")
+    writer.publish()
+    app = FastHTMLDatabase(db_path, pinned=True)
+    app.vector_index.load()
+
+    store(writer, "second")  # not published: a process reading the latest version builds its own cache
+    writer.vector_index.table = writer.db.open_table(f"{writer.corpus}_chunks")
+    writer.vector_index.load()
+    cache_dir = writer.corpus_path("_numpy_index")
+    assert len(os.listdir(cache_dir)) == 2
+
+    app.vector_index.load()  # the pinned process reloading its version removes nothing
+    assert len(os.listdir(cache_dir)) == 2
+
+    published = writer.publish()["chunks_version"]
+    app.search_similar("routes", limit=1)  # moves the app, and its index, to the new publication
+    assert app.vector_index.version == published
+    assert os.listdir(cache_dir) == [f"{writer.corpus}_chunks_v{published}_float32.npy"]
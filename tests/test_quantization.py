@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from utils.quantization import quantize, dequantize, binary_codes, hamming_distances
+from utils.vector_index import QuantizedMatrix, normalize_rows
+
+
+@pytest.fixture
+def matrix():
+    return normalize_rows(np.random.default_rng(0).standard_normal((500, 32)))
+
+
+def test_int8_round_trip_error_is_small(matrix):
+    codes, scales = quantize(matrix, "int8")
+    assert codes.dtype == np.int8 and scales.shape == (32,)
+    assert np.abs(dequantize(codes, scales) - matrix).max() <= scales.max() / 2 + 1e-6
+
+
+def test_hamming_distances():
+    codes = binary_codes(np.array([[1, -1, 1, -1], [-1, -1, -1, -1]], dtype=np.float32))
+    query = binary_codes(np.array([[1, -1, 1, -1]], dtype=np.float32))[0]
+    assert hamming_distances(codes, query).tolist() == [0, 2]
+
+
+@pytest.mark.parametrize("dtype, binary", [("float32", False), ("float16", False), ("int8", False),
+                                           ("float32", True), ("int8", True)])
+def test_search_finds_the_nearest_rows(tmp_path, matrix, dtype, binary):
+    prefix = str(tmp_path / "vectors")
+    QuantizedMatrix.build(matrix, dtype, binary).save(prefix)
+    index = QuantizedMatrix.load(prefix, binary=binary)
+    query = normalize_rows(matrix[7:8] + 0.05 * np.random.default_rng(1).standard_normal((1, 32)))[0]
+
+    rows, scores = index.search(query, 5)
+
+    assert rows[0] == 7
+    assert np.all(np.diff(scores) <= 1e-6)
+    assert np.allclose(scores, matrix[rows] @ query, atol=0.02)
+    assert set(index.search_rows(query, np.arange(100, 200), 3)[0]) <= set(range(100, 200))
+
+
+def test_float16_is_upcast_once(matrix):
+    index = QuantizedMatrix.build(matrix, "float16")
+    assert index.search_nbytes == index.nbytes
+    query = matrix[3]
+
+    rows, scores = index.search(query, 3)
+    copy = index._float32
+
+    assert rows[0] == 3 and copy.dtype == np.float32
+    assert index.search_nbytes == index.nbytes + matrix.astype(np.float32).nbytes
+    index.search_rows(query, np.arange(10), 2)
+    assert index._float32 is copy
@@ -0,0 +1,69 @@
+import json
+import pytest
+from utils.routing import ModelRouter, query_features
+
+CLOSE = [{"_distance": 0.4}]  # cosine similarity 0.8
+FAR = [{"_distance": 1.2}]  # cosine similarity 0.4
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.delenv("FASTRAG_ROUTING_POLICY", raising=False)
+    return ModelRouter()
+
+
+def test_query_features():
+    features = query_features("Show me how to add a route", CLOSE)
+    assert features == {"words": 7, "wants_code": True, "top_similarity": pytest.approx(0.8), "mode": "rag"}
+    assert query_features("how do routes work")["mode"] == "no_rag"
+    assert query_features("routes", [{"_distance": None}])["top_similarity"] is None
+
+
+def test_default_policy(router):
+    assert router.route("Write an example app with a form", CLOSE)["route"] == "code"
+    assert router.route("How do routes work?", CLOSE)["route"] == "quick"
+    # Too far from the docs, too long, or without retrieved context: the standard model
+    assert router.route("How do routes work?", FAR)["route"] == "standard"
+    assert router.route("How do routes work? " * 5, CLOSE)["route"] == "standard"
+    assert router.route("How do routes work?")["route"] == "standard"
+
+    decision = router.route("How do routes work?", CLOSE)
+    assert decision["model"] == "claude-3-5-haiku-20241022" and decision["max_tokens"] == 600
+    assert router.estimate_cost(decision["model"], 1_000_000, 0) == pytest.approx(0.8)
+    assert router.estimate_cost("unpriced-model", 10, 10) is None
+
+
+def write_policy(tmp_path, policy):
+    path = tmp_path / "policy.json"
+    path.write_text(json.dumps(policy))
+    return str(path)
+
+
+def test_policy_file_overrides_the_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("FASTRAG_ROUTING_POLICY", write_policy(tmp_path, {
+        "routes": {"quick": {"model": "claude-small", "max_tokens": 300}},
+        "rules": [{"route": "quick", "when": {"max_words": 3}}],
+        "prices": {"claude-small": {"input": 1.0, "output": 2.0}}}))
+    router = ModelRouter()
+
+    assert router.route("routes?", FAR) == {"route": "quick", "model": "claude-small", "max_tokens": 300,
+                                            "features": query_features("routes?", FAR)}
+    # Routes and prices not overridden are kept; the rules are replaced
+    assert router.route("Write an example app", CLOSE)["route"] == "standard"
+    assert router.policy["routes"]["code"]["max_tokens"] == 3000
+    assert router.estimate_cost("claude-small", 1_000_000, 1_000_000) == pytest.approx(3.0)
+
+
+@pytest.mark.parametrize("policy", [
+    {"default": "missing"},
+    {"rules": [{"route": "missing"}]},
+])
+def test_policies_naming_unknown_routes_are_rejected(tmp_path, policy):
+    with pytest.raises(ValueError):
+        ModelRouter(write_policy(tmp_path, policy))
+
+
+def test_unknown_conditions_are_rejected(tmp_path):
+    router = ModelRouter(write_policy(tmp_path, {"rules": [{"route": "quick", "when": {"max_tokens": 5}}]}))
+    with pytest.raises(ValueError):
+        router.route("How do routes work?")
@@ -0,0 +1,57 @@
+import pytest
+from utils.scraper import section_parents
+
+
+def rows(db):
+    return sorted(db.chunks_table.search().select(["id", "section_index", "parent_index"]).limit(None).to_list(),
+                  key=lambda row: row["section_index"])
+
+
+def test_section_parents():
+    levels = [1, 2, 3, 2, 1, 3]
+    assert section_parents([{"level": level} for level in levels]) == [-1, 0, 1, 0, -1, 4]
+
+
+@pytest.mark.parametrize("dedupe", ["off", "skip"])
+def test_parents_skip_sections_dropped_as_duplicates(db_path, monkeypatch, dedupe):
+    monkeypatch.setenv("FASTRAG_DEDUPE", dedupe)
+    from utils.database import FastHTMLDatabase
+    db = FastHTMLDatabase(db_path)
+    repeated = "shared boilerplate text that appears on every single page of the docs site verbatim"
+    db.store_parsed_document("https://example.org/a", "<document/>", "A", [
+        {"title": "Intro", "level": 1, "content": "first page introduction"},
+        {"title": "Shared", "level": 2, "content": repeated}])
+    db.store_parsed_document("https://example.org/b", "<document/>", "B", [
+        {"title": "Guide", "level": 1, "content": "second page guide"},
+        {"title": "Shared", "level": 2, "content": repeated},
+        {"title": "Detail", "level": 3, "content": "detail below the shared section"}])
+
+    stored = [row for row in rows(db) if row["section_index"] == 2]
+    assert len(stored) == 1
+    assert stored[0]["parent_index"] == (1 if dedupe == "off" else 0)
+
+
+GUIDE = [("Guide", 1, "Start here."), ("Routes", 2, "Routes map paths to handlers."),
+         ("Parameters", 3, "Path parameters reach the handler."), ("Styling", 2, "Pico CSS is included.")]
+
+
+@pytest.mark.parametrize("backend", ["lancedb", "snapshot"])
+def test_hits_carry_their_neighbouring_sections(db, db_path, tmp_path, backend):
+    from utils.database import FastHTMLDatabase
+    from utils.snapshot import export_snapshot
+    db.store_parsed_document("https://example.org/docs/guide.html", "<document/>", "Guide",
+                             [{"title": title, "level": level, "content": content} for title, level, content in GUIDE])
+    if backend == "snapshot":
+        export_snapshot(db, str(tmp_path / "snapshot"))
+        db = FastHTMLDatabase(db_path, snapshot_path=str(tmp_path / "snapshot"))
+
+    hits = db.search_similar("handlers", limit=4, expand=["parent", "prev", "next", "children"])
+    context = {hit["section_title"]: {relation: [row["section_title"] for row in value] if isinstance(value, list)
+                                      else value and value["section_title"]
+                                      for relation, value in hit["context"].items()}
+               for hit in hits}
+
+    assert context["Routes"] == {"parent": "Guide", "prev": "Guide", "next": "Parameters", "children": ["Parameters"]}
+    assert context["Guide"] == {"parent": None, "prev": None, "next": "Routes", "children": ["Routes", "Styling"]}
+    assert context["Parameters"] == {"parent": "Routes", "prev": "Routes", "next": "Styling", "children": []}
+    assert context["Styling"] == {"parent": "Guide", "prev": "Parameters", "next": None, "children": []}
@@ -0,0 +1,50 @@
+import pytest
+from utils.database import FastHTMLDatabase
+
+CORPORA = {
+    "fasthtml": ["Routes map paths to handlers.", "Forms post their fields to a route.",
+                 "Sessions keep state in cookies."],
+    "guides": ["Deploy routes behind a proxy.", "Routes can return any component.",
+               "Styling uses Pico CSS."],
+}
+QUERY = "routes map paths"
+
+
+def store(db, texts, name="page"):
+    db.store_parsed_document(f"https://example.org/{db.corpus}/{name}", "<document/>", name,
+                             [{"title": f"Section {i}", "level": 1, "content": text} for i, text in enumerate(texts)])
+
+
+@pytest.fixture
+def databases(db_path, monkeypatch):
+    monkeypatch.setenv("FASTRAG_READ_CONSISTENCY_SECONDS", "0")
+    monkeypatch.setenv("FASTRAG_SEARCH_CORPORA", "fasthtml,guides")
+    databases = {corpus: FastHTMLDatabase(db_path, corpus=corpus) for corpus in CORPORA}
+    for corpus, texts in CORPORA.items():
+        store(databases[corpus], texts)
+    return databases
+
+
+def test_merged_hits_are_the_global_top_k(databases):
+    db = databases["fasthtml"]
+    single = [dict(hit, corpus=corpus) for corpus in CORPORA
+              for hit in db.search_similar(QUERY, limit=10, corpora=[corpus], expand=[])]
+    expected = sorted(single, key=lambda hit: hit["_distance"])[:3]
+
+    hits = db.search_similar(QUERY, limit=3, expand=[])
+
+    assert [(hit["corpus"], hit["id"]) for hit in hits] == [(hit["corpus"], hit["id"]) for hit in expected]
+    assert [hit["_distance"] for hit in hits] == sorted(hit["_distance"] for hit in hits)
+    assert {hit["corpus"] for hit in hits} == set(CORPORA)  # both corpora have a top hit
+
+
+def test_corpus_version_changes_with_any_searched_corpus(databases):
+    db = databases["fasthtml"]
+    before = db.corpus_version()
+    assert before.startswith("fasthtml:") and "+guides:" in before
+
+    store(databases["guides"], ["Routes are matched in order."], name="more")
+    after_guides = db.corpus_version()
+    store(databases["fasthtml"], ["Route parameters reach the handler."], name="more")
+
+    assert len({before, after_guides, db.corpus_version()}) == 3
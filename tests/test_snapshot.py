@@ -0,0 +1,53 @@
+import os
+from utils.snapshot import ChunkSnapshot, export_snapshot, import_snapshot
+
+
+def store_guide(db):
+    db.store_parsed_document("https://example.org/guide", "<document/>", "Guide", [
+        {"title": "Guide", "level": 1, "content": "Start here with `fast_app`.", "symbols": ["fast_app"]},
+        {"title": "Routes", "level": 2, "content": "Routes map paths to handlers."},
+        {"title": "Parameters", "level": 3, "content": "Path parameters reach the handler."},
+        {"title": "Styling", "level": 2, "content": "Pico CSS is included by default."}])
+
+
+def test_export_round_trip(db, tmp_path):
+    store_guide(db)
+    out = str(tmp_path / "snapshot")
+    manifest = export_snapshot(db, out, dtype="int8")
+    snapshot = ChunkSnapshot(out, binary=False)
+
+    rows = [snapshot.row(i) for i in range(len(snapshot))]
+    assert manifest["count"] == len(rows) == 4
+    assert [(r["section_title"], r["section_index"], r["parent_index"]) for r in rows] == [
+        ("Guide", 0, -1), ("Routes", 1, 0), ("Parameters", 2, 1), ("Styling", 3, 0)]
+    assert rows[0]["symbols"] == ["fast_app"]
+
+    embedding = db.model.encode("Path parameters reach the handler.")
+    assert snapshot.search(embedding, limit=1)[0]["section_title"] == "Parameters"
+    assert snapshot.search(embedding, limit=5, section_level=2)[0]["section_level"] == 2
+    snapshot.close()
+
+
+def test_snapshots_without_section_links_work_them_out(db, tmp_path):
+    store_guide(db)
+    out = str(tmp_path / "snapshot")
+    export_snapshot(db, out)
+    with_links = ChunkSnapshot(out)
+    expected = [with_links.row(i) for i in range(len(with_links))]
+    with_links.close()
+
+    os.remove(os.path.join(out, "sections.npy"))
+    old = ChunkSnapshot(out)
+    assert [old.row(i) for i in range(len(old))] == expected
+    old.close()
+
+
+def test_import_restores_the_chunks(db, db_path, tmp_path):
+    from utils.database import FastHTMLDatabase
+    store_guide(db)
+    out = str(tmp_path / "snapshot")
+    export_snapshot(db, out)
+
+    rebuilt = FastHTMLDatabase(str(tmp_path / "rebuilt"))
+    assert import_snapshot(rebuilt, out) == 4
+    assert sorted(rebuilt.chunks_table.to_arrow().column("parent_index").to_pylist()) == [-1, 0, 0, 1]
@@ -0,0 +1,54 @@
+import asyncio
+from utils.sse import until_disconnected
+
+
+class FakeRequest:
+    """ASGI receive() that reports a disconnect once `gone` is set"""
+
+    def __init__(self):
+        self.gone = asyncio.Event()
+
+    async def receive(self):
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+
+async def upstream(log):
+    try:
+        yield "first"
+        await asyncio.sleep(60)  # a slow token
+        yield "second"
+    except asyncio.CancelledError:
+        log.append("cancelled")
+        raise
+    finally:
+        log.append("closed")
+
+
+def test_disconnect_cancels_the_pending_upstream_read():
+    async def run():
+        request, log = FakeRequest(), []
+        relay = until_disconnected(request, upstream(log))
+        assert await anext(relay) == "first"
+        pending = asyncio.ensure_future(anext(relay))
+        await asyncio.sleep(0.01)
+        request.gone.set()
+        try:
+            await asyncio.wait_for(pending, 1)
+        except StopAsyncIteration:
+            pass
+        await asyncio.sleep(0.01)
+        return log
+
+    assert asyncio.run(run()) == ["cancelled", "closed"]
+
+
+def test_sources_that_finish_are_relayed_in_full():
+    async def numbers():
+        for i in range(3):
+            yield i
+
+    async def run():
+        return [item async for item in until_disconnected(FakeRequest(), numbers())]
+
+    assert asyncio.run(run()) == [0, 1, 2]
@@ -0,0 +1,57 @@
+from utils.symbols import SymbolIndex, code_symbols, content_symbols, inline_symbols, query_symbols
+
+EXAMPLE = """from fasthtml.common import *
+
+app, rt = fast_app(live=True)
+
+@rt("/")
+def get(name: str):
+    return Div(P(name), hx_swap_oob="true", id="greeting")
+"""
+
+
+def test_code_symbols():
+    symbols = code_symbols(EXAMPLE)
+    assert {"fast_app", "live", "rt", "get", "Div", "P", "hx_swap_oob"} <= set(symbols)
+    assert not {"str", "id"} & set(symbols)  # builtins and generic attributes are left out
+    assert {"app.route", "serve"} <= set(code_symbols("app.route('/x')\n%timeit serve("))
+
+
+def test_inline_and_content_symbols():
+    assert inline_symbols("app.route()") == ["app.route"]
+    content = "Set `hx_swap_oob` on any component.\n\n```python\nTitled('Hi', cls='x')\n```"
+    assert content_symbols(content) == ["Titled", "hx_swap_oob"]
+
+
+def test_query_symbols_only_keep_code_like_words():
+    assert query_symbols("What does `hx_swap_oob` do?") == ["hx_swap_oob"]
+    assert query_symbols("how do I call fast_app() with FastHTML") == ["fast_app", "FastHTML"]
+    assert query_symbols("how do routes work") == []
+
+
+def test_lookup_ranks_by_symbols_matched_and_filters():
+    index = SymbolIndex(["a_chunk_0", "a_chunk_1", "b_chunk_0"], ["a", "a", "b"], [1, 2, 2],
+                        [["fast_app", "app.route"], ["fast_app"], ["app.route", "serve"]])
+
+    rows, counts = index.lookup(["fast_app", "route"])
+    assert rows.tolist()[0] == 0 and counts.tolist() == [2, 1, 1]
+    assert index.lookup(["serve"], doc_ids=["a"])[0].tolist() == []
+    assert index.lookup(["fast_app"], section_level=2)[0].tolist() == [1]
+    assert index.known(["app.route", "other.route", "missing"]) == ["app.route", "route"]
+
+
+def test_exact_symbol_hits_have_no_distance(db_path, monkeypatch):
+    monkeypatch.setenv("FASTRAG_SYMBOL_SEARCH", "exact")
+    from utils.database import FastHTMLDatabase
+    from utils.routing import query_features
+    db = FastHTMLDatabase(db_path)
+    db.store_parsed_document("https://example.org/a", "<document/>", "A", [
+        {"title": "OOB swaps", "level": 1, "content": "Use `hx_swap_oob` to swap out of band.",
+         "symbols": ["hx_swap_oob"]},
+        {"title": "Routes", "level": 1, "content": "Routes map paths to handlers."}])
+
+    hits = db.search_similar("what does `hx_swap_oob` do", limit=3)
+
+    assert [hit["section_title"] for hit in hits] == ["OOB swaps"]
+    assert hits[0]["_distance"] is None and hits[0]["symbols_matched"] == 1
+    assert query_features("what does `hx_swap_oob` do", hits)["top_similarity"] is None
@@ -0,0 +1,148 @@
+"""Admission control for upstream (Claude) calls.
+
+`AdmissionController` caps how many calls run at once. Callers beyond the cap
+wait in a bounded FIFO queue; when the queue is full, or a caller has waited
+longer than `queue_timeout`, `AdmissionRejected` is raised so the request can
+fail fast instead of piling onto an overloaded upstream. Sync (thread) and
+async callers share the same slots.
+
+`backoff_delay` gives full-jitter exponential delays for retrying rate-limit
+and overload responses.
+"""
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+from utils.metrics import gauge, histogram, counter
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call cannot be admitted (queue full or wait timed out)"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.state = "waiting"  # -> granted | cancelled, changed under the controller lock
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        self.state = "granted"
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue, shared by threads and coroutines"""
+
+    def __init__(self, name: str, max_concurrent: int = 4, max_queue: int = 32, queue_timeout: float = 30.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+
+        self._in_flight = gauge("fastrag_admission_in_flight", "Admitted calls currently running", labels=("name",))
+        self._queue_depth = gauge("fastrag_admission_queue_depth", "Calls waiting for a slot", labels=("name",))
+        self._wait_seconds = histogram("fastrag_admission_wait_seconds", "Time spent queued before admission",
+                                       labels=("name",))
+        self._rejected = counter("fastrag_admission_rejected_total", "Calls refused admission",
+                                 labels=("name", "reason"))
+
+    def _update_gauges(self):
+        self._in_flight.set(self._active, name=self.name)
+        self._queue_depth.set(len(self._waiters), name=self.name)
+
+    def _enter(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """Take a free slot (returns None) or join the queue (returns the waiter)"""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self._update_gauges()
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._rejected.inc(name=self.name, reason="queue_full")
+                raise AdmissionRejected("Too many requests in progress, please try again shortly", "queue_full")
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            self._update_gauges()
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue; False if a slot was handed over in the meantime"""
+        with self._lock:
+            if waiter.state == "granted":
+                return False
+            waiter.state = "cancelled"
+            self._waiters.remove(waiter)
+            self._update_gauges()
+            return True
+
+    def release(self):
+        with self._lock:
+            # Hand the slot straight to the next waiter so it can't be overtaken
+            if self._waiters:
+                self._waiters.popleft().wake()
+            else:
+                self._active -= 1
+            self._update_gauges()
+
+    def _timed_out(self):
+        self._rejected.inc(name=self.name, reason="timeout")
+        return AdmissionRejected("Timed out waiting for capacity, please try again shortly", "timeout")
+
+    @contextmanager
+    def slot(self):
+        """Hold one slot for the duration of a blocking call"""
+        start = time.perf_counter()
+        waiter = self._enter()
+        if waiter is not None and not waiter.event.wait(self.queue_timeout) and self._abandon(waiter):
+            raise self._timed_out()
+        self._wait_seconds.observe(time.perf_counter() - start, name=self.name)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Hold one slot for the duration of an async call"""
+        start = time.perf_counter()
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    raise self._timed_out()
+            except asyncio.CancelledError:
+                if not self._abandon(waiter):
+                    self.release()
+                raise
+        self._wait_seconds.observe(time.perf_counter() - start, name=self.name)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff; a server-provided Retry-After wins when longer"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    return max(delay, min(retry_after, cap)) if retry_after else delay
@@ -0,0 +1,329 @@
+"""Precomputed answers for hot questions.
+
+The home page's sample questions are asked far more often than anything else,
+yet each click paid for a search and a full Claude generation. `AnswerCache`
+keeps, for every hot question, its search results plus the RAG and no-RAG
+answers, tagged with the corpus version they were computed against, in a JSON
+file next to the LanceDB tables. `replay_answer` plays a stored answer back
+as a stream so the SSE endpoints serve it without calling Claude.
+
+Entries from an older corpus version are never served. `refresh_in_background`
+recomputes them in a worker thread. The app never starts one from a request:
+it calls `refresh_if_stale` when an ingestion job finishes, and `watch` checks
+for newly published versions every FASTRAG_ANSWER_CACHE_CHECK_SECONDS. A
+warm-up that fails for a corpus version is retried with exponential backoff
+(FASTRAG_ANSWER_CACHE_BACKOFF_SECONDS, doubling up to an hour), so a bad API
+key or an outage doesn't keep spending Claude calls.
+
+Several app processes share one cache: a warm-up runs under a file lock next
+to answers.json and is skipped while another process holds it, failures are
+recorded in failures.json, and every process reloads both files when they
+change.
+
+The hot list defaults to SAMPLE_QUESTIONS; point FASTRAG_HOT_QUERIES at a JSON
+list (or a text file with one question per line) to change it.
+
+Usage: python -m utils.answer_cache [--force] [--queries hot.json]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+from utils.coalesce import normalize_query, answer_key
+from utils.embedding_cache import _file_lock
+from utils.metrics import counter
+
+SAMPLE_QUESTIONS = [
+    "How do I implement WebSocket real-time communication in FastHTML?",
+    "What's the best way to integrate Alpine.js for client-side reactivity?",
+    "How can I handle file uploads and image processing with FastHTML?",
+    "How do I implement JWT authentication and session management?",
+    "What's the recommended approach for database integration and ORM usage?",
+    "How can I build a responsive SPA with FastHTML and modern CSS frameworks?",
+]
+
+ANSWER_CACHE_LOOKUPS = counter("fastrag_answer_cache_lookups_total", "Precomputed answer cache lookups",
+                               labels=("kind", "result"))
+ANSWER_CACHE_WARMED = counter("fastrag_answer_cache_warmed_total", "Hot questions recomputed by warm-ups",
+                              labels=("status",))
+
+# Characters per replayed chunk: large enough to arrive at once, small enough to render progressively
+REPLAY_CHUNK_CHARS = 200
+# Longest wait before retrying a corpus version whose warm-up failed
+MAX_BACKOFF_SECONDS = 3600
+
+
+def load_hot_queries(path: Optional[str] = None) -> List[str]:
+    """Hot questions from `path` (or FASTRAG_HOT_QUERIES), else SAMPLE_QUESTIONS"""
+    path = path or os.getenv("FASTRAG_HOT_QUERIES")
+    if not path:
+        return list(SAMPLE_QUESTIONS)
+    with open(path) as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return [q for q in json.loads(text) if q.strip()]
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def _plain(result: Dict[str, Any]) -> Dict[str, Any]:
+    """A search result without its vector, with numpy scalars turned into JSON numbers"""
+    return {k: v.item() if hasattr(v, "item") else v for k, v in result.items() if k != "vector"}
+
+
+async def replay_answer(cached: Dict[str, Any]) -> AsyncIterator:
+    """Stream a stored answer like `generate_answer_streaming(..., include_stats=True)` would"""
+    text = cached["text"]
+    position = 0
+    while position < len(text):
+        end = text.find(" ", position + REPLAY_CHUNK_CHARS)
+        end = len(text) if end == -1 else end
+        yield text[position:end]
+        position = end
+        await asyncio.sleep(0)
+    yield {**(cached.get("stats") or {}), "cached": True, "computed_at": cached.get("computed_at")}
+
+
+class AnswerCache:
+    """Search results and answers for hot questions, valid for one corpus version"""
+
+    def __init__(self, db, claude, path: Optional[str] = None, queries: Optional[List[str]] = None,
+                 limit: int = 5):
+        self.db = db
+        self.claude = claude
+        self.path = path or os.path.join(db.db_path, "_answer_cache", "answers.json")
+        self.failures_path = os.path.join(os.path.dirname(self.path), "failures.json")
+        self.lock_path = os.path.join(os.path.dirname(self.path), "lock")
+        self.queries = queries if queries is not None else load_hot_queries()
+        self._hot = {normalize_query(q) for q in self.queries}
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._warming = threading.Lock()
+        # corpus version -> (failed warm-ups in a row, time.time() before which none is retried)
+        self.failures: Dict[str, tuple] = {}
+        self.backoff = float(os.getenv("FASTRAG_ANSWER_CACHE_BACKOFF_SECONDS", "60"))
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._answers: Dict[str, Dict[str, Any]] = {}
+        self._loaded = None
+        self.reload()
+
+    def _file_ids(self) -> tuple:
+        ids = []
+        for path in (self.path, self.failures_path):
+            try:
+                stat = os.stat(path)
+                ids.append((stat.st_ino, stat.st_mtime_ns))
+            except FileNotFoundError:
+                ids.append(None)
+        return tuple(ids)
+
+    def reload(self):
+        """Read answers.json and failures.json again if another process replaced them"""
+        file_ids = self._file_ids()
+        if file_ids == self._loaded:
+            return
+        entries, failures = {}, {}
+        if file_ids[0] is not None:
+            with open(self.path) as f:
+                entries = json.load(f)
+        if file_ids[1] is not None:
+            with open(self.failures_path) as f:
+                failures = {version: tuple(failure) for version, failure in json.load(f).items()}
+        with self._lock:
+            self._index(entries)
+            self.failures = failures
+            self._loaded = file_ids
+
+    def _index(self, entries: Dict[str, Dict[str, Any]]):
+        answers = {}
+        for entry in entries.values():
+            for key, cached in entry.get("answers", {}).items():
+                answers[key] = {**cached, "corpus_version": entry["corpus_version"]}
+        self.entries, self._answers = entries, answers
+
+    @staticmethod
+    def _write(path: str, data: Dict[str, Any]):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _store(self, normalized: str, entry: Dict[str, Any]):
+        """Add one entry; only called by `warm`, which holds the file lock"""
+        with self._lock:
+            entries = {**self.entries, normalized: entry}
+            self._write(self.path, entries)
+            self._index(entries)
+            self._loaded = self._file_ids()
+
+    def is_hot(self, query: str) -> bool:
+        return normalize_query(query) in self._hot
+
+    def search(self, query: str) -> Optional[List[Dict]]:
+        """Stored search results for a hot question, or None if missing or computed on an older corpus"""
+        if not self.is_hot(query):
+            return None
+        self.reload()
+        entry = self.entries.get(normalize_query(query))
+        if entry is None or entry["corpus_version"] != self.db.corpus_version():
+            ANSWER_CACHE_LOOKUPS.inc(kind="search", result="miss" if entry is None else "stale")
+            return None
+        ANSWER_CACHE_LOOKUPS.inc(kind="search", result="hit")
+        return entry["results"]
+
+    def answer(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored answer for an `answer_key`, if it was computed on the current corpus"""
+        self.reload()
+        cached = self._answers.get(key)
+        if cached is None:
+            return None
+        if cached["corpus_version"] != self.db.corpus_version():
+            ANSWER_CACHE_LOOKUPS.inc(kind="answer", result="stale")
+            return None
+        ANSWER_CACHE_LOOKUPS.inc(kind="answer", result="hit")
+        return cached
+
+    def _needs_warming(self, entry: Optional[Dict[str, Any]], version: str) -> bool:
+        if entry is None or entry["corpus_version"] != version:
+            return True
+        # Answers are retried only when Claude is configured
+        return self.claude.is_available() and len(entry.get("answers", {})) < 2
+
+    def stale_queries(self) -> List[str]:
+        self.reload()
+        version = self.db.corpus_version()
+        return [q for q in self.queries if self._needs_warming(self.entries.get(normalize_query(q)), version)]
+
+    def warm(self, force: bool = False) -> Optional[Dict[str, int]]:
+        """Recompute hot questions that are missing or stale (all of them with `force`).
+
+        Returns per-status counts, or None if another warm-up, in this process or
+        another one, is already running.
+        """
+        if not self._warming.acquire(blocking=False):
+            return None
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with _file_lock(self.lock_path, blocking=False) as locked:
+                if not locked:
+                    return None
+                # Entries another process warmed since our last look are fresh, not stale
+                self.reload()
+                counts = {"warmed": 0, "fresh": 0, "no_results": 0, "failed": 0}
+                start_version = self.db.corpus_version()
+                for query in self.queries:
+                    # Read the version first so a concurrent ingestion leaves the entry stale, not wrong
+                    version = self.db.corpus_version()
+                    if not force and not self._needs_warming(self.entries.get(normalize_query(query)), version):
+                        counts["fresh"] += 1
+                        continue
+                    status = self._warm_one(query, version)
+                    ANSWER_CACHE_WARMED.inc(status=status)
+                    counts[status] += 1
+                self._record_outcome(start_version, counts["failed"] > 0)
+                return counts
+        finally:
+            self._warming.release()
+
+    def _record_outcome(self, version: str, failed: bool):
+        """Back off from a corpus version whose warm-up failed; forget it once one succeeds.
+
+        Written to failures.json so other processes back off too.
+        """
+        if not failed:
+            if version in self.failures:
+                self.failures = {v: f for v, f in self.failures.items() if v != version}
+                self._write(self.failures_path, self.failures)
+                self._loaded = self._file_ids()
+            return
+        attempts = self.failures.get(version, (0, 0.0))[0] + 1
+        delay = min(MAX_BACKOFF_SECONDS, self.backoff * 2 ** (attempts - 1))
+        # Only the current version can be retried, so older ones are dropped
+        self.failures = {version: (attempts, time.time() + delay)}
+        self._write(self.failures_path, self.failures)
+        self._loaded = self._file_ids()
+        print(f"Answer cache warm-up failed for {version} (attempt {attempts}), retrying in {delay:.0f}s")
+
+    def backing_off(self, version: Optional[str] = None) -> bool:
+        """Whether warm-ups of `version` (the current one by default) are waiting out a failure"""
+        self.reload()
+        version = version or self.db.corpus_version()
+        failure = self.failures.get(version)
+        return failure is not None and time.time() < failure[1]
+
+    def _warm_one(self, query: str, version: str) -> str:
+        try:
+            results = [_plain(r) for r in self.db.search_similar(query, limit=self.limit)]
+        except Exception as e:
+            print(f"Warm-up search failed for '{query}': {e}")
+            return "failed"
+        if not results:
+            return "no_results"
+
+        answers = {}
+        for key, context in ((answer_key(query, results), results), (answer_key(query, mode="no_rag"), None)):
+            if not self.claude.is_available():
+                break
+            text, stats = self.claude.generate_answer(query, context, include_stats=True)
+            if text:
+                answers[key] = {"text": text, "stats": stats, "computed_at": time.time()}
+        self._store(normalize_query(query), {"query": query, "corpus_version": version,
+                                             "results": results, "answers": answers})
+        return "warmed" if len(answers) == 2 or not self.claude.is_available() else "failed"
+
+    def refresh_in_background(self) -> bool:
+        """Start a warm-up thread unless one is running; True if one was started"""
+        if self._warming.locked():
+            return False
+        threading.Thread(target=self.warm, name="answer-cache-warm", daemon=True).start()
+        return True
+
+    def refresh_if_stale(self) -> bool:
+        """Warm stale entries in the background unless the current version is backing off"""
+        if self.backing_off():
+            return False
+        return bool(self.stale_queries()) and self.refresh_in_background()
+
+    def watch(self, interval: Optional[float] = None) -> threading.Thread:
+        """Check for a new corpus version (e.g. one published by the ingestion worker) every
+        `interval` seconds and warm stale entries; the first check runs right away"""
+        interval = interval or float(os.getenv("FASTRAG_ANSWER_CACHE_CHECK_SECONDS", "30"))
+
+        def run():
+            while True:
+                try:
+                    self.refresh_if_stale()
+                except Exception as e:
+                    print(f"Answer cache check failed: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="answer-cache-watch", daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute search results and answers for hot questions")
+    parser.add_argument("--force", action="store_true", help="Recompute every hot question, not just stale ones")
+    parser.add_argument("--queries", default=None, help="Hot question list (default: FASTRAG_HOT_QUERIES or the samples)")
+    parser.add_argument("--db", default="./lancedb")
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase
+    from utils.claude_service import ClaudeService
+
+    cache = AnswerCache(FastHTMLDatabase(args.db, pinned=True), ClaudeService(), queries=load_hot_queries(args.queries))
+    if not cache.claude.is_available():
+        print("ANTHROPIC_API_KEY is not set: caching search results only")
+    counts = cache.warm(force=args.force)
+    if counts is None:
+        print("Another process is warming the cache")
+        return
+    print(", ".join(f"{status}: {n}" for status, n in counts.items()))
+    print(f"Wrote {cache.path}")
+
+
+if __name__ == "__main__":
+    main()
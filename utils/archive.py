@@ -0,0 +1,339 @@
+"""Offline import and export of saved pages.
+
+Three layouts are read and written:
+
+    directory   `pages.json` ([{"url", "file"}]) plus the HTML files under `pages/`
+                (the layout of benchmarks/fixtures)
+    .tar[.gz]   the same files in a tarball; each page member also carries its URL
+                in a `fastrag.url` PAX header so the archive can be streamed
+    .warc[.gz]  WARC response records, e.g. from wget --warc-file
+
+`import_archives` streams pages out of archives (directory pages are read by
+the workers themselves), parses them on a process pool and embeds and stores
+them through the normal ingestion path in this process, so no network access
+is needed. `ArchiveWriter` captures fetched pages in any of the layouts; the
+crawler uses it for `--capture`.
+
+Usage: python -m utils.archive import <archive> [...] [--workers 4] [--db ./lancedb]
+       python -m utils.archive export <archive> [url ...] [--rate 2]
+"""
+import io
+import os
+import re
+import gzip
+import json
+import time
+import uuid
+import hashlib
+import tarfile
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Iterator, List, Optional
+
+URL_HEADER = "fastrag.url"
+INDEX_NAME = "pages.json"
+
+
+def archive_kind(path: str) -> str:
+    if os.path.isdir(path):
+        return "directory"
+    if re.search(r"\.warc(\.gz)?$", path):
+        return "warc"
+    if re.search(r"\.(tar|tar\.gz|tgz)$", path):
+        return "tar"
+    raise ValueError(f"Unrecognized archive '{path}': expected a directory, .tar[.gz] or .warc[.gz]")
+
+
+def page_filename(url: str) -> str:
+    """A readable, unique file name for a page"""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", url.split("://", 1)[-1]).strip("_")[-80:]
+    return f"{slug}_{hashlib.md5(url.encode()).hexdigest()[:8]}.html"
+
+
+def _iter_directory(path: str) -> Iterator[Dict[str, Any]]:
+    with open(os.path.join(path, INDEX_NAME)) as f:
+        index = json.load(f)
+    for entry in index:
+        yield {"url": entry["url"], "path": os.path.join(path, "pages", entry["file"])}
+
+
+def _iter_tar(path: str) -> Iterator[Dict[str, Any]]:
+    # Members without a URL header are matched against pages.json, buffering them until it is read
+    files: Optional[Dict[str, str]] = None
+    waiting: Dict[str, bytes] = {}
+    with tarfile.open(path, "r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            # Matched as "pages/<file>" whatever directory the archive was made from
+            name = "/".join(member.name.split("/")[-2:])
+            data = tar.extractfile(member).read()
+            if name.endswith(INDEX_NAME):
+                files = {os.path.join("pages", e["file"]): e["url"] for e in json.loads(data)}
+                for waiting_name, html in waiting.items():
+                    if waiting_name in files:
+                        yield {"url": files[waiting_name], "html": html}
+                waiting = {}
+            elif URL_HEADER in member.pax_headers:
+                yield {"url": member.pax_headers[URL_HEADER], "html": data}
+            elif files is not None:
+                if name in files:
+                    yield {"url": files[name], "html": data}
+            elif name.endswith(".html"):
+                waiting[name] = data
+
+
+def _dechunk(body: bytes) -> bytes:
+    out, position = [], 0
+    while position < len(body):
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        if size == 0:
+            break
+        out.append(body[line_end + 2:line_end + 2 + size])
+        position = line_end + 4 + size
+    return b"".join(out)
+
+
+def _http_payload(record: bytes) -> Optional[bytes]:
+    """The body of a stored HTTP response if it is a successful HTML page"""
+    head, _, body = record.partition(b"\r\n\r\n")
+    lines = head.decode("iso-8859-1").split("\r\n")
+    if len(lines[0].split()) < 2 or lines[0].split()[1] != "200":
+        return None
+    headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:])}
+    if "html" not in headers.get("content-type", "text/html"):
+        return None
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = _dechunk(body)
+    if headers.get("content-encoding", "").lower() == "gzip":
+        body = gzip.decompress(body)
+    return body
+
+
+def _iter_warc(path: str) -> Iterator[Dict[str, Any]]:
+    # gzip.open reads the per-record gzip members of a .warc.gz one after another
+    with (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as f:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            if not line.strip():
+                continue
+            if not line.startswith(b"WARC/"):
+                raise ValueError(f"{path}: expected a WARC record header, got {line[:40]!r}")
+            headers = {}
+            for line in iter(f.readline, b""):
+                if not line.strip():
+                    break
+                key, _, value = line.decode("utf-8", "replace").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            block = f.read(int(headers["content-length"]))
+            if headers.get("warc-type") == "response" and headers.get("warc-target-uri"):
+                html = _http_payload(block)
+                if html is not None:
+                    yield {"url": headers["warc-target-uri"].strip("<>"), "html": html}
+
+
+def iter_archive(path: str) -> Iterator[Dict[str, Any]]:
+    """Pages in an archive as {"url", "html"} dicts ({"url", "path"} for directories)"""
+    return {"directory": _iter_directory, "tar": _iter_tar, "warc": _iter_warc}[archive_kind(path)](path)
+
+
+class ArchiveWriter:
+    """Saves pages into a directory, tarball or WARC file (chosen by the path, as for reading)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.kind = "directory" if not re.search(r"\.(tar|tar\.gz|tgz|warc|warc\.gz)$", path) else archive_kind(path)
+        self.index: List[Dict[str, str]] = []
+        if self.kind == "directory":
+            os.makedirs(os.path.join(path, "pages"), exist_ok=True)
+            if os.path.exists(os.path.join(path, INDEX_NAME)):
+                with open(os.path.join(path, INDEX_NAME)) as f:
+                    self.index = json.load(f)
+        elif self.kind == "tar":
+            self._tar = tarfile.open(path, "w:gz" if not path.endswith(".tar") else "w", format=tarfile.PAX_FORMAT)
+        else:
+            self._warc = open(path, "wb")
+        self._seen = {entry["url"] for entry in self.index}
+
+    def add(self, url: str, html: bytes):
+        if url in self._seen:
+            return
+        self._seen.add(url)
+        name = page_filename(url)
+        self.index.append({"url": url, "file": name})
+        if self.kind == "directory":
+            with open(os.path.join(self.path, "pages", name), "wb") as f:
+                f.write(html)
+            # Keep the index usable if the capture is interrupted
+            if len(self.index) % 100 == 0:
+                self._write_index()
+        elif self.kind == "tar":
+            info = tarfile.TarInfo(f"pages/{name}")
+            info.size, info.mtime = len(html), int(time.time())
+            info.pax_headers = {URL_HEADER: url}
+            self._tar.addfile(info, io.BytesIO(html))
+        else:
+            self._write_warc_record(url, html)
+
+    def _write_index(self):
+        tmp_path = os.path.join(self.path, f"{INDEX_NAME}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_NAME))
+
+    def _write_warc_record(self, url: str, html: bytes):
+        http = (b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+                + f"Content-Length: {len(html)}\r\n\r\n".encode() + html)
+        header = (f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+                  f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}\r\n"
+                  f"WARC-Target-URI: {url}\r\nContent-Type: application/http; msgtype=response\r\n"
+                  f"Content-Length: {len(http)}\r\n\r\n").encode()
+        record = header + http + b"\r\n\r\n"
+        self._warc.write(gzip.compress(record) if self.path.endswith(".gz") else record)
+
+    def close(self):
+        if self.kind == "directory":
+            self._write_index()
+        elif self.kind == "tar":
+            data = json.dumps(self.index, indent=1).encode()
+            info = tarfile.TarInfo(INDEX_NAME)
+            info.size, info.mtime = len(data), int(time.time())
+            self._tar.addfile(info, io.BytesIO(data))
+            self._tar.close()
+        else:
+            self._warc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _parse_archived(page: Dict[str, Any]) -> Dict[str, Any]:
+    """Process pool worker: parse one saved page"""
+    from bs4 import BeautifulSoup
+    from utils.batch import parse_page
+    html = page.get("html")
+    if html is None:
+        with open(page["path"], "rb") as f:
+            html = f.read()
+    try:
+        return {"url": page["url"], "parsed": parse_page(page["url"], BeautifulSoup(html, "html.parser"))}
+    except Exception as e:
+        return {"url": page["url"], "error": str(e)}
+
+
+def import_archives(db, paths: List[str], workers: Optional[int] = None, manifest=None,
+                    progress_callback=None) -> Dict[str, int]:
+    """Parse the archives' pages on a process pool and store them; returns per-status counts"""
+    from utils.batch import embed_page, INGEST_PAGES
+    workers = workers or os.cpu_count() or 1
+    counts = {"processed": 0, "cached": 0, "error": 0}
+
+    def pages():
+        for path in paths:
+            for page in iter_archive(path):
+                if db.url_exists(page["url"]):
+                    counts["cached"] += 1
+                    INGEST_PAGES.inc(status="cached")
+                    continue
+                yield page
+
+    def store(result: Dict[str, Any]):
+        if "error" in result:
+            status = "error"
+        else:
+            parsed = result["parsed"]
+            try:
+                db.store_parsed_document(result["url"], parsed["xml_content"], parsed["title"],
+                                         parsed["sections"], *embed_page(db, parsed))
+                status = "processed"
+                if manifest is not None:
+                    manifest.mark(result["url"], "stored")
+            except Exception as e:
+                status, result["error"] = "error", str(e)
+        counts[status] += 1
+        INGEST_PAGES.inc(status=status)
+        if progress_callback:
+            progress_callback({"url": result["url"], "status": status, "error": result.get("error"),
+                               "sections": len(result["parsed"]["sections"]) if status == "processed" else 0})
+
+    # Bounded submission keeps a streamed archive from being read into memory all at once
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        for page in pages():
+            pending.add(pool.submit(_parse_archived, page))
+            if len(pending) >= workers * 4:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    store(future.result())
+        for future in pending:
+            store(future.result())
+    db.publish()
+    return counts
+
+
+def export_urls(path: str, urls: List[str], rate: float = 2.0) -> Dict[str, int]:
+    """Fetch pages and save them into an archive"""
+    from utils.crawler import HostRateLimiter
+    from utils.scraper import fetch_html
+    limiter = HostRateLimiter(rate)
+    counts = {"saved": 0, "error": 0}
+    with ArchiveWriter(path) as writer:
+        for url in urls:
+            limiter.wait(url)
+            try:
+                writer.add(url, fetch_html(url))
+                counts["saved"] += 1
+            except Exception as e:
+                print(f"Skipping {url}: {e}")
+                counts["error"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import saved pages offline, or save pages for later")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("archive", nargs="+", help="import: archives to read; export: the archive to write, "
+                                                   "then the URLs to save (default: the built-in doc list)")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--rate", type=float, default=2.0, help="export: requests per second per host")
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--corpus", default=None, help="import: corpus to ingest into (default: FASTRAG_CORPUS or fasthtml)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        urls = args.archive[1:]
+        if not urls:
+            from utils.batch import fasthtml_doc_urls
+            urls = fasthtml_doc_urls
+        counts = export_urls(args.archive[0], urls, rate=args.rate)
+        print(f"Saved {counts['saved']} pages to {args.archive[0]} ({counts['error']} errors)")
+        return
+
+    from utils.database import FastHTMLDatabase, corpus_suffix
+    from utils.manifest import IngestManifest
+    db = FastHTMLDatabase(args.db, corpus=args.corpus)
+    db.migrate()
+    start = time.time()
+
+    def report(page):
+        print(f"[{page['status']:<9}] {page['url']}{'  ' + page['error'] if page['error'] else ''}")
+
+    counts = import_archives(db, args.archive, workers=args.workers, manifest=IngestManifest(args.db, corpus_suffix(db.corpus)),
+                             progress_callback=report)
+    seconds = time.time() - start
+    print(", ".join(f"{status}: {n}" for status, n in counts.items()) + f" in {seconds:.1f}s")
+    if db.embedding_cache is not None:
+        print(db.embedding_cache.summary())
+    if db.deduper is not None:
+        print(db.deduper.summary())
+
+
+if __name__ == "__main__":
+    main()
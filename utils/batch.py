@@ -1,6 +1,13 @@
-from utils.scraper import fetch_page, extract_main_content, html_to_xml, extract_sections_from_xml
-from utils.database import FastHTMLDatabase
+from utils.scraper import fetch_html, extract_main_content, html_to_xml, extract_sections_from_xml, doc_category
+from utils.database import FastHTMLDatabase, DEFAULT_CORPUS, corpus_suffix
+from utils.metrics import histogram, counter, timer
+from utils.profiling import profiled, is_enabled
+from utils.manifest import IngestManifest
+from bs4 import BeautifulSoup
+import numpy as np
+import os
 import time
+import argparse
 from typing import List, Dict, Any
 
 # Your URL list
@@ -35,60 +42,183 @@ fasthtml_doc_urls = [
     "https://www.fastht.ml/docs/api/cli.html"
 ]
 
-def process_single_url(db: FastHTMLDatabase, url: str) -> Dict[str, Any]:
-    """Process a single URL and return status"""
-    try:
-        # Check if already exists
-        if db.url_exists(url):
-            return {"url": url, "status": "cached", "error": None}
-        
-        # Scrape and process
-        soup = fetch_page(url)
+# Docs sections that searches can be restricted to
+DOC_CATEGORIES = sorted({doc_category(url) for url in fasthtml_doc_urls})
+
+INGEST_STAGE_SECONDS = histogram("fastrag_ingest_stage_seconds", "Time per ingestion stage", labels=("stage",))
+INGEST_PAGES = counter("fastrag_ingest_pages_total", "Pages handled by the ingester, by outcome", labels=("status",))
+
+def parse_page(url: str, soup) -> Dict[str, Any]:
+    """Convert an already-fetched page to its XML document, title and sections"""
+    with timer(INGEST_STAGE_SECONDS, stage="extract"):
         main_content = extract_main_content(soup)
+    with timer(INGEST_STAGE_SECONDS, stage="html_to_xml"):
         xml_content = html_to_xml(main_content, url)
-        
-        # Extract title from XML
-        from bs4 import BeautifulSoup
-        xml_soup = BeautifulSoup(xml_content, 'xml')
-        title_elem = xml_soup.find('title')
-        title = title_elem.string if title_elem else url.split('/')[-1]
-        
-        # Store document
-        doc_id = db.store_document(url, xml_content, title)
-        
-        # Extract and store chunks
+    
+    # Extract title from XML
+    xml_soup = BeautifulSoup(xml_content, 'xml')
+    title_elem = xml_soup.find('title')
+    # A plain str, so parsed pages can be pickled and JSON-encoded
+    title = str(title_elem.string) if title_elem and title_elem.string else url.split('/')[-1]
+    
+    with timer(INGEST_STAGE_SECONDS, stage="sections"):
         sections = extract_sections_from_xml(xml_content)
-        db.store_chunks(doc_id, url, sections)
+    return {"xml_content": xml_content, "title": title, "sections": sections}
+
+def embed_page(db: FastHTMLDatabase, parsed: Dict[str, Any]):
+    """Document vector and section vectors for a parsed page"""
+    with timer(INGEST_STAGE_SECONDS, stage="embed"):
+        doc_vector = db.embed_documents([parsed["xml_content"]])[0]
+        sections = parsed["sections"]
+        chunk_vectors = db.embed_chunks(sections) if sections else np.zeros((0, len(doc_vector)), dtype=np.float32)
+    return doc_vector, chunk_vectors
+
+def _store(db: FastHTMLDatabase, url: str, parsed: Dict[str, Any], vectors) -> Dict[str, Any]:
+    with timer(INGEST_STAGE_SECONDS, stage="store"):
+        db.store_parsed_document(url, parsed["xml_content"], parsed["title"], parsed["sections"], *vectors)
+    return {"url": url, "status": "processed", "error": None, "sections": len(parsed["sections"])}
+
+def store_page(db: FastHTMLDatabase, url: str, soup) -> Dict[str, Any]:
+    """Convert an already-fetched page to XML, chunk it and store it"""
+    parsed = parse_page(url, soup)
+    return _store(db, url, parsed, embed_page(db, parsed))
+
+def ingest_page(db: FastHTMLDatabase, url: str, manifest: IngestManifest = None, profile: bool = False) -> Dict[str, Any]:
+    """Fetch, parse, embed and store a page, checkpointing each stage in `manifest` and
+    starting after the last stage it already finished"""
+    stage = manifest.stage(url) if manifest else None
+    html = parsed = vectors = None
+    try:
+        if stage == "fetched":
+            html = manifest.load_html(url)
+        if stage in ("parsed", "embedded"):
+            parsed = manifest.load_parsed(url)
+        if stage == "embedded":
+            vectors = manifest.load_embeddings(url)
+    except (OSError, ValueError):
+        # The checkpointed output is missing or unreadable: start over
+        manifest.forget(url)
+        stage, html, parsed, vectors = None, None, None, None
+
+    if html is None and parsed is None:
+        with timer(INGEST_STAGE_SECONDS, stage="fetch"):
+            html = fetch_html(url)
+        if manifest:
+            manifest.save_html(url, html)
+    with profiled(url, "ingest", enabled=is_enabled("ingest", profile)):
+        if parsed is None:
+            parsed = parse_page(url, BeautifulSoup(html, 'html.parser'))
+            if manifest:
+                manifest.save_parsed(url, **parsed)
+        if vectors is None:
+            vectors = embed_page(db, parsed)
+            if manifest:
+                manifest.save_embeddings(url, *vectors)
+        result = _store(db, url, parsed, vectors)
+    if manifest:
+        manifest.mark(url, "stored")
+    return {**result, "resumed_from": stage}
+
+def process_single_url(db: FastHTMLDatabase, url: str, profile: bool = False, manifest: IngestManifest = None,
+                       resume: bool = True) -> Dict[str, Any]:
+    """Process a single URL and return status (profiling the parse/store work if asked).
+
+    With a `manifest`, stages are checkpointed; `resume` continues an unfinished
+    page from its checkpoints instead of starting it over.
+    """
+    try:
+        # Documents are written after their chunks, so an existing one is complete
+        if db.url_exists(url):
+            if manifest and manifest.stage(url) != "stored":
+                manifest.mark(url, "stored")
+            INGEST_PAGES.inc(status="cached")
+            return {"url": url, "status": "cached", "error": None}
+        if manifest and (not resume or manifest.stage(url) == "stored"):
+            manifest.forget(url)
         
-        return {"url": url, "status": "processed", "error": None, "sections": len(sections)}
+        result = ingest_page(db, url, manifest, profile)
+        INGEST_PAGES.inc(status="processed")
+        return result
         
     except Exception as e:
+        INGEST_PAGES.inc(status="error")
+        if manifest:
+            manifest.fail(url, str(e))
         return {"url": url, "status": "error", "error": str(e)}
 
-def batch_process_urls(progress_callback=None):
-    """Process all URLs with optional progress callback"""
-    db = FastHTMLDatabase()
+def repair_partial_documents(db: FastHTMLDatabase, manifest: IngestManifest) -> List[str]:
+    """Delete documents stored without their chunks (by ingesters that predate atomic stores)
+    so they are ingested again; returns their URLs"""
+    stages = manifest.stages()
+    urls = []
+    for doc in db.documents_without_chunks():
+        # Pages without sections legitimately have no chunks
+        if stages.get(doc["url"]) != "stored":
+            db.delete_document(doc["id"])
+            urls.append(doc["url"])
+    return urls
+
+def batch_process_urls(progress_callback=None, urls: List[str] = None, resume: bool = False,
+                       db_path: str = "./lancedb", corpus: str = None):
+    """Process all URLs with optional progress callback.
+
+    `resume` continues an interrupted run: pages the manifest records as stored
+    are skipped without touching LanceDB, and unfinished ones restart at their
+    next stage.
+    """
+    db = FastHTMLDatabase(db_path, corpus=corpus)
+    db.migrate()
+    manifest = IngestManifest(db_path, corpus_suffix(db.corpus))
+    urls = urls or fasthtml_doc_urls
     results = []
     
-    total_urls = len(fasthtml_doc_urls)
+    if resume:
+        for url in repair_partial_documents(db, manifest):
+            print(f"Re-ingesting partially stored {url}")
+    stages = manifest.stages(urls) if resume else {}
+    total_urls = len(urls)
     
-    for i, url in enumerate(fasthtml_doc_urls):
-        print(f"Processing {i+1}/{total_urls}: {url}")
-        
-        result = process_single_url(db, url)
+    for i, url in enumerate(urls):
+        if stages.get(url) == "stored":
+            result = {"url": url, "status": "cached", "error": None}
+        else:
+            print(f"Processing {i+1}/{total_urls}: {url}")
+            result = process_single_url(db, url, manifest=manifest, resume=resume)
         results.append(result)
         
         if progress_callback:
             progress_callback(i + 1, total_urls, result)
         
         # Small delay to be nice to the server
-        time.sleep(0.5)
+        if result["status"] != "cached":
+            time.sleep(0.5)
     
+    db.publish()
+    if db.embedding_cache is not None:
+        print(db.embedding_cache.summary())
+    if db.deduper is not None:
+        print(db.deduper.summary())
     return results
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest the FastHTML docs into the vector database")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its checkpoints")
+    parser.add_argument("--status", action="store_true", help="Show the ingestion manifest and exit")
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--corpus", default=os.getenv("FASTRAG_CORPUS", DEFAULT_CORPUS),
+                        help="Corpus to ingest into")
+    args = parser.parse_args()
+
+    if args.status:
+        manifest = IngestManifest(args.db, corpus_suffix(args.corpus))
+        print(", ".join(f"{stage}: {n}" for stage, n in manifest.summary().items()) or "No pages recorded")
+        for page in manifest.unfinished():
+            print(f"  {page['stage'] or '-':<10} {page['url']}  {page['error'] or ''}")
+        raise SystemExit
+
     print("Starting batch processing...")
-    results = batch_process_urls()
+    results = batch_process_urls(resume=args.resume, db_path=args.db, corpus=args.corpus)
     
     # Print summary
     processed = sum(1 for r in results if r["status"] == "processed")
@@ -1,16 +1,99 @@
 import os
+import time
+import asyncio
+import threading
+from collections import deque
 from typing import List, Dict, Any, Optional
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic, APIStatusError, APITimeoutError
+from utils.metrics import counter, histogram, record_stage
+from utils.admission import AdmissionController, AdmissionRejected, backoff_delay
+from utils.routing import ModelRouter
+
+CLAUDE_REQUESTS = counter("fastrag_claude_requests_total", "Claude calls by mode, streaming and outcome",
+                          labels=("mode", "stream", "status"))
+CLAUDE_TOKENS = counter("fastrag_claude_tokens_total", "Tokens reported by the API", labels=("mode", "kind"))
+CLAUDE_TTFT_SECONDS = histogram("fastrag_claude_ttft_seconds", "Time to first streamed token", labels=("mode",))
+CLAUDE_SECONDS = histogram("fastrag_claude_seconds", "Total Claude call duration", labels=("mode", "stream"))
+CLAUDE_TOKENS_PER_SECOND = histogram("fastrag_claude_output_tokens_per_second", "Output rate after the first token",
+                                     labels=("mode",), buckets=(5, 10, 20, 30, 40, 60, 80, 100, 150, 200, 400))
+CLAUDE_RETRIES = counter("fastrag_claude_retries_total", "Retried rate-limit/overload responses",
+                         labels=("mode", "status_code"))
+CLAUDE_STOP_REASONS = counter("fastrag_claude_stop_reasons_total", "Why answers ended", labels=("mode", "reason"))
+ROUTE_SECONDS = histogram("fastrag_route_seconds", "Claude call duration per routing decision",
+                          labels=("route", "model"))
+ROUTE_COST = counter("fastrag_route_cost_usd_total", "Estimated Claude spend per routing decision",
+                     labels=("route", "model"))
+
+# Per-answer stats of recent calls, for the /answer-stats report
+RECENT_ANSWER_STATS: deque = deque(maxlen=1000)
+_recent_lock = threading.Lock()
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summarize_answer_stats(group_by: str = "mode") -> Dict[str, Dict[str, Any]]:
+    """Aggregate the recent per-answer stats by mode (rag / no_rag), route or model"""
+    with _recent_lock:
+        recent = list(RECENT_ANSWER_STATS)
+    summary = {}
+    for group in sorted({str(s[group_by]) for s in recent}):
+        rows = [s for s in recent if str(s[group_by]) == group]
+        ok = [s for s in rows if s["status"] == "ok"]
+        entry = summary[group] = {"answers": len(rows), "errors": len(rows) - len(ok)}
+        for field in ("input_tokens", "output_tokens", "cache_read_input_tokens"):
+            entry[f"avg_{field}"] = sum(s[field] for s in ok) / len(ok) if ok else None
+        for field in ("ttft_ms", "duration_ms"):
+            values = [s[field] for s in ok if s[field] is not None]
+            entry[f"p50_{field}"] = _percentile(values, 0.5)
+            entry[f"p95_{field}"] = _percentile(values, 0.95)
+        costs = [s["cost_usd"] for s in ok if s["cost_usd"] is not None]
+        entry["total_cost_usd"] = sum(costs) if costs else None
+        entry["stop_reasons"] = {r: sum(1 for s in ok if s["stop_reason"] == r)
+                                 for r in sorted({s["stop_reason"] for s in ok if s["stop_reason"]})}
+    return summary
+
+class GenerationTimeout(Exception):
+    """Raised when a streamed answer runs past the per-request generation timeout"""
+
+# Rate limited and overloaded: worth retrying as long as no token has been sent yet
+RETRYABLE_STATUS_CODES = (429, 529)
+
+def _retry_after(error: APIStatusError) -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
 
 class ClaudeService:
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None):
         """Initialize Claude API client"""
         self.api_key = os.getenv('ANTHROPIC_API_KEY')
+        # Point at a compatible server (e.g. benchmarks/fake_anthropic.py) instead of api.anthropic.com
+        self.base_url = base_url or os.getenv('ANTHROPIC_BASE_URL')
         self.client = None
+        self.async_client = None
+        
+        # Bound concurrent calls; extra requests queue briefly, then fail fast
+        self.admission = AdmissionController(
+            "claude",
+            max_concurrent=int(os.getenv('FASTRAG_CLAUDE_MAX_CONCURRENT', '4')),
+            max_queue=int(os.getenv('FASTRAG_CLAUDE_MAX_QUEUE', '32')),
+            queue_timeout=float(os.getenv('FASTRAG_CLAUDE_QUEUE_TIMEOUT', '30'))
+        )
+        self.max_retries = int(os.getenv('FASTRAG_CLAUDE_RETRIES', '3'))
+        self.generation_timeout = float(os.getenv('FASTRAG_GENERATION_TIMEOUT', '120'))
+        # Model and max_tokens per question (see utils/routing.py, FASTRAG_ROUTING_POLICY)
+        self.router = ModelRouter()
         
         if self.api_key:
             try:
-                self.client = Anthropic(api_key=self.api_key)
+                # Retries are handled here (before the first token only), not by the SDK
+                self.client = Anthropic(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+                # Streams use the async client so they don't block the event loop
+                self.async_client = AsyncAnthropic(api_key=self.api_key, base_url=self.base_url, max_retries=0)
             except Exception as e:
                 print(f"Warning: Could not initialize Claude client: {e}")
     
@@ -35,6 +118,13 @@ class ClaudeService:
             context_parts.append(f"## Source {i}: {section_title}")
             context_parts.append(f"URL: {url}")
             context_parts.append(f"Content: {content}")
+            # Neighbouring sections attached by the search (FASTRAG_EXPAND)
+            for relation, neighbors in result.get('context', {}).items():
+                label = {"prev": "Previous section", "children": "Subsection"}.get(relation, f"{relation.capitalize()} section")
+                for neighbor in neighbors if isinstance(neighbors, list) else [neighbors]:
+                    if neighbor:
+                        context_parts.append(f"### {label}: {neighbor.get('section_title', '')}")
+                        context_parts.append(neighbor.get('content', ''))
             context_parts.append("")  # Empty line for separation
         
         return "\n".join(context_parts)
@@ -70,11 +160,71 @@ Always cite your sources by mentioning the section titles you're referencing."""
             "user_message": context
         }
     
-    def generate_answer(self, query: str, search_results: List[Dict] = None) -> Optional[str]:
-        """Generate an answer using Claude API with or without RAG context"""
+    def _record_call(self, mode: str, decision: Dict[str, Any], stream: bool, status: str, start: float,
+                     message=None, first_token: Optional[float] = None) -> Dict[str, Any]:
+        """Record metrics for one call and return its usage/timing stats"""
+        end = time.perf_counter()
+        usage = getattr(message, "usage", None)
+        stats = {
+            "mode": mode,
+            "route": decision["route"],
+            "status": status,
+            "model": getattr(message, "model", None) or decision["model"],
+            "stop_reason": getattr(message, "stop_reason", None),
+            "ttft_ms": (first_token - start) * 1000 if first_token is not None else None,
+            "duration_ms": (end - start) * 1000,
+            "input_tokens": getattr(usage, "input_tokens", None) or 0,
+            "output_tokens": getattr(usage, "output_tokens", None) or 0,
+            "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+            "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+            "output_tokens_per_s": None,
+            "cost_usd": None,
+        }
+        if usage is not None:
+            stats["cost_usd"] = self.router.estimate_cost(stats["model"], stats["input_tokens"], stats["output_tokens"])
+        if first_token is not None and usage is not None and end > first_token:
+            stats["output_tokens_per_s"] = stats["output_tokens"] / (end - first_token)
+
+        stream_label = "true" if stream else "false"
+        CLAUDE_REQUESTS.inc(mode=mode, stream=stream_label, status=status)
+        CLAUDE_SECONDS.observe(end - start, mode=mode, stream=stream_label)
+        record_stage(f"claude_{mode}", end - start)
+        ROUTE_SECONDS.observe(end - start, route=decision["route"], model=decision["model"])
+        if stats["cost_usd"]:
+            ROUTE_COST.inc(stats["cost_usd"], route=decision["route"], model=decision["model"])
+        if usage is not None:
+            for kind in ("input", "output", "cache_read_input", "cache_creation_input"):
+                CLAUDE_TOKENS.inc(stats[f"{kind}_tokens"], mode=mode, kind=kind)
+        if stats["stop_reason"]:
+            CLAUDE_STOP_REASONS.inc(mode=mode, reason=stats["stop_reason"])
+        if first_token is not None:
+            CLAUDE_TTFT_SECONDS.observe(first_token - start, mode=mode)
+        if stats["output_tokens_per_s"] is not None:
+            CLAUDE_TOKENS_PER_SECOND.observe(stats["output_tokens_per_s"], mode=mode)
+        with _recent_lock:
+            RECENT_ANSWER_STATS.append(stats)
+        return stats
+
+    def _should_retry(self, error: Exception, attempt: int, mode: str) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if not isinstance(error, APIStatusError) or error.status_code not in RETRYABLE_STATUS_CODES:
+            return False
+        CLAUDE_RETRIES.inc(mode=mode, status_code=error.status_code)
+        return True
+
+    def generate_answer(self, query: str, search_results: List[Dict] = None, include_stats: bool = False):
+        """Generate an answer using Claude API with or without RAG context.
+
+        Returns the answer text (None on failure); with `include_stats`, an
+        (answer, stats) pair instead.
+        """
         if not self.is_available():
-            return None
+            return (None, None) if include_stats else None
         
+        mode = "rag" if search_results else "no_rag"
+        decision = self.router.route(query, search_results)
+        start = time.perf_counter()
         try:
             if search_results:
                 # RAG mode - use context from search results
@@ -85,29 +235,58 @@ Always cite your sources by mentioning the section titles you're referencing."""
                 context = query
                 system_prompt = "You are a helpful assistant specialized in FastHTML, a Python web framework. Answer the user's question to the best of your knowledge."
             
-            message = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2000,
-                temperature=0.1,
-                system=system_prompt,
-                messages=[{
-                    "role": "user", 
-                    "content": context
-                }]
-            )
+            with self.admission.slot():
+                attempt = 0
+                while True:
+                    try:
+                        message = self.client.messages.create(
+                            model=decision["model"],
+                            max_tokens=decision["max_tokens"],
+                            temperature=0.1,
+                            system=system_prompt,
+                            messages=[{
+                                "role": "user", 
+                                "content": context
+                            }]
+                        )
+                        break
+                    except APIStatusError as e:
+                        if not self._should_retry(e, attempt, mode):
+                            raise
+                        time.sleep(backoff_delay(attempt, retry_after=_retry_after(e)))
+                        attempt += 1
+            stats = self._record_call(mode, decision, False, "ok", start, message=message)
             
-            return message.content[0].text if message.content else None
+            answer = message.content[0].text if message.content else None
             
+        except AdmissionRejected as e:
+            stats = self._record_call(mode, decision, False, "rejected", start)
+            print(f"Claude request rejected: {e}")
+            answer = None
         except Exception as e:
+            stats = self._record_call(mode, decision, False, "error", start)
             print(f"Error generating answer: {e}")
-            return None
+            answer = None
+        return (answer, stats) if include_stats else answer
     
-    async def generate_answer_streaming(self, query: str, search_results: List[Dict] = None):
-        """Generate an answer using Claude API with streaming"""
+    async def generate_answer_streaming(self, query: str, search_results: List[Dict] = None,
+                                        include_stats: bool = False):
+        """Generate an answer using Claude API with streaming.
+
+        Yields text chunks; with `include_stats`, a final dict of usage and timing stats follows them.
+        Raises AdmissionRejected when too many answers are already in progress,
+        GenerationTimeout when the answer runs past FASTRAG_GENERATION_TIMEOUT and
+        the API error itself for any other failure.
+        Closing the generator (or cancelling its consumer) closes the upstream stream.
+        """
         if not self.is_available():
             yield "Claude API not available. Please check your ANTHROPIC_API_KEY."
             return
         
+        mode = "rag" if search_results else "no_rag"
+        decision = self.router.route(query, search_results)
+        start = time.perf_counter()
+        first_token = None
         try:
             if search_results:
                 # RAG mode - use context from search results
@@ -118,18 +297,61 @@ Always cite your sources by mentioning the section titles you're referencing."""
                 context = query
                 system_prompt = "You are a helpful assistant specialized in FastHTML, a Python web framework. Answer the user's question to the best of your knowledge."
             
-            with self.client.messages.stream(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2000,
-                temperature=0.1,
-                system=system_prompt,
-                messages=[{
-                    "role": "user", 
-                    "content": context
-                }]
-            ) as stream:
-                for text in stream.text_stream:
-                    yield text
+            async with self.admission.async_slot():
+                deadline = time.monotonic() + self.generation_timeout
+                attempt = 0
+                while True:
+                    try:
+                        async with self.async_client.messages.stream(
+                            model=decision["model"],
+                            max_tokens=decision["max_tokens"],
+                            temperature=0.1,
+                            system=system_prompt,
+                            messages=[{
+                                "role": "user", 
+                                "content": context
+                            }],
+                            timeout=self.generation_timeout
+                        ) as stream:
+                            texts = stream.text_stream.__aiter__()
+                            while True:
+                                try:
+                                    text = await asyncio.wait_for(anext(texts), deadline - time.monotonic())
+                                except StopAsyncIteration:
+                                    break
+                                if first_token is None:
+                                    first_token = time.perf_counter()
+                                yield text
+                            # The final message read counts against the same deadline as the tokens
+                            final_message = await asyncio.wait_for(stream.get_final_message(),
+                                                                   deadline - time.monotonic())
+                        break
+                    except APIStatusError as e:
+                        # Once text has been sent a retry would repeat it
+                        if first_token is not None or not self._should_retry(e, attempt, mode):
+                            raise
+                        delay = backoff_delay(attempt, retry_after=_retry_after(e))
+                        if time.monotonic() + delay >= deadline:
+                            raise
+                        await asyncio.sleep(delay)
+                        attempt += 1
+            stats = self._record_call(mode, decision, True, "ok", start, message=final_message, first_token=first_token)
                     
-        except Exception as e:
-            yield f"Error generating answer: {str(e)}"
\ No newline at end of file
+        except AdmissionRejected:
+            # Surfaced to the endpoint as an error event rather than as answer text
+            self._record_call(mode, decision, True, "rejected", start)
+            raise
+        except (asyncio.TimeoutError, APITimeoutError):
+            self._record_call(mode, decision, True, "timeout", start, first_token=first_token)
+            raise GenerationTimeout(f"Answer generation took longer than {self.generation_timeout:.0f}s and was stopped")
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away; leaving the stream context above closed the upstream request
+            self._record_call(mode, decision, True, "cancelled", start, first_token=first_token)
+            raise
+        except Exception:
+            # Raised, not yielded: coalesced subscribers would otherwise receive it as answer text
+            self._record_call(mode, decision, True, "error", start, first_token=first_token)
+            raise
+        
+        if include_stats:
+            yield stats
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""Single-flight deduplication for identical in-flight work.
+
+`SingleFlight` shares one call of a blocking function (e.g. a search) between
+threads asking for the same key at the same time. `StreamCoalescer` does the
+same for async token streams: the first request for a key starts the upstream
+generation and every concurrent request with that key subscribes to it. Late
+joiners are replayed the buffered items first, then follow the live stream.
+"""
+import re
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from utils.metrics import counter
+
+COALESCED_REQUESTS = counter("fastrag_coalesced_requests_total",
+                             "Requests that led or joined a shared in-flight call", labels=("kind", "role"))
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a question"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def answer_key(query: str, search_results: Optional[List[Dict]] = None, mode: str = "rag") -> str:
+    """Coalescing key for an answer: normalized query plus the ids of the retrieved chunks"""
+    ids = ",".join(str(r.get("id", "")) for r in search_results or [])
+    return hashlib.sha1(f"{mode}\n{normalize_query(query)}\n{ids}".encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Run a blocking call once per key for all threads that ask for it concurrently"""
+
+    def __init__(self, kind: str = "call"):
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Dict[str, Any]] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+        COALESCED_REQUESTS.inc(kind=self.kind, role="leader" if leader else "joined")
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["done"].set()
+
+
+class SharedStream:
+    """One upstream async iterator, buffered and fanned out to any number of subscribers"""
+
+    def __init__(self, source: AsyncIterator, on_finish: Optional[Callable[[], None]] = None):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self._on_finish = on_finish
+        self._task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator):
+        try:
+            async for item in source:
+                async with self._changed:
+                    self.items.append(item)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            if self._on_finish:
+                self._on_finish()
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator:
+        """Replay everything produced so far, then follow the live stream"""
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                async with self._changed:
+                    while position >= len(self.items) and not self.done:
+                        await self._changed.wait()
+                    batch = self.items[position:]
+                    position = len(self.items)
+                    finished = self.done and not batch
+                if finished:
+                    if self.error is not None and not isinstance(self.error, asyncio.CancelledError):
+                        raise self.error
+                    return
+                for item in batch:
+                    yield item
+        finally:
+            self.subscribers -= 1
+            # Nobody is listening any more: stop paying for the upstream generation
+            if self.subscribers == 0 and not self.done:
+                self._task.cancel()
+
+
+class StreamCoalescer:
+    """Share in-flight async streams between concurrent requests with the same key"""
+
+    def __init__(self, kind: str = "stream"):
+        self.kind = kind
+        self._inflight: Dict[str, SharedStream] = {}
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Subscribe to the in-flight stream for `key`, starting it with `factory()` if there is none"""
+        shared = self._inflight.get(key)
+        leader = shared is None or shared.done
+        if leader:
+            shared = SharedStream(factory(), on_finish=lambda: self._forget(key, shared))
+            self._inflight[key] = shared
+        COALESCED_REQUESTS.inc(kind=self.kind, role="leader" if leader else "joined")
+        return shared.subscribe()
+
+    def _forget(self, key: str, shared: SharedStream):
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
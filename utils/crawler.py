@@ -0,0 +1,396 @@
+"""Link-discovering crawler that feeds ingestion.
+
+Seeds are page URLs or sitemaps (URLs ending in .xml; sitemap indexes are
+followed). Every fetched page's links are canonicalized and, when in scope,
+added to a frontier persisted in SQLite (`<db_path>/_crawl_frontier.sqlite`),
+so an interrupted crawl continues where it stopped. By default the scope is
+the directory of each seed (the whole site for a sitemap).
+
+Pages are fetched by a small thread pool with a per-host rate limit and
+robots.txt checks. Fetched HTML is handed to the ingestion manifest, so
+`process_single_url` continues from the "fetched" stage without downloading
+the page again.
+
+Settings for the app's crawl come from the environment:
+
+    FASTRAG_CRAWL_SEEDS        comma-separated seed URLs (default: the built-in doc list)
+    FASTRAG_CRAWL_SCOPE        comma-separated URL prefixes to stay within
+    FASTRAG_CRAWL_MAX_PAGES    pages to fetch per crawl (default 1000)
+    FASTRAG_CRAWL_CONCURRENCY  concurrent fetches (default 4)
+    FASTRAG_CRAWL_RATE         requests per second per host (default 2)
+
+Usage: python -m utils.crawler [seed ...] [--scope PREFIX ...] [--max-pages 1000] [--fresh]
+                               [--capture pages.tar.gz] [--db ./lancedb]
+"""
+import os
+import re
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+from bs4 import BeautifulSoup
+from utils.scraper import fetch_html
+
+# Links to these are never pages worth ingesting
+SKIP_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp", ".pdf", ".zip", ".gz", ".tar",
+                   ".css", ".js", ".json", ".ipynb", ".py", ".txt", ".mp4", ".woff", ".woff2", ".ttf")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    source TEXT,
+    error TEXT,
+    added_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frontier_by_status ON frontier (status, depth, added_at);
+"""
+
+
+def frontier_path(db_path: str, suffix: str = "") -> str:
+    return os.path.join(db_path, f"_crawl_frontier{suffix}.sqlite")
+
+
+def canonicalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """Absolute URL without fragment, default port, tracking parameters or a trailing index.html;
+    None for non-HTTP links"""
+    url = urljoin(base, url.strip()) if base else url.strip()
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if path.endswith("/index.html"):
+        path = path[:-len("index.html")]
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not k.startswith("utm_")))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def default_scope(seed: str) -> str:
+    """A seed's directory, or the whole site for a sitemap"""
+    parts = urlsplit(canonicalize_url(seed))
+    path = "/" if is_sitemap(seed) else parts.path[:parts.path.rindex("/") + 1]
+    return urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+
+
+def is_sitemap(url: str) -> bool:
+    return urlsplit(url).path.endswith(".xml")
+
+
+def in_scope(url: str, scope: List[str]) -> bool:
+    return any(url.startswith(prefix) for prefix in scope) and not urlsplit(url).path.lower().endswith(SKIP_EXTENSIONS)
+
+
+def extract_links(soup, page_url: str) -> List[str]:
+    """Canonical URLs of every link on the page (navigation included, which is how docs sites list their pages)"""
+    links = []
+    for a in soup.find_all("a", href=True):
+        if a.get("rel") and "nofollow" in a["rel"]:
+            continue
+        url = canonicalize_url(a["href"], base=page_url)
+        if url:
+            links.append(url)
+    return list(dict.fromkeys(links))
+
+
+def sitemap_urls(xml: bytes, fetch: Callable[[str], bytes], depth: int = 0) -> List[str]:
+    """Page URLs listed in a sitemap, following sitemap indexes"""
+    soup = BeautifulSoup(xml, "xml")
+    if soup.find("sitemapindex") and depth < 3:
+        urls = []
+        for loc in soup.select("sitemap > loc"):
+            try:
+                urls.extend(sitemap_urls(fetch(loc.text.strip()), fetch, depth + 1))
+            except Exception as e:
+                print(f"Skipping sitemap {loc.text.strip()}: {e}")
+        return urls
+    return [loc.text.strip() for loc in soup.select("url > loc")]
+
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least 1 / `per_second` seconds apart"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, 0.0))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Frontier:
+    """Persistent crawl queue: every URL seen, its depth and whether it was crawled"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, urls: List[str], depth: int, source: Optional[str] = None) -> int:
+        """Queue URLs not seen before; returns how many were new"""
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO frontier (url, depth, source, added_at, updated_at) "
+                             "VALUES (?, ?, ?, ?, ?)", [(url, depth, source, now, now) for url in urls])
+            return conn.total_changes - before
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """Take the shallowest queued URL"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT url, depth FROM frontier WHERE status = 'queued' "
+                               "ORDER BY depth, added_at LIMIT 1").fetchone()
+            if row is not None:
+                conn.execute("UPDATE frontier SET status = 'fetching', updated_at = ? WHERE url = ?",
+                             (time.time(), row["url"]))
+            conn.execute("COMMIT")
+        return dict(row) if row else None
+
+    def finish(self, url: str, status: str, error: Optional[str] = None):
+        with self._connect() as conn:
+            conn.execute("UPDATE frontier SET status = ?, error = ?, updated_at = ? WHERE url = ?",
+                         (status, error, time.time(), url))
+
+    def requeue(self, urls: Optional[List[str]] = None):
+        """Put URLs (by default every one left mid-fetch by a stopped crawl) back in the queue"""
+        with self._connect() as conn:
+            if urls is None:
+                conn.execute("UPDATE frontier SET status = 'queued' WHERE status = 'fetching'")
+            else:
+                conn.executemany("UPDATE frontier SET status = 'queued' WHERE url = ?", [(u,) for u in urls])
+
+    def reset(self):
+        """Forget everything, so the next crawl starts from its seeds"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM frontier")
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM frontier GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def crawl_settings() -> Dict[str, Any]:
+    """Crawl job parameters from the FASTRAG_CRAWL_* environment variables"""
+    from utils.batch import fasthtml_doc_urls
+    seeds = [s.strip() for s in os.getenv("FASTRAG_CRAWL_SEEDS", "").split(",") if s.strip()]
+    scope = [s.strip() for s in os.getenv("FASTRAG_CRAWL_SCOPE", "").split(",") if s.strip()]
+    return {
+        "seeds": seeds or list(fasthtml_doc_urls),
+        "scope": scope or None,
+        "max_pages": int(os.getenv("FASTRAG_CRAWL_MAX_PAGES", "1000")),
+        "concurrency": int(os.getenv("FASTRAG_CRAWL_CONCURRENCY", "4")),
+        "rate": float(os.getenv("FASTRAG_CRAWL_RATE", "2")),
+    }
+
+
+class Crawler:
+    """Fetches pages from a frontier concurrently and ingests them one at a time"""
+
+    def __init__(self, db, frontier: Frontier, manifest=None, scope: Optional[List[str]] = None,
+                 max_pages: int = 1000, max_depth: Optional[int] = None, concurrency: int = 4,
+                 rate: float = 2.0, respect_robots: bool = True, capture=None):
+        self.db = db
+        self.frontier = frontier
+        self.manifest = manifest
+        self.scope = [canonicalize_url(prefix) for prefix in scope] if scope else None
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.limiter = HostRateLimiter(rate)
+        self.respect_robots = respect_robots
+        # An ArchiveWriter that keeps a copy of every fetched page for offline re-imports
+        self.capture = capture
+        # One robots.txt fetch per site; other threads wait on its future, not on a lock
+        self._robots: Dict[str, Future] = {}
+        self._robots_lock = threading.Lock()
+
+    def fetch(self, url: str) -> bytes:
+        self.limiter.wait(url)
+        return fetch_html(url)
+
+    def allowed(self, url: str) -> bool:
+        """robots.txt check (allowed when the site has none or it can't be read)"""
+        if not self.respect_robots:
+            return True
+        parts = urlsplit(url)
+        site = f"{parts.scheme}://{parts.netloc}"
+        with self._robots_lock:
+            robots = self._robots.get(site)
+            first = robots is None
+            if first:
+                robots = self._robots[site] = Future()
+        if first:
+            robots.set_result(self._read_robots(site))
+        parser = robots.result()
+        return parser is None or parser.can_fetch("*", url)
+
+    def _read_robots(self, site: str) -> Optional[RobotFileParser]:
+        try:
+            parser = RobotFileParser()
+            parser.parse(self.fetch(f"{site}/robots.txt").decode("utf-8", "replace").splitlines())
+            return parser
+        except Exception:
+            return None
+
+    def seed(self, seeds: List[str]) -> int:
+        """Queue the seed pages (or the pages their sitemaps list); returns how many were new"""
+        if self.scope is None:
+            self.scope = sorted({default_scope(seed) for seed in seeds})
+        urls = []
+        for seed in seeds:
+            if is_sitemap(seed):
+                try:
+                    urls.extend(sitemap_urls(self.fetch(seed), self.fetch))
+                except Exception as e:
+                    print(f"Skipping sitemap {seed}: {e}")
+            else:
+                urls.append(seed)
+        urls = [u for u in (canonicalize_url(u) for u in urls) if u and in_scope(u, self.scope)]
+        return self.frontier.add(list(dict.fromkeys(urls)), depth=0)
+
+    def _crawled(self) -> int:
+        counts = self.frontier.counts()
+        return sum(n for status, n in counts.items() if status != "queued")
+
+    def _fetch_page(self, url: str) -> Optional[bytes]:
+        """The page's HTML, or None if robots.txt disallows it"""
+        return self.fetch(url) if self.allowed(url) else None
+
+    def _handle(self, url: str, depth: int, html: bytes, started: float) -> Dict[str, Any]:
+        from utils.batch import process_single_url
+        if self.capture is not None:
+            self.capture.add(url, html)
+        discovered = 0
+        if self.max_depth is None or depth < self.max_depth:
+            links = [link for link in extract_links(BeautifulSoup(html, "html.parser"), url)
+                     if in_scope(link, self.scope)]
+            discovered = self.frontier.add(links, depth + 1, source=url)
+        if self.manifest is not None and not self.db.url_exists(url):
+            self.manifest.save_html(url, html)
+        result = process_single_url(self.db, url, manifest=self.manifest)
+        self.frontier.finish(url, result["status"], result.get("error"))
+        return {**result, "depth": depth, "discovered": discovered, "seconds": time.time() - started}
+
+    def run(self, on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+            should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Crawl until the frontier is empty or `max_pages` were crawled, calling `on_page` with each
+        page's ingestion result. Returns True if `should_stop` ended the crawl early."""
+        if self.scope is None:
+            raise ValueError("Crawler has no scope: pass one or call seed() first")
+        self.frontier.requeue()
+        pending = {}
+        stopped = False
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="crawl") as pool:
+            while True:
+                stopped = stopped or bool(should_stop and should_stop())
+                while not stopped and len(pending) < self.concurrency and self._crawled() < self.max_pages:
+                    item = self.frontier.pop()
+                    if item is None:
+                        break
+                    pending[pool.submit(self._fetch_page, item["url"])] = (item["url"], item["depth"], time.time())
+                if not pending:
+                    break
+                if stopped:
+                    # Let in-flight fetches finish but leave their pages for the next crawl
+                    wait(pending)
+                    self.frontier.requeue([url for url, _, _ in pending.values()])
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    url, depth, started = pending.pop(future)
+                    try:
+                        html = future.result()
+                    except Exception as e:
+                        self.frontier.finish(url, "error", str(e))
+                        result = {"url": url, "status": "error", "error": str(e), "depth": depth,
+                                  "discovered": 0, "seconds": time.time() - started}
+                    else:
+                        if html is None:
+                            self.frontier.finish(url, "skipped", "Disallowed by robots.txt")
+                            result = {"url": url, "status": "skipped", "error": "Disallowed by robots.txt",
+                                      "depth": depth, "discovered": 0, "seconds": time.time() - started}
+                        else:
+                            result = self._handle(url, depth, html, started)
+                    if on_page:
+                        on_page(result)
+        return stopped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl documentation sites into the vector database")
+    parser.add_argument("seeds", nargs="*", help="Seed pages or sitemap.xml URLs (default: FASTRAG_CRAWL_SEEDS)")
+    parser.add_argument("--scope", nargs="+", default=None, help="URL prefixes to stay within")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=None, help="Requests per second per host")
+    parser.add_argument("--fresh", action="store_true", help="Discard the saved frontier and start from the seeds")
+    parser.add_argument("--capture", default=None, help="Also save fetched pages to this archive (see utils.archive)")
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--corpus", default=None, help="Corpus to ingest into (default: FASTRAG_CORPUS or fasthtml)")
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase, corpus_suffix
+    from utils.manifest import IngestManifest
+    from utils.archive import ArchiveWriter
+
+    settings = crawl_settings()
+    for key in ("seeds", "scope", "max_pages", "concurrency", "rate"):
+        if getattr(args, key):
+            settings[key] = getattr(args, key)
+    db = FastHTMLDatabase(args.db, corpus=args.corpus)
+    db.migrate()
+    frontier = Frontier(frontier_path(args.db, corpus_suffix(db.corpus)))
+    if args.fresh:
+        frontier.reset()
+    crawler = Crawler(db, frontier, IngestManifest(args.db, corpus_suffix(db.corpus)), scope=settings["scope"],
+                      max_pages=settings["max_pages"], max_depth=args.max_depth,
+                      concurrency=settings["concurrency"], rate=settings["rate"],
+                      capture=ArchiveWriter(args.capture) if args.capture else None)
+    print(f"Queued {crawler.seed(settings['seeds'])} new seed URLs; scope: {', '.join(crawler.scope)}")
+
+    def report(page):
+        print(f"[{page['status']:<9}] {page['url']}  (+{page['discovered']} links){'  ' + page['error'] if page['error'] else ''}")
+
+    crawler.run(report)
+    db.publish()
+    if crawler.capture is not None:
+        crawler.capture.close()
+        print(f"Saved {len(crawler.capture.index)} pages to {args.capture}")
+    print(", ".join(f"{status}: {n}" for status, n in sorted(frontier.counts().items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,108 +1,821 @@
+import os
+import re
+import time
+import threading
 import lancedb
+from lancedb.index import BTree, Bitmap
 from sentence_transformers import SentenceTransformer
 import hashlib
-from typing import List, Dict, Any
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+import numpy as np
 import pyarrow as pa
+from utils.vector_index import NumpyVectorIndex, normalize_rows, top_k, cosine_to_distance
+from utils.snapshot import ChunkSnapshot
+from utils.scraper import document_summary, doc_category, section_parents
+from utils.metrics import histogram, timer
+from utils.embedding_cache import EmbeddingCache
+from utils.dedupe import ChunkDeduper, DEDUPE_MODES
+from utils.publish import PublishedVersions, published_path, prune_versions, compact
+from utils.symbols import SymbolIndex, SYMBOL_MODES, content_symbols, query_symbols
+
+EMBED_SECONDS = histogram("fastrag_embedding_seconds", "Time spent in model.encode", labels=("op",))
+SEARCH_SECONDS = histogram("fastrag_search_seconds", "Vector search time, excluding embedding", labels=("backend",))
 
 # --- FIX: Load the model once and reuse it. ---
 # This prevents the slow model loading on every database instantiation.
-MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL = SentenceTransformer(MODEL_NAME)
+
+# Each corpus is a pair of tables, <name>_docs and <name>_chunks; the original
+# FastHTML docs tables are the "fasthtml" corpus
+DEFAULT_CORPUS = "fasthtml"
+CORPUS_NAME = re.compile(r"^[a-z0-9][a-z0-9_]*$")
+
+def corpus_suffix(corpus: str) -> str:
+    """Suffix of a corpus's side stores (manifest, frontier, caches); empty for the default corpus"""
+    return "" if corpus == DEFAULT_CORPUS else f"_{corpus}"
+
+# Neighbouring sections a search can attach to each hit
+EXPANSIONS = ("parent", "prev", "next", "children")
+# Columns returned for chunks looked up by id (neighbours, symbol matches)
+CHUNK_FIELDS = ["id", "doc_id", "url", "section_title", "section_level", "section_index", "parent_index", "content"]
+
+# Scalar indexes of each table: searches prefilter on url and category (a LIKE prefix
+# uses the BTree), sections by doc_id and level, and neighbours are looked up by id
+SCALAR_INDEXES = {
+    "docs": [("url", BTree()), ("category", Bitmap())],
+    "chunks": [("doc_id", BTree()), ("section_level", Bitmap()), ("id", BTree()),
+               ("url", BTree()), ("category", Bitmap())],
+}
+
+def sql_string(value: str) -> str:
+    """`value` quoted for a SQL string literal"""
+    return value.replace("'", "''")
+
+def like_prefix(prefix: str) -> str:
+    """`prefix` escaped to match literally at the start of a LIKE pattern"""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return sql_string(escaped)
+
+def parse_expand(expand) -> List[str]:
+    """Expansions from a list or a comma-separated string, checked against EXPANSIONS"""
+    if isinstance(expand, str):
+        expand = expand.split(",")
+    relations = [relation.strip() for relation in expand if relation.strip()]
+    for relation in relations:
+        if relation not in EXPANSIONS:
+            raise ValueError(f"Unknown expansion '{relation}', expected one of {', '.join(EXPANSIONS)}")
+    return list(dict.fromkeys(relations))
+
+# Chunks naming API symbols from the query, scored for the final ranking
+SYMBOL_CANDIDATES = 200
+
+def hit_rank(hit: Dict) -> tuple:
+    """Sort key of a search hit: chunks naming more of the query's API symbols first, then by
+    distance (hits found without embedding the query have none and come after those that do)"""
+    distance = hit["_distance"]
+    return (-hit.get("symbols_matched", 0), float("inf") if distance is None else distance)
 
 class FastHTMLDatabase:
-    def __init__(self, db_path="./lancedb"):
+    def __init__(self, db_path="./lancedb", index_mode: str = None, index_dtype: str = None,
+                 snapshot_path: str = None, search_mode: str = None, corpus: str = None, pinned: bool = False):
         self.db_path = db_path
+        # The corpus this instance ingests into and searches by default
+        self.corpus = corpus or os.getenv("FASTRAG_CORPUS", DEFAULT_CORPUS)
+        if not CORPUS_NAME.match(self.corpus):
+            raise ValueError(f"Invalid corpus name '{self.corpus}': use lowercase letters, digits and underscores")
         # Use the pre-loaded global model
         self.model = MODEL
-        self.db = lancedb.connect(db_path)
+        # Pinned instances (the web app) read the last published table versions
+        # instead of the latest ones, see utils.publish
+        self.pinned = pinned
+        self.published = PublishedVersions(published_path(db_path, corpus_suffix(self.corpus)))
+        self.pinned_versions = None
+        self._pin_lock = threading.Lock()
+        # Re-check for versions written by other processes (e.g. the ingestion worker) this often
+        self.db = lancedb.connect(db_path, read_consistency_interval=timedelta(
+            seconds=float(os.getenv("FASTRAG_READ_CONSISTENCY_SECONDS", "5"))))
+
+        # Chunk and document embeddings are looked up by text before running the model
+        cache_path = os.getenv("FASTRAG_EMBEDDING_CACHE", os.path.join(db_path, "_embedding_cache"))
+        self.embedding_cache = None
+        if cache_path.lower() not in ("", "0", "off", "false"):
+            self.embedding_cache = EmbeddingCache(cache_path, MODEL_NAME, len(self.model.encode("sample text")))
         self.setup_tables()
+
+        # "lancedb" searches through the table; "numpy" keeps an in-process matrix
+        self.index_mode = index_mode or os.getenv("FASTRAG_INDEX_MODE", "lancedb")
+        self.index_dtype = index_dtype
+        self.vector_index = None
+        if self.index_mode == "numpy":
+            self.vector_index = NumpyVectorIndex(
+                self.chunks_table,
+                cache_dir=self.corpus_path("_numpy_index"),
+                dtype=index_dtype or os.getenv("FASTRAG_INDEX_DTYPE", "float32"),
+                binary=os.getenv("FASTRAG_INDEX_BINARY", "").lower() in ("1", "true", "yes"),
+                published=self.published
+            )
+        elif self.index_mode != "lancedb":
+            raise ValueError(f"Unknown index mode '{self.index_mode}', expected 'lancedb' or 'numpy'")
+
+        # A read-only snapshot, when given, serves searches and chunk lookups
+        # from memory-mapped files shared across worker processes. It only
+        # serves the corpus whose table it was exported from.
+        snapshot_path = snapshot_path or os.getenv("FASTRAG_SNAPSHOT")
+        self.snapshot = ChunkSnapshot(snapshot_path) if snapshot_path else None
+        if self.snapshot is not None and self.snapshot.manifest.get("table", self.chunks_table.name) != self.chunks_table.name:
+            self.snapshot = None
+
+        # "hierarchical" first picks the best documents by their document-level
+        # vectors, then searches only those documents' chunks
+        self.search_mode = search_mode or os.getenv("FASTRAG_SEARCH_MODE", "flat")
+        if self.search_mode not in ("flat", "hierarchical"):
+            raise ValueError(f"Unknown search mode '{self.search_mode}', expected 'flat' or 'hierarchical'")
+        self.search_docs = int(os.getenv("FASTRAG_SEARCH_DOCS", "5"))
+        # Neighbouring sections (parent, prev, next, children) attached to every hit
+        self.expand = parse_expand(os.getenv("FASTRAG_EXPAND", ""))
+        # Chunks naming API symbols from the query rank first ("boost") or, when
+        # there are any, are the only results and the query isn't embedded ("exact")
+        self.symbol_search = os.getenv("FASTRAG_SYMBOL_SEARCH", "boost")
+        if self.symbol_search not in SYMBOL_MODES:
+            raise ValueError(f"Unknown symbol search mode '{self.symbol_search}', expected one of {', '.join(SYMBOL_MODES)}")
+        self._symbol_index = None  # (chunks table version, SymbolIndex)
+
+        # Near-duplicate sections are skipped or linked to a canonical chunk at ingest time
+        self.dedupe_mode = os.getenv("FASTRAG_DEDUPE", "off")
+        if self.dedupe_mode not in DEDUPE_MODES:
+            raise ValueError(f"Unknown dedupe mode '{self.dedupe_mode}', expected one of {', '.join(DEDUPE_MODES)}")
+        self.dedupe_threshold = float(os.getenv("FASTRAG_DEDUPE_THRESHOLD", "0.85"))
+        self._deduper = None  # (chunks table version, ChunkDeduper)
+        self._doc_index = None  # (docs table version, ids, normalized vectors)
+
+        # Searches fan out over these corpora in parallel unless the caller picks others
+        self.search_corpora = [name.strip() for name in
+                               os.getenv("FASTRAG_SEARCH_CORPORA", self.corpus).split(",") if name.strip()]
+        self.shard_workers = int(os.getenv("FASTRAG_SHARD_WORKERS", "8"))
+        self._shards: Dict[str, "FastHTMLDatabase"] = {self.corpus: self}
+        self._shards_lock = threading.Lock()
+        self._fanout = None
+        self.refresh_pin()
+
+    @property
+    def docs_table(self):
+        self.refresh_pin()
+        return self._docs_table
+
+    @docs_table.setter
+    def docs_table(self, table):
+        self._docs_table = table
+
+    @property
+    def chunks_table(self):
+        self.refresh_pin()
+        return self._chunks_table
+
+    @chunks_table.setter
+    def chunks_table(self, table):
+        self._chunks_table = table
+
+    def refresh_pin(self):
+        """Move a pinned instance to the last published versions if they changed.
+
+        Fresh handles are swapped in, so searches already running finish on the
+        version they started with. Without any publication the latest versions are read.
+        """
+        if not self.pinned or not self.published.changed():
+            return
+        with self._pin_lock:
+            record = self.published.read()
+            if record is None or (record["docs_version"], record["chunks_version"]) == self.pinned_versions:
+                return
+            docs = self.db.open_table(f"{self.corpus}_docs")
+            docs.checkout(record["docs_version"])
+            chunks = self.db.open_table(f"{self.corpus}_chunks")
+            chunks.checkout(record["chunks_version"])
+            self._docs_table, self._chunks_table = docs, chunks
+            if getattr(self, "vector_index", None) is not None:
+                self.vector_index.table = chunks
+            self.pinned_versions = (record["docs_version"], record["chunks_version"])
+
+    def publish(self) -> Dict[str, Any]:
+        """Make everything stored so far visible to pinned readers, then prune versions no reader can be on"""
+        self.ensure_scalar_indexes()
+        # Latest versions, docs first: every published document has all its chunks
+        docs = self.db.open_table(f"{self.corpus}_docs")
+        chunks = self.db.open_table(f"{self.corpus}_chunks")
+        previous = self.published.read()
+        if previous is not None and (previous["docs_version"], previous["chunks_version"]) == (docs.version, chunks.version):
+            return previous
+        # Prune before publishing: compaction writes new versions (with the same rows),
+        # and those are the ones published, so the latest version stays the published one.
+        # The publication about to be written can't have been in force `grace` ago.
+        grace = float(os.getenv("FASTRAG_VERSION_GRACE_SECONDS", "600"))
+        in_force = PublishedVersions.in_force_at(previous, time.time() - grace) if previous else None
+        for table, version in ((docs, "docs_version"), (chunks, "chunks_version")):
+            if in_force is None or not prune_versions(table, in_force[version]):
+                compact(table)
+        return self.published.write(docs.version, chunks.version)
+
+    def corpus_path(self, name: str) -> str:
+        """Path of a per-corpus side store under the database directory"""
+        return os.path.join(self.db_path, name + corpus_suffix(self.corpus))
     
     def setup_tables(self):
-        """Create tables if they don't exist"""
-        table_names = self.db.table_names()
+        """Create tables if they don't exist.
+
+        Tables created by an older version are left as they are: rewriting them
+        is up to writers, see `migrate`.
+        """
+        table_names = self._table_names()
+        sample_embedding = self.model.encode("sample text")
+        docs_name, chunks_name = f"{self.corpus}_docs", f"{self.corpus}_chunks"
         
-        if "fasthtml_docs" not in table_names:
-            docs_schema = pa.schema([
-                pa.field("id", pa.string()),
-                pa.field("url", pa.string()),
-                pa.field("title", pa.string()),
-                pa.field("xml_content", pa.string()),
-                pa.field("url_hash", pa.string())
-            ])
-            self.db.create_table("fasthtml_docs", schema=docs_schema)
+        self.docs_schema = docs_schema = pa.schema([
+            pa.field("id", pa.string()),
+            pa.field("url", pa.string()),
+            pa.field("title", pa.string()),
+            pa.field("xml_content", pa.string()),
+            pa.field("url_hash", pa.string()),
+            # Docs section (see doc_category), kept as a column so filters can use an index
+            pa.field("category", pa.string()),
+            # Embedding of the title, description and section titles
+            pa.field("vector", pa.list_(pa.float32(), len(sample_embedding)))
+        ])
+        created = False
+        if docs_name not in table_names:
+            self.db.create_table(docs_name, schema=docs_schema)
+            created = True
         
-        if "fasthtml_chunks" not in table_names:
-            sample_embedding = self.model.encode("sample text")
-            chunks_schema = pa.schema([
-                pa.field("id", pa.string()),
-                pa.field("doc_id", pa.string()),
-                pa.field("url", pa.string()),
-                pa.field("section_title", pa.string()),
-                pa.field("section_level", pa.int32()),
-                pa.field("content", pa.string()),
-                # The field name 'vector' is important for LanceDB to auto-detect
-                pa.field("vector", pa.list_(pa.float32(), len(sample_embedding)))
-            ])
+        self.chunks_schema = chunks_schema = pa.schema([
+            pa.field("id", pa.string()),
+            pa.field("doc_id", pa.string()),
+            pa.field("url", pa.string()),
+            pa.field("category", pa.string()),
+            pa.field("section_title", pa.string()),
+            pa.field("section_level", pa.int32()),
+            # Position of the section in its document and of its parent section (-1 at the top)
+            pa.field("section_index", pa.int32()),
+            pa.field("parent_index", pa.int32()),
+            pa.field("content", pa.string()),
+            # API symbols named in the section's code (see utils.symbols)
+            pa.field("symbols", pa.list_(pa.string())),
+            # The field name 'vector' is important for LanceDB to auto-detect
+            pa.field("vector", pa.list_(pa.float32(), len(sample_embedding)))
+        ])
+        if chunks_name not in table_names:
             # --- FIX: Removed the unsupported 'vector_column_name' argument ---
-            self.db.create_table("fasthtml_chunks", schema=chunks_schema)
+            self.db.create_table(chunks_name, schema=chunks_schema)
+            created = True
+
+        self.docs_table = self.db.open_table(docs_name)
+        self.chunks_table = self.db.open_table(chunks_name)
+        if created:
+            self.ensure_scalar_indexes()
+        pending = self.pending_migrations()
+        if pending:
+            print(f"Corpus '{self.corpus}' is missing {', '.join(pending)}: "
+                  f"run `python -m utils.publish migrate --corpus {self.corpus}` or any ingestion to add them")
+
+    def pending_migrations(self) -> List[str]:
+        """Columns of the current schema that the stored tables lack, as table.column"""
+        pending = []
+        for table, schema in ((self.docs_table, self.docs_schema), (self.chunks_table, self.chunks_schema)):
+            stored = set(table.schema.names)
+            pending += [f"{table.name}.{name}" for name in schema.names if name not in stored]
+        return pending
 
-        self.docs_table = self.db.open_table("fasthtml_docs")
-        self.chunks_table = self.db.open_table("fasthtml_chunks")
+    def migrate(self) -> List[str]:
+        """Bring tables created by an older version up to the current schema; returns what was added.
+
+        The missing columns are computed and the table rewritten, which drops its
+        scalar indexes, so only writers (batch ingestion, the job worker,
+        `python -m utils.publish migrate`) call this, never pinned readers. The
+        indexes are rebuilt afterwards and, if the corpus was published, the
+        migrated versions are published.
+        """
+        pending = self.pending_migrations()
+        docs_name, chunks_name = f"{self.corpus}_docs", f"{self.corpus}_chunks"
+        if any(name.startswith(f"{docs_name}.") for name in pending):
+            self._add_document_columns(self.docs_schema)
+        if any(name.startswith(f"{chunks_name}.") for name in pending):
+            self._add_chunk_columns(self.chunks_schema)
+        if pending:
+            self.docs_table = self.db.open_table(docs_name)
+            self.chunks_table = self.db.open_table(chunks_name)
+            if self.vector_index is not None:
+                self.vector_index.table = self.chunks_table
+        self.ensure_scalar_indexes()
+        if pending and self.published.read() is not None:
+            self.publish()
+        return pending
     
+    def _table_names(self) -> List[str]:
+        """All table names; LanceDB lists them a page (10 by default) at a time"""
+        names, page = [], self.db.table_names(limit=1000)
+        while page:
+            names += page
+            page = self.db.table_names(page_token=page[-1], limit=1000) if len(page) == 1000 else []
+        return names
+
+    def _add_document_columns(self, docs_schema: pa.Schema):
+        """Rewrite a docs table created before document-level vectors or categories were stored"""
+        table = self.db.open_table(f"{self.corpus}_docs")
+        missing = [name for name in docs_schema.names if name not in table.schema.names]
+        rows = table.to_arrow().to_pylist()
+        print(f"Adding {', '.join(missing)} to {len(rows)} stored documents...")
+        if rows and "vector" in missing:
+            vectors = self.embed_documents([r["xml_content"] for r in rows])
+            for row, vector in zip(rows, vectors):
+                row["vector"] = vector.tolist()
+        if "category" in missing:
+            for row in rows:
+                row["category"] = doc_category(row["url"])
+        self.db.create_table(f"{self.corpus}_docs", data=rows or None, schema=docs_schema, mode="overwrite")
+
+    def _add_chunk_columns(self, chunks_schema: pa.Schema):
+        """Rewrite a chunks table created before section links, API symbols or categories were stored.
+
+        Positions come from the chunk ids; parents are worked out from the levels of
+        the stored sections, so a parent dropped as a near-duplicate is skipped over.
+        Symbols are read from the code blocks and inline code kept in the content,
+        categories from the urls.
+        """
+        arrow_table = self.db.open_table(f"{self.corpus}_chunks").to_arrow()
+        missing = [name for name in chunks_schema.names if name not in arrow_table.schema.names]
+        print(f"Adding {', '.join(missing)} to {arrow_table.num_rows} stored chunks...")
+        ids = arrow_table.column("id").to_pylist()
+        if "parent_index" in missing:
+            positions = [int(chunk_id.rsplit("_", 1)[1]) for chunk_id in ids]
+            sections: Dict[str, List[int]] = {}
+            for row, doc_id in enumerate(arrow_table.column("doc_id").to_pylist()):
+                sections.setdefault(doc_id, []).append(row)
+            levels = arrow_table.column("section_level").to_pylist()
+            parent_index = [-1] * len(ids)
+            for rows in sections.values():
+                rows.sort(key=lambda row: positions[row])
+                parents = section_parents([{"level": levels[row]} for row in rows])
+                for row, parent in zip(rows, parents):
+                    parent_index[row] = -1 if parent < 0 else positions[rows[parent]]
+            arrow_table = arrow_table.append_column("section_index", pa.array(positions, pa.int32()))
+            arrow_table = arrow_table.append_column("parent_index", pa.array(parent_index, pa.int32()))
+        if "symbols" in missing:
+            symbols = [content_symbols(content) for content in arrow_table.column("content").to_pylist()]
+            arrow_table = arrow_table.append_column("symbols", pa.array(symbols, pa.list_(pa.string())))
+        if "category" in missing:
+            categories = [doc_category(url) for url in arrow_table.column("url").to_pylist()]
+            arrow_table = arrow_table.append_column("category", pa.array(categories, pa.string()))
+        rows = arrow_table.select(chunks_schema.names).cast(chunks_schema) if ids else None
+        self.db.create_table(f"{self.corpus}_chunks", data=rows, schema=chunks_schema, mode="overwrite")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self.embedding_cache is None:
+            return self.model.encode(texts)
+        return self.embedding_cache.encode(texts, self.model.encode)
+
+    def embed_documents(self, xml_contents: List[str]) -> np.ndarray:
+        """Document-level embeddings from each document's outline"""
+        with timer(EMBED_SECONDS, op="documents"):
+            return self._encode([document_summary(xml) for xml in xml_contents])
+
     def url_exists(self, url: str) -> bool:
         """Check if URL already exists in database"""
         url_hash = hashlib.md5(url.encode()).hexdigest()
         # Use count_rows for an efficient check
         return self.docs_table.count_rows(f"url_hash = '{url_hash}'") > 0
     
-    def store_document(self, url: str, xml_content: str, title: str = ""):
-        """Store full XML document"""
+    def embed_chunks(self, chunks: List[Dict[str, Any]]) -> np.ndarray:
+        """Embeddings of the sections' contents"""
+        with timer(EMBED_SECONDS, op="chunks"):
+            return self._encode([chunk['content'] for chunk in chunks])
+
+    def _chunk_records(self, doc_id: str, url: str, chunks: List[Dict[str, Any]], embeddings,
+                       indices: List[int]) -> List[Dict]:
+        """Rows for the chunks at `indices`; ids keep each section's position.
+
+        Parents are worked out over the kept sections only, as `_add_chunk_columns`
+        does for stored ones, so a parent dropped as a near-duplicate is skipped over.
+        """
+        kept_parents = section_parents([chunks[i] for i in indices])
+        parents = {i: -1 if parent < 0 else indices[parent] for i, parent in zip(indices, kept_parents)}
+        return [{
+            "id": f"{doc_id}_chunk_{i}",
+            "doc_id": doc_id,
+            "url": url,
+            "category": doc_category(url),
+            "section_title": chunks[i].get('title', ''),
+            "section_level": chunks[i].get('level', 1),
+            "section_index": i,
+            "parent_index": parents[i],
+            "content": chunks[i]['content'],
+            "symbols": chunks[i].get('symbols', []),
+            "vector": embeddings[row].tolist()
+        } for row, i in enumerate(indices)]
+
+    def store_parsed_document(self, url: str, xml_content: str, title: str, chunks: List[Dict[str, Any]],
+                              doc_vector=None, chunk_vectors=None) -> str:
+        """Store a document and its chunks as one unit, embedding them unless vectors are given.
+
+        LanceDB has no transactions across tables, so the chunks are written
+        first and the document row last: `url_exists` only sees documents whose
+        chunks have landed. Chunks left behind by an earlier interrupted attempt
+        are replaced.
+        """
         url_hash = hashlib.md5(url.encode()).hexdigest()
         doc_id = f"doc_{url_hash}"
-        
-        doc_data = {
+        if doc_vector is None:
+            doc_vector = self.embed_documents([xml_content])[0]
+
+        deduper = self.deduper  # before this method's own writes change the table version
+        self.chunks_table.delete(f"doc_id = '{doc_id}'")
+        keep, links = list(range(len(chunks))), []
+        if deduper is not None:
+            deduper.forget_doc(doc_id)
+            keep, links = deduper.check(doc_id, chunks)
+        if chunk_vectors is not None:
+            chunk_vectors = np.asarray(chunk_vectors)[keep]
+        elif keep:
+            chunk_vectors = self.embed_chunks([chunks[i] for i in keep])
+        if keep:
+            self.chunks_table.add(self._chunk_records(doc_id, url, chunks, chunk_vectors, keep))
+        if deduper is not None:
+            deduper.commit([f"{doc_id}_chunk_{i}" for i in keep], links)
+            self._deduper_written(deduper)
+        self.docs_table.add([{
             "id": doc_id, "url": url, "title": title,
-            "xml_content": xml_content, "url_hash": url_hash
-        }
-        
-        self.docs_table.add([doc_data])
+            "xml_content": xml_content, "url_hash": url_hash, "category": doc_category(url),
+            "vector": np.asarray(doc_vector).tolist()
+        }])
         return doc_id
+
+    def delete_document(self, doc_id: str):
+        """Remove a document and its chunks"""
+        deduper = self.deduper
+        self.docs_table.delete(f"id = '{doc_id}'")
+        self.chunks_table.delete(f"doc_id = '{doc_id}'")
+        if deduper is not None:
+            deduper.forget_doc(doc_id)
+            self._deduper_written(deduper)
+
+    @property
+    def deduper(self):
+        """The near-duplicate index (None when FASTRAG_DEDUPE is off), loaded on first use and
+        reloaded when the chunks table changes, e.g. after another process stored documents"""
+        if self.dedupe_mode == "off":
+            return None
+        table = self.chunks_table
+        if self._deduper is None or self._deduper[0] != table.version:
+            stored_ids = {row["id"] for row in table.search().select(["id"]).limit(None).to_list()}
+            deduper = ChunkDeduper(self.corpus_path("_dedupe"), self.dedupe_mode,
+                                   self.dedupe_threshold, valid_ids=stored_ids)
+            if self._deduper is not None:
+                deduper.counts = self._deduper[1].counts  # totals of this process's checks
+            self._deduper = (table.version, deduper)
+        return self._deduper[1]
+
+    def _deduper_written(self, deduper: ChunkDeduper):
+        """Mark `deduper` current after this instance's own writes, which it already holds"""
+        self._deduper = (self.chunks_table.version, deduper)
+
+    def documents_without_chunks(self) -> List[Dict]:
+        """Stored documents that have no chunks, e.g. written by an ingester that crashed before storing them"""
+        doc_ids = set(self.chunks_table.to_arrow().column("doc_id").to_pylist())
+        docs = self.docs_table.to_arrow().select(["id", "url"]).to_pylist()
+        return [doc for doc in docs if doc["id"] not in doc_ids]
     
-    def store_chunks(self, doc_id: str, url: str, chunks: List[Dict[str, Any]]):
-        """Store chunked sections with embeddings"""
-        chunk_data = []
-        
-        # Batch encode for better performance
-        contents_to_encode = [chunk['content'] for chunk in chunks]
-        if not contents_to_encode: return
-        
-        embeddings = self.model.encode(contents_to_encode)
-        
-        for i, chunk in enumerate(chunks):
-            chunk_record = {
-                "id": f"{doc_id}_chunk_{i}",
-                "doc_id": doc_id,
-                "url": url,
-                "section_title": chunk.get('title', ''),
-                "section_level": chunk.get('level', 1),
-                "content": chunk['content'],
-                "vector": embeddings[i].tolist()
-            }
-            chunk_data.append(chunk_record)
+    def search_similar(self, query: str, limit: int = 5, url_prefix: str = None, category: str = None,
+                       section_level: int = None, corpora: List[str] = None, expand: List[str] = None) -> List[Dict]:
+        """Search for similar chunks, optionally only in documents under `url_prefix` or in a docs
+        `category` (tutorials, explains, ref, api, overview), and only sections of `section_level`.
+        `corpora` overrides which corpora are searched (FASTRAG_SEARCH_CORPORA by default), and
+        `expand` which neighbouring sections are attached to the hits (FASTRAG_EXPAND by default).
+        Chunks naming API symbols from the query come first (see FASTRAG_SYMBOL_SEARCH)."""
+        symbols = query_symbols(query) if self.symbol_search != "off" else []
+        query_embedding = None
+        if not (symbols and self.symbol_search == "exact" and self.knows_symbols(symbols, corpora)):
+            with timer(EMBED_SECONDS, stage="embed", op="query"):
+                query_embedding = self.model.encode(query)
+        return self.search_vector(query_embedding, limit, url_prefix, category, section_level, corpora, expand,
+                                  symbols)
+
+    def search_vector(self, query_embedding, limit: int = 5, url_prefix: str = None, category: str = None,
+                      section_level: int = None, corpora: List[str] = None, expand: List[str] = None,
+                      symbols: List[str] = None) -> List[Dict]:
+        """Search for chunks similar to an already computed query embedding (same filters as search_similar).
+        Chunks naming any of `symbols` rank first; without an embedding they are the only results."""
+        corpora = corpora or self.search_corpora
+        expand = self.expand if expand is None else parse_expand(expand)
+        if list(corpora) != [self.corpus]:
+            hits = self.search_shards(query_embedding, corpora, limit, url_prefix=url_prefix, category=category,
+                                      section_level=section_level, symbols=symbols)
+        else:
+            hits = self._search(query_embedding, limit, url_prefix, category, section_level, symbols)
+        return self.expand_hits(hits, expand) if expand else hits
+
+    def _search(self, query_embedding, limit: int, url_prefix: str = None, category: str = None,
+                section_level: int = None, symbols: List[str] = None) -> List[Dict]:
+        doc_ids = where = None
+        if url_prefix or category:
+            # A flat LanceDB search prefilters the chunks' own indexed url and category;
+            # the symbol index, document vectors and in-memory backends filter by document id
+            if self.snapshot is None and self.vector_index is None and self.search_mode != "hierarchical":
+                where = self._filter_conditions(self.chunks_table, url_prefix, category)
+            if symbols or where is None:
+                doc_ids = self.filter_documents(url_prefix, category)
+                if not doc_ids:
+                    return []
+        symbol_hits = self.search_symbols(symbols, query_embedding, limit, doc_ids, section_level) if symbols else []
+        if query_embedding is None:
+            return symbol_hits
+        found = {hit["id"] for hit in symbol_hits}
+        hits = self._nearest(query_embedding, limit, doc_ids, section_level, where)
+        return (symbol_hits + [hit for hit in hits if hit["id"] not in found])[:limit]
+
+    def _nearest(self, query_embedding, limit: int, doc_ids: List[str] = None,
+                 section_level: int = None, where: List[str] = None) -> List[Dict]:
+        if self.search_mode == "hierarchical":
+            with timer(SEARCH_SECONDS, stage="coarse", backend="documents"):
+                doc_ids = self.search_documents(query_embedding, self.search_docs, doc_ids)
+            if not doc_ids:
+                return []
         
-        if chunk_data:
-            self.chunks_table.add(chunk_data)
-    
-    def search_similar(self, query: str, limit: int = 5) -> List[Dict]:
-        """Search for similar chunks"""
-        query_embedding = self.model.encode(query)
+        if self.snapshot is not None:
+            with timer(SEARCH_SECONDS, stage="search", backend="snapshot"):
+                return self.snapshot.search(query_embedding, limit, doc_ids, section_level)
+        if self.vector_index is not None:
+            self.refresh_pin()  # the index reads its own table handle, swapped in here
+            with timer(SEARCH_SECONDS, stage="search", backend="numpy"):
+                return self.vector_index.search(query_embedding, limit, doc_ids, section_level)
         
-        results = (self.chunks_table
-                   .search(query_embedding)
-                   .limit(limit)
-                   .to_list())
+        with timer(SEARCH_SECONDS, stage="search", backend="lancedb"):
+            search = self.chunks_table.search(query_embedding)
+            conditions = list(where or [])
+            if doc_ids is not None and not conditions:
+                # The hierarchical shortlist (at most FASTRAG_SEARCH_DOCS documents), or
+                # the filtered documents of a table stored before categories
+                quoted = ", ".join(f"'{doc_id}'" for doc_id in doc_ids)
+                conditions.append(f"doc_id IN ({quoted})")
+            if section_level is not None:
+                conditions.append(f"section_level = {int(section_level)}")
+            if conditions:
+                search = search.where(" AND ".join(conditions), prefilter=True)
+            results = search.limit(limit).to_list()
         
         return results
+
+    def corpora(self) -> List[str]:
+        """Names of the corpora stored in the database"""
+        names = set(self._table_names())
+        return sorted(name[:-len("_chunks")] for name in names
+                      if name.endswith("_chunks") and f"{name[:-len('_chunks')]}_docs" in names)
+
+    def shard(self, corpus: str) -> "FastHTMLDatabase":
+        """The database of another stored corpus, opened once with the same settings"""
+        with self._shards_lock:
+            if corpus not in self._shards:
+                if corpus not in self.corpora():
+                    raise ValueError(f"Unknown corpus '{corpus}', expected one of {', '.join(self.corpora())}")
+                shard = FastHTMLDatabase(self.db_path, self.index_mode, self.index_dtype,
+                                         search_mode=self.search_mode, corpus=corpus, pinned=self.pinned)
+                shard.search_corpora = [corpus]
+                self._shards[corpus] = shard
+            return self._shards[corpus]
+
+    def search_shards(self, query_embedding, corpora: List[str], limit: int = 5, **filters) -> List[Dict]:
+        """Search several corpora in parallel and merge their hits into one global top `limit`.
+
+        Every corpus returns its own top `limit` (so no global hit is missed) and
+        the lists are merged by `_distance`; each hit is tagged with its corpus.
+        """
+        shards = [self.shard(corpus) for corpus in dict.fromkeys(corpora)]
+        if self._fanout is None:
+            self._fanout = ThreadPoolExecutor(max_workers=max(1, self.shard_workers),
+                                              thread_name_prefix="fastrag-shard")
+
+        def search(shard):
+            hits = shard.search_vector(query_embedding, limit, corpora=[shard.corpus], expand=[], **filters)
+            return [dict(hit, corpus=shard.corpus) for hit in hits]
+
+        with timer(SEARCH_SECONDS, stage="fanout", backend="shards"):
+            hits = [hit for shard_hits in self._fanout.map(search, shards) for hit in shard_hits]
+        return sorted(hits, key=hit_rank)[:limit]
+
+    def symbol_index(self) -> SymbolIndex:
+        """The API symbol index of the searched chunks, rebuilt when their version changes"""
+        if self.snapshot is not None:
+            version = self._table_version()
+            if self._symbol_index is None or self._symbol_index[0] != version:
+                rows = (self.snapshot.row(i) for i in range(len(self.snapshot)))
+                self._symbol_index = (version, SymbolIndex.from_rows(rows))
+            return self._symbol_index[1]
+        table = self.chunks_table
+        if self._symbol_index is None or self._symbol_index[0] != table.version:
+            fields = [field for field in ("id", "doc_id", "section_level", "symbols") if field in table.schema.names]
+            rows = table.search().select(fields).limit(None).to_list()
+            self._symbol_index = (table.version, SymbolIndex.from_rows(rows))
+        return self._symbol_index[1]
+
+    def knows_symbols(self, symbols: List[str], corpora: List[str] = None) -> bool:
+        """Whether any of the searched corpora has chunks naming one of `symbols`"""
+        return any(self.shard(corpus).symbol_index().known(symbols)
+                   for corpus in dict.fromkeys(corpora or self.search_corpora))
+
+    def search_symbols(self, symbols: List[str], query_embedding, limit: int = 5, doc_ids: List[str] = None,
+                       section_level: int = None) -> List[Dict]:
+        """Chunks naming the most of `symbols`; among equals the closest to the query embedding,
+        or those earliest in the table when there is none (their `_distance` is then None)"""
+        index = self.symbol_index()
+        with timer(SEARCH_SECONDS, stage="symbols", backend="symbols"):
+            rows, counts = index.lookup(symbols, doc_ids, section_level)
+        if not len(rows):
+            return []
+        matched = {index.ids[row]: int(count) for row, count in zip(rows[:SYMBOL_CANDIDATES], counts)}
+        records = self.chunks_by_id(list(matched), vectors=query_embedding is not None)
+        if query_embedding is not None and records:
+            query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+            vectors = normalize_rows(np.asarray([record.pop("vector") for record in records], dtype=np.float32))
+            distances = [float(distance) for distance in cosine_to_distance(vectors @ query)]
+        else:
+            distances = [None] * len(records)
+        for record, distance in zip(records, distances):
+            record["_distance"] = distance
+            record["symbols_matched"] = matched[record["id"]]
+        order = {chunk_id: i for i, chunk_id in enumerate(matched)}
+        return sorted(records, key=lambda record: hit_rank(record) + (order[record["id"]],))[:limit]
+
+    def chunks_by_id(self, ids: List[str], vectors: bool = False) -> List[Dict]:
+        """The chunks with the given ids (and their vectors, if asked), read in one lookup"""
+        if self.snapshot is not None:
+            wanted, records = set(ids), []
+            for doc_id in dict.fromkeys(chunk_id.rsplit("_chunk_", 1)[0] for chunk_id in ids):
+                start, end = self.snapshot.docs.get(doc_id, (0, 0))
+                for i in range(start, end):
+                    record = self.snapshot.row(i)
+                    if record["id"] in wanted:
+                        if vectors:
+                            record["vector"] = self.snapshot.matrix.row(i)
+                        records.append(record)
+            return records
+        table = self.chunks_table
+        fields = [field for field in CHUNK_FIELDS + (["vector"] if vectors else []) if field in table.schema.names]
+        quoted = ", ".join(f"'{chunk_id}'" for chunk_id in ids)
+        return table.search().where(f"id IN ({quoted})").select(fields).limit(None).to_list()
+
+    def expand_hits(self, hits: List[Dict], expand: List[str]) -> List[Dict]:
+        """Copies of the hits with their neighbouring sections under "context".
+
+        `context` maps each relation in `expand` to a section record ("parent",
+        "prev", "next"; None when there is none) or a list of them ("children"). The
+        neighbours of all hits in a corpus are read in one filtered lookup.
+        """
+        by_corpus: Dict[str, List[int]] = {}
+        for i, hit in enumerate(hits):
+            by_corpus.setdefault(hit.get("corpus", self.corpus), []).append(i)
+        expanded = list(hits)
+        for corpus, positions in by_corpus.items():
+            shard = self if corpus == self.corpus else self.shard(corpus)
+            neighbors = shard.neighbors([hits[i] for i in positions], expand)
+            for i, context in zip(positions, neighbors):
+                expanded[i] = dict(hits[i], context=context)
+        return expanded
+
+    def neighbors(self, hits: List[Dict], expand: List[str]) -> List[Dict[str, Any]]:
+        """The `expand` relations of each hit (all from this corpus), see expand_hits"""
+        with timer(SEARCH_SECONDS, stage="expand", backend="snapshot" if self.snapshot is not None else "lancedb"):
+            by_position, by_parent = {}, {}
+            for row in self._neighbor_rows(hits, expand):
+                key = (row["doc_id"], row.get("section_index"))
+                by_position[key] = row
+                if row.get("parent_index") is not None:
+                    by_parent.setdefault((row["doc_id"], row["parent_index"]), []).append(row)
+        contexts = []
+        for hit in hits:
+            doc_id, position, parent = hit["doc_id"], self._position(hit), hit.get("parent_index")
+            related = {"prev": position - 1, "next": position + 1, "parent": parent}
+            context = {}
+            for relation in expand:
+                if relation == "children":
+                    children = by_parent.get((doc_id, position), [])
+                    context[relation] = sorted(children, key=lambda row: row["section_index"])
+                else:
+                    index = related[relation]
+                    context[relation] = by_position.get((doc_id, index)) if index is not None and index >= 0 else None
+            contexts.append(context)
+        return contexts
+
+    @staticmethod
+    def _position(hit: Dict) -> int:
+        """A chunk's position in its document (stored, or parsed from `<doc_id>_chunk_<i>`)"""
+        if hit.get("section_index") is not None:
+            return int(hit["section_index"])
+        return int(hit["id"].rsplit("_", 1)[1])
+
+    def _neighbor_rows(self, hits: List[Dict], expand: List[str]) -> List[Dict]:
+        """Every section one of the hits' relations may point to, in a single lookup"""
+        if self.snapshot is not None:
+            # The documents' rows are one contiguous, memory-mapped range each
+            return [row for doc_id in dict.fromkeys(hit["doc_id"] for hit in hits)
+                    for row in self.snapshot.get_document_chunks(doc_id)]
+        table = self.chunks_table  # one version for the whole lookup
+        if "parent_index" not in table.schema.names:
+            # A version stored before section links; only prev/next (by id) can be found
+            expand = [relation for relation in expand if relation in ("prev", "next")]
+        ids, children = set(), {}
+        for hit in hits:
+            doc_id, position = hit["doc_id"], self._position(hit)
+            if "prev" in expand and position > 0:
+                ids.add(f"{doc_id}_chunk_{position - 1}")
+            if "next" in expand:
+                ids.add(f"{doc_id}_chunk_{position + 1}")
+            parent = hit.get("parent_index")
+            if "parent" in expand and parent is not None and parent >= 0:
+                ids.add(f"{doc_id}_chunk_{parent}")
+            if "children" in expand:
+                children.setdefault(doc_id, set()).add(position)
+        conditions = []
+        if ids:
+            conditions.append("id IN ({})".format(", ".join(f"'{chunk_id}'" for chunk_id in sorted(ids))))
+        for doc_id, positions in children.items():
+            conditions.append(f"(doc_id = '{doc_id}' AND parent_index IN ({', '.join(map(str, sorted(positions)))}))")
+        if not conditions:
+            return []
+        fields = [field for field in CHUNK_FIELDS if field in table.schema.names]
+        rows = table.search().where(" OR ".join(conditions)).select(fields).limit(None).to_list()
+        for row in rows:
+            row.setdefault("section_index", int(row["id"].rsplit("_", 1)[1]))
+        return rows
+
+    def ensure_scalar_indexes(self):
+        """Scalar indexes on the columns that searches filter on, so prefilters don't scan the tables.
+
+        Indexes made on an empty table only cover the rows added since once the
+        table is optimized, which `publish` does; until then the rest is scanned.
+        """
+        for kind, table in (("docs", self.docs_table), ("chunks", self.chunks_table)):
+            indexed = {column for index in table.list_indices() for column in index.columns}
+            for column, config in SCALAR_INDEXES[kind]:
+                if column in table.schema.names and column not in indexed:
+                    table.create_index(column, config=config)
+
+    def _filter_conditions(self, table, url_prefix: str = None, category: str = None) -> Optional[List[str]]:
+        """SQL prefilters on `table`'s url and category columns; None if it has no category column yet"""
+        if category and "category" not in table.schema.names:
+            return None
+        conditions = []
+        if url_prefix:
+            conditions.append(f"url LIKE '{like_prefix(url_prefix)}%'")
+        if category:
+            conditions.append(f"category = '{sql_string(category)}'")
+        return conditions
+
+    def _documents(self):
+        """(ids, urls, normalized document vectors), reloaded when the docs table changes"""
+        table = self.docs_table
+        version = table.version
+        if self._doc_index is None or self._doc_index[0] != version:
+            arrow_table = table.search().select(["id", "vector"]).limit(None).to_arrow()
+            vectors = arrow_table.column("vector").to_pylist()
+            matrix = normalize_rows(np.asarray(vectors, dtype=np.float32)) if vectors else np.empty((0, 0))
+            self._doc_index = (version, arrow_table.column("id").to_pylist(), matrix)
+        return self._doc_index[1:]
+
+    def filter_documents(self, url_prefix: str = None, category: str = None) -> List[str]:
+        """Ids of the documents under `url_prefix` and in `category`, read through the scalar indexes"""
+        table = self.docs_table
+        conditions = self._filter_conditions(table, url_prefix, category)
+        match_category = conditions is None  # stored before categories: worked out from the urls
+        if match_category:
+            conditions = self._filter_conditions(table, url_prefix)
+        search = table.search().select(["id", "url"]).limit(None)
+        if conditions:
+            search = search.where(" AND ".join(conditions))
+        return [row["id"] for row in search.to_list() if not match_category or doc_category(row["url"]) == category]
+
+    def search_documents(self, query_embedding, limit: int = 5, candidates: List[str] = None) -> List[str]:
+        """Ids of the documents (among `candidates`, if given) whose document-level vectors best match the query"""
+        ids, matrix = self._documents()
+        if candidates is None:
+            rows = np.arange(len(ids))
+        else:
+            candidates = set(candidates)
+            rows = np.asarray([i for i, doc_id in enumerate(ids) if doc_id in candidates], dtype=np.int64)
+        if not rows.size:
+            return []
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        return [ids[rows[i]] for i in top_k(matrix[rows] @ query, limit)]
     
+    def corpus_version(self) -> str:
+        """Identifies the searchable corpus; changes whenever chunks are added"""
+        if self.search_corpora != [self.corpus]:
+            return "+".join(f"{corpus}:{self.shard(corpus)._table_version()}" for corpus in self.search_corpora)
+        return self._table_version()
+
+    def _table_version(self) -> str:
+        if self.snapshot is not None:
+            return f"snapshot-{self.snapshot.manifest['table_version']}"
+        return f"chunks-{self.chunks_table.version}"
+
     def get_document_count(self) -> int:
         """Get total number of documents efficiently."""
         return self.docs_table.count_rows()
@@ -124,6 +837,17 @@ class FastHTMLDatabase:
     
     def get_document_chunks(self, doc_id: str) -> List[Dict]:
         """Get all chunks for a specific document"""
+        if self.snapshot is not None:
+            return self.snapshot.get_document_chunks(doc_id)
         df = self.chunks_table.to_pandas()
         filtered = df[df['doc_id'] == doc_id]
-        return filtered[["id", "section_title", "content", "section_level"]].to_dict('records')
+        chunks = filtered[["id", "section_title", "content", "section_level"]].to_dict('records')
+        links = self.deduper.links.get(doc_id, []) if self.dedupe_mode == "link" else []
+        if links:
+            # Sections linked to a canonical chunk show that chunk's content
+            content = df.set_index("id")["content"]
+            chunks += [{"id": link["id"], "section_title": link["section_title"], "section_level": link["section_level"],
+                        "content": content.get(link["canonical_id"], ""), "duplicate_of": link["canonical_id"]}
+                       for link in links]
+            chunks.sort(key=lambda c: int(c["id"].rsplit("_", 1)[1]))
+        return chunks
@@ -0,0 +1,230 @@
+"""Near-duplicate section detection with MinHash and LSH banding.
+
+Docs pages repeat a lot of boilerplate (imports, `fast_app()` setup,
+`serve()`), so many sections are near-copies of sections stored before. Each
+section's text is reduced to hashed 5-word shingles and a MinHash signature;
+LSH bands find earlier sections whose estimated Jaccard similarity reaches the
+threshold. Depending on the mode a duplicate is
+
+    skip   dropped
+    link   dropped from the chunks table but recorded with the id of its
+           canonical chunk, so the document viewer still lists the section
+
+Signatures of stored chunks are appended to `<db_path>/_dedupe/`
+(`signatures.u32` + `ids.txt`) so later runs detect duplicates of chunks
+stored earlier; links go to `links.jsonl`. Appends hold a file lock and first
+cut both files back to their complete rows, so a crash between the two writes
+can't shift later ids onto the wrong signatures.
+"""
+import os
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from utils.metrics import counter
+from utils.embedding_cache import _file_lock
+
+DEDUPE_MODES = ("off", "skip", "link")
+SHINGLE_WORDS = 5
+PRIME = (1 << 31) - 1
+
+DEDUPE_CHUNKS = counter("fastrag_dedupe_chunks_total", "Sections checked for near-duplicates, by outcome",
+                        labels=("result",))
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    """Distinct 32-bit hashes of the text's k-word shingles"""
+    words = text.lower().split()
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    tokens = np.array([zlib.crc32(w.encode()) for w in words], dtype=np.uint64)
+    n = max(1, len(words) - k + 1)
+    hashes = np.zeros(n, dtype=np.uint64)
+    for j in range(min(k, len(words))):
+        hashes = (hashes * np.uint64(1000003) + tokens[j:j + n]) & np.uint64(0xFFFFFFFF)
+    return np.unique(hashes)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows per band) whose S-curve midpoint, (1/b)^(1/r), is the highest one below `threshold`.
+
+    Erring low favours recall; candidates are checked against the threshold afterwards anyway.
+    """
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    below = [br for br in options if (1 / br[0]) ** (1 / br[1]) <= threshold]
+    return max(below or options[:1], key=lambda br: (1 / br[0]) ** (1 / br[1]))
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        if hashes.size == 0:
+            return np.full(self.num_perm, PRIME, dtype=np.uint32)
+        # a < 2^31 and hashes < 2^32, so a * h fits in 64 bits
+        return ((self.a * hashes[None, :] + self.b) % np.uint64(PRIME)).min(axis=1).astype(np.uint32)
+
+
+class ChunkDeduper:
+    """LSH index over the signatures of stored chunks"""
+
+    def __init__(self, path: str, mode: str = "skip", threshold: float = 0.85, num_perm: int = 64,
+                 valid_ids: Optional[set] = None):
+        if mode not in DEDUPE_MODES:
+            raise ValueError(f"Unknown dedupe mode '{mode}', expected one of {', '.join(DEDUPE_MODES)}")
+        self.path = path
+        self.mode = mode
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.links: Dict[str, List[Dict[str, Any]]] = {}
+        self.counts = {"unique": 0, "duplicate": 0}
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load(valid_ids)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        self.signatures[chunk_id] = signature
+        for band, key in zip(self.buckets, self._band_keys(signature)):
+            band.setdefault(key, []).append(chunk_id)
+
+    def find(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """The most similar indexed chunk at or above the threshold, with its estimated similarity"""
+        best = None
+        seen = set()
+        for band, key in zip(self.buckets, self._band_keys(signature)):
+            for chunk_id in band.get(key, ()):
+                if chunk_id in seen or chunk_id not in self.signatures:
+                    continue
+                seen.add(chunk_id)
+                similarity = float(np.mean(self.signatures[chunk_id] == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (chunk_id, similarity)
+        return best
+
+    def forget_doc(self, doc_id: str):
+        """Drop a document's chunks, e.g. before it is stored again.
+
+        Other documents' sections linked to one of its chunks are unlinked too: the
+        chunk is gone, or will hold different content once the document is stored again.
+        """
+        prefix = f"{doc_id}_chunk_"
+        for chunk_id in [c for c in self.signatures if c.startswith(prefix)]:
+            del self.signatures[chunk_id]  # bucket entries are skipped once their signature is gone
+        records = []
+        if self.links.pop(doc_id, None) is not None:
+            records.append({"doc_id": doc_id, "forget": True})
+        for other, links in list(self.links.items()):
+            dangling = [link for link in links if link["canonical_id"].startswith(prefix)]
+            if dangling:
+                self.links[other] = [link for link in links if not link["canonical_id"].startswith(prefix)]
+                records += [{"doc_id": other, "id": link["id"], "unlink": True} for link in dangling]
+        if records and self.path:
+            self._append_links(records)
+
+    def check(self, doc_id: str, chunks: List[Dict[str, Any]]) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """Indices of the chunks to store and link records for the duplicates.
+
+        Kept chunks are indexed right away, so duplicates within the document are
+        caught too; `commit` persists them once they are stored.
+        """
+        keep, links = [], []
+        for i, chunk in enumerate(chunks):
+            chunk_id = f"{doc_id}_chunk_{i}"
+            signature = self.hasher.signature(chunk["content"])
+            match = self.find(signature)
+            if match is None:
+                self.add(chunk_id, signature)
+                keep.append(i)
+                continue
+            links.append({"id": chunk_id, "doc_id": doc_id, "section_title": chunk.get("title", ""),
+                          "section_level": chunk.get("level", 1), "canonical_id": match[0],
+                          "similarity": round(match[1], 3)})
+        self.counts["unique"] += len(keep)
+        self.counts["duplicate"] += len(links)
+        DEDUPE_CHUNKS.inc(len(keep), result="unique")
+        DEDUPE_CHUNKS.inc(len(links), result="duplicate")
+        return keep, links
+
+    def commit(self, chunk_ids: List[str], links: List[Dict[str, Any]]):
+        """Persist the signatures of stored chunks (and, in link mode, the duplicates' links)"""
+        if not self.path:
+            return
+        if chunk_ids:
+            with _file_lock(os.path.join(self.path, "lock")):
+                self._truncate_torn_rows()
+                with open(os.path.join(self.path, "signatures.u32"), "ab") as f:
+                    f.write(np.stack([self.signatures[c] for c in chunk_ids]).astype(np.uint32).tobytes())
+                # ids last: a signature row only counts once its id is written
+                with open(os.path.join(self.path, "ids.txt"), "a") as f:
+                    f.write("".join(f"{c}\n" for c in chunk_ids))
+        if self.mode == "link" and links:
+            self._append_links(links)
+            self.links.setdefault(links[0]["doc_id"], []).extend(links)
+
+    def _truncate_torn_rows(self):
+        """Cut signatures.u32 and ids.txt back to the rows both hold in full"""
+        ids_path = os.path.join(self.path, "ids.txt")
+        sig_path = os.path.join(self.path, "signatures.u32")
+        row_bytes = 4 * self.hasher.num_perm
+        ends = [0]  # byte offset after each complete id line
+        if os.path.exists(ids_path):
+            with open(ids_path, "rb") as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        ends.append(ends[-1] + len(line))
+        signature_rows = os.path.getsize(sig_path) // row_bytes if os.path.exists(sig_path) else 0
+        rows = min(len(ends) - 1, signature_rows)
+        for path, size in ((sig_path, rows * row_bytes), (ids_path, ends[rows])):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _append_links(self, records: List[Dict[str, Any]]):
+        with open(os.path.join(self.path, "links.jsonl"), "a") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+
+    def _load(self, valid_ids: Optional[set]):
+        ids_path = os.path.join(self.path, "ids.txt")
+        sig_path = os.path.join(self.path, "signatures.u32")
+        if os.path.exists(ids_path) and os.path.exists(sig_path):
+            with open(ids_path) as f:
+                ids = [line.rstrip("\n") for line in f if line.endswith("\n")]
+            row_bytes = 4 * self.hasher.num_perm
+            n = min(len(ids), os.path.getsize(sig_path) // row_bytes)
+            signatures = np.fromfile(sig_path, dtype=np.uint32, count=n * self.hasher.num_perm)
+            latest = {chunk_id: row for row, chunk_id in enumerate(ids[:n])}
+            for chunk_id, row in latest.items():
+                # Chunks deleted since (or never stored, after a crash) are not canonical for anything
+                if valid_ids is None or chunk_id in valid_ids:
+                    self.add(chunk_id, signatures.reshape(n, -1)[row])
+        links_path = os.path.join(self.path, "links.jsonl")
+        if os.path.exists(links_path):
+            with open(links_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a torn last line
+                    if record.get("forget"):
+                        self.links.pop(record["doc_id"], None)
+                    elif record.get("unlink"):
+                        links = self.links.get(record["doc_id"], [])
+                        self.links[record["doc_id"]] = [link for link in links if link["id"] != record["id"]]
+                    else:
+                        self.links.setdefault(record["doc_id"], []).append(record)
+
+    def summary(self) -> str:
+        total = self.counts["unique"] + self.counts["duplicate"]
+        action = "linked" if self.mode == "link" else "skipped"
+        return (f"Dedupe: {self.counts['duplicate']} of {total} sections {action} as near-duplicates "
+                f"(threshold {self.threshold})")
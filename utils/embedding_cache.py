@@ -0,0 +1,147 @@
+"""On-disk cache of text embeddings.
+
+Embeddings are keyed by (model id, hash of the whitespace-normalized text), so
+re-ingesting unchanged sections after a schema rebuild, chunker tweak or table
+wipe costs a hash lookup instead of a forward pass.
+
+Each model gets a directory holding two append-only files: `vectors.f32`, a
+float32 matrix read through a memory map, and `keys.bin`, the 16-byte key of
+every row. Rows are appended vectors first, keys second, under a file lock, so
+a crash can leave at most a torn tail, which is truncated on the next write.
+The app and the ingestion worker can share one cache.
+"""
+import os
+import re
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Callable, List
+import numpy as np
+from utils.metrics import counter
+
+try:
+    import fcntl
+except ImportError:  # Windows: rely on the in-process lock only
+    fcntl = None
+
+KEY_BYTES = 16
+
+EMBEDDING_CACHE_LOOKUPS = counter("fastrag_embedding_cache_lookups_total", "Embedding cache lookups",
+                                  labels=("result",))
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """Exclusive lock on `path` across processes; with `blocking=False`, yields whether it was taken"""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """Content-addressed float32 embeddings for one model"""
+
+    def __init__(self, path: str, model_id: str, dim: int):
+        self.model_id = model_id
+        self.dim = dim
+        self.dir = os.path.join(path, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_id))
+        os.makedirs(self.dir, exist_ok=True)
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.lock_path = os.path.join(self.dir, "lock")
+        self._index = {}
+        self._rows = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.model_id}\0{normalize_text(text)}".encode(), digest_size=KEY_BYTES).digest()
+
+    def _complete_rows(self) -> int:
+        """Rows whose vector and key are both fully written"""
+        keys = os.path.getsize(self.keys_path) // KEY_BYTES if os.path.exists(self.keys_path) else 0
+        vectors = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        return min(keys, vectors)
+
+    def _load(self):
+        """Index rows appended since the last load (by this or another process)"""
+        rows = self._complete_rows()
+        if rows <= self._rows:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._rows * KEY_BYTES)
+            data = f.read((rows - self._rows) * KEY_BYTES)
+        for i in range(rows - self._rows):
+            self._index.setdefault(data[i * KEY_BYTES:(i + 1) * KEY_BYTES], self._rows + i)
+        self._rows = rows
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def encode(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings of `texts`, calling `encode` only for the ones not cached yet"""
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            self._load()
+            rows = [self._index.get(key) for key in keys]
+            matrix = self._matrix
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        cached = [i for i, row in enumerate(rows) if row is not None]
+        if cached:
+            out[cached] = matrix[[rows[i] for i in cached]]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            out[missing] = np.asarray(encode([texts[i] for i in missing]), dtype=np.float32).reshape(len(missing), -1)
+            self._append([keys[i] for i in missing], out[missing])
+        self.hits += len(cached)
+        self.misses += len(missing)
+        EMBEDDING_CACHE_LOOKUPS.inc(len(cached), result="hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(len(missing), result="miss")
+        return out
+
+    def _append(self, keys: List[bytes], vectors: np.ndarray):
+        with self._lock, _file_lock(self.lock_path):
+            self._load()
+            new, seen = [], set()
+            for i, key in enumerate(keys):
+                if key not in self._index and key not in seen:
+                    seen.add(key)
+                    new.append(i)
+            if not new:
+                return
+            # Drop a torn tail left by a crashed writer before appending
+            for path, row_bytes in ((self.vectors_path, 4 * self.dim), (self.keys_path, KEY_BYTES)):
+                if os.path.exists(path) and os.path.getsize(path) > self._rows * row_bytes:
+                    os.truncate(path, self._rows * row_bytes)
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[new], dtype=np.float32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(keys[i] for i in new))
+            self._load()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None}
+
+    def summary(self) -> str:
+        stats = self.stats()
+        rate = f"{stats['hit_rate']:.0%}" if stats["hit_rate"] is not None else "n/a"
+        return f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({rate} hit rate), {stats['entries']} entries"
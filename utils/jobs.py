@@ -0,0 +1,367 @@
+"""Persistent background jobs for ingestion.
+
+Jobs are rows in a small SQLite database (`<db_path>/_jobs.sqlite`). The web
+app submits them; a separate worker process (`python -m utils.jobs worker`,
+started on demand by the app) claims and runs them at a lower CPU priority,
+so re-indexing never competes with live searches for the web process's CPU
+and GIL, and keeps running when the browser that started it goes away.
+
+A running job appends progress events that `follow_job` replays and tails,
+so any number of websocket subscribers can watch it. Cancelling sets a flag
+the worker checks between pages. A job left "running" by a worker that died
+is put back in the queue and resumes after its last finished page; the page
+it was working on continues from its ingestion checkpoints (utils.manifest).
+
+Job kinds are registered in JOB_HANDLERS; "ingest_urls" runs
+`process_single_url` over a list of URLs and "crawl" runs the link-discovering
+crawler from a list of seeds.
+
+Usage: python -m utils.jobs worker | submit [url ...] | crawl [seed ...] | list | cancel <job_id> [--db ./lancedb]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+import subprocess
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+ACTIVE_STATES = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    total INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_by_job ON job_events (job_id, id);
+"""
+
+
+def jobs_path(db_path: str) -> str:
+    return os.path.join(db_path, "_jobs.sqlite")
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """SQLite-backed job queue shared by the web app and worker processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _job(row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def submit(self, kind: str, params: Dict[str, Any], total: int = 0) -> int:
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        with self._connect() as conn:
+            cursor = conn.execute("INSERT INTO jobs (kind, params, total, created_at) VALUES (?, ?, ?, ?)",
+                                  (kind, json.dumps(params), total, time.time()))
+            return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            return self._job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def active_job(self, kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The oldest queued or running job (of `kind`, if given)"""
+        query = "SELECT * FROM jobs WHERE status IN ('queued', 'running')"
+        args = ()
+        if kind:
+            query += " AND kind = ?"
+            args = (kind,)
+        with self._connect() as conn:
+            return self._job(conn.execute(query + " ORDER BY id LIMIT 1", args).fetchone())
+
+    def claim(self, pid: int) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job for worker `pid`"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker died go back to the queue
+                for row in conn.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'").fetchall():
+                    if not _pid_alive(row["worker_pid"]):
+                        conn.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL WHERE id = ?", (row["id"],))
+                row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ? WHERE id = ?",
+                                 (pid, time.time(), row["id"]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row is not None else None
+
+    def add_event(self, job_id: int, payload: Dict[str, Any], done: Optional[int] = None,
+                  total: Optional[int] = None):
+        """Record a progress event (and the number of finished and total steps, if given)"""
+        with self._connect() as conn:
+            conn.execute("INSERT INTO job_events (job_id, created_at, payload) VALUES (?, ?, ?)",
+                         (job_id, time.time(), json.dumps(payload)))
+            if done is not None:
+                conn.execute("UPDATE jobs SET done = ? WHERE id = ?", (done, job_id))
+            if total is not None:
+                conn.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+
+    def events(self, job_id: int, after: int = 0) -> List[tuple]:
+        """(event id, payload) pairs recorded after event id `after`"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, payload FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                                (job_id, after)).fetchall()
+        return [(row["id"], json.loads(row["payload"])) for row in rows]
+
+    def finish(self, job_id: int, status: str, error: Optional[str] = None):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                         (status, error, time.time(), job_id))
+        self.add_event(job_id, {"type": "finished", "status": status, "error": error})
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued job now, or ask the worker to stop a running one; False if already finished"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] not in ACTIVE_STATES:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            if row["status"] == "queued":
+                conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                             (time.time(), job_id))
+            conn.execute("COMMIT")
+        if row["status"] == "queued":
+            self.add_event(job_id, {"type": "finished", "status": "cancelled", "error": None})
+        return True
+
+    def cancel_requested(self, job_id: int) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+
+async def follow_job(store: JobStore, job_id: int, interval: float = 0.5) -> AsyncIterator[Dict[str, Any]]:
+    """Yield a job's events from the beginning, then as they are recorded, ending with its "finished" event"""
+    after = 0
+    while True:
+        events = await asyncio.to_thread(store.events, job_id, after)
+        for after, payload in events:
+            yield payload
+            if payload["type"] == "finished":
+                return
+        if not events and await asyncio.to_thread(store.get, job_id) is None:
+            return
+        await asyncio.sleep(interval)
+
+
+def publish_every() -> int:
+    """Pages between publications of a running job (see utils.publish)"""
+    return max(1, int(os.getenv("FASTRAG_PUBLISH_EVERY", "25")))
+
+
+def ingest_urls(store: JobStore, db, job: Dict[str, Any]) -> str:
+    """Run `process_single_url` over the job's URLs, resuming after the last finished one
+    (and the page that was interrupted from its last checkpointed stage)"""
+    from utils.batch import process_single_url
+    from utils.database import corpus_suffix
+    from utils.manifest import IngestManifest
+    manifest = IngestManifest(db.db_path, corpus_suffix(db.corpus))
+    urls = job["params"]["urls"]
+    try:
+        for i in range(job["done"], len(urls)):
+            if store.cancel_requested(job["id"]):
+                return "cancelled"
+            start = time.time()
+            result = process_single_url(db, urls[i], manifest=manifest)
+            store.add_event(job["id"], {
+                "type": "page", "url": urls[i], "status": result["status"], "error": result.get("error"),
+                "sections": result.get("sections", 0), "seconds": time.time() - start,
+                "done": i + 1, "total": len(urls),
+                "doc_count": db.get_document_count(), "chunk_count": db.get_chunk_count(),
+            }, done=i + 1)
+            if (i + 1) % publish_every() == 0:
+                db.publish()
+        return "done"
+    finally:
+        db.publish()
+
+
+def crawl(store: JobStore, db, job: Dict[str, Any]) -> str:
+    """Crawl from the job's seeds (see utils.crawler), ingesting every page found.
+
+    A new job starts from a fresh frontier unless `params["fresh"]` is false; a
+    requeued one continues the frontier it left behind.
+    """
+    from utils.crawler import Crawler, Frontier, frontier_path
+    from utils.database import corpus_suffix
+    from utils.manifest import IngestManifest
+    params = job["params"]
+    frontier = Frontier(frontier_path(db.db_path, corpus_suffix(db.corpus)))
+    if job["done"] == 0 and params.get("fresh", True):
+        frontier.reset()
+    max_pages = params.get("max_pages", 1000)
+    crawler = Crawler(db, frontier, IngestManifest(db.db_path, corpus_suffix(db.corpus)), scope=params.get("scope"), max_pages=max_pages,
+                      max_depth=params.get("max_depth"), concurrency=params.get("concurrency", 4),
+                      rate=params.get("rate", 2.0))
+    crawler.seed(params["seeds"])
+    done = job["done"]
+    every = publish_every()
+
+    def on_page(page: Dict[str, Any]):
+        nonlocal done
+        done += 1
+        # The total grows as links are discovered
+        total = max(done, min(max_pages, sum(frontier.counts().values())))
+        store.add_event(job["id"], {
+            "type": "page", "url": page["url"], "status": page["status"], "error": page.get("error"),
+            "sections": page.get("sections", 0), "seconds": page["seconds"], "discovered": page["discovered"],
+            "done": done, "total": total,
+            "doc_count": db.get_document_count(), "chunk_count": db.get_chunk_count(),
+        }, done=done, total=total)
+        if done % every == 0:
+            db.publish()
+
+    try:
+        stopped = crawler.run(on_page, should_stop=lambda: store.cancel_requested(job["id"]))
+    finally:
+        db.publish()
+    return "cancelled" if stopped else "done"
+
+
+JOB_HANDLERS: Dict[str, Callable[[JobStore, Any, Dict[str, Any]], str]] = {
+    "ingest_urls": ingest_urls,
+    "crawl": crawl,
+}
+
+
+def run_job(store: JobStore, db, job: Dict[str, Any]):
+    try:
+        status = JOB_HANDLERS[job["kind"]](store, db, job)
+        store.finish(job["id"], status)
+    except Exception as e:
+        store.finish(job["id"], "failed", str(e))
+
+
+def run_worker(db_path: str, idle_timeout: float = 300.0, poll_interval: float = 1.0):
+    """Claim and run jobs until the queue has been empty for `idle_timeout` seconds (0 = forever).
+
+    Each job ingests into the corpus named in its params (FASTRAG_CORPUS by default).
+    """
+    if hasattr(os, "nice"):
+        os.nice(int(os.getenv("FASTRAG_WORKER_NICE", "10")))
+    store = JobStore(jobs_path(db_path))
+    databases = {}
+    idle_since = time.monotonic()
+    while True:
+        job = store.claim(os.getpid())
+        if job is None:
+            if idle_timeout and time.monotonic() - idle_since > idle_timeout:
+                return
+            time.sleep(poll_interval)
+            continue
+        corpus = job["params"].get("corpus")
+        if corpus not in databases:
+            from utils.database import FastHTMLDatabase
+            databases[corpus] = FastHTMLDatabase(db_path, corpus=corpus)
+            databases[corpus].migrate()
+        print(f"Running job {job['id']} ({job['kind']})")
+        run_job(store, databases[corpus], job)
+        idle_since = time.monotonic()
+
+
+def start_worker(db_path: str) -> subprocess.Popen:
+    """Launch a worker process for `db_path` from the project root"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen([sys.executable, "-m", "utils.jobs", "worker", "--db", os.path.abspath(db_path),
+                             "--idle-timeout", "300"], cwd=project_root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background ingestion jobs")
+    parser.add_argument("command", choices=["worker", "submit", "crawl", "list", "cancel"])
+    parser.add_argument("args", nargs="*", help="URLs for submit (default: the built-in doc list), seeds for "
+                                                "crawl (default: FASTRAG_CRAWL_SEEDS), job id for cancel")
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--corpus", default=None, help="submit/crawl: corpus to ingest into (default: FASTRAG_CORPUS)")
+    parser.add_argument("--idle-timeout", type=float, default=0, help="worker: exit after this many idle seconds")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(args.db, idle_timeout=args.idle_timeout)
+        return
+    store = JobStore(jobs_path(args.db))
+    if args.command == "submit":
+        from utils.batch import fasthtml_doc_urls
+        urls = args.args or fasthtml_doc_urls
+        params = {"urls": urls, "corpus": args.corpus} if args.corpus else {"urls": urls}
+        print(f"Submitted job {store.submit('ingest_urls', params, total=len(urls))}")
+    elif args.command == "crawl":
+        from utils.crawler import crawl_settings
+        params = crawl_settings()
+        params["seeds"] = args.args or params["seeds"]
+        if args.corpus:
+            params["corpus"] = args.corpus
+        print(f"Submitted job {store.submit('crawl', params, total=len(params['seeds']))}")
+    elif args.command == "list":
+        for job in store.list_jobs():
+            print(f"{job['id']:>5}  {job['kind']:<12}{job['status']:<10}{job['done']:>5}/{job['total']:<5} {job['error'] or ''}")
+    else:
+        for job_id in args.args:
+            print(f"Job {job_id}: {'cancelling' if store.cancel(int(job_id)) else 'not active'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Per-URL checkpoints for ingestion.
+
+Ingesting a page goes through four stages:
+
+    fetched    the raw HTML is saved
+    parsed     the XML document, title and sections are saved
+    embedded   the document and section embeddings are saved
+    stored     the document and its chunks are in LanceDB
+
+`IngestManifest` records the last finished stage of every URL in a SQLite
+database (`<db_path>/_ingest_manifest.sqlite`, suffixed per corpus) and keeps each stage's output
+under `<db_path>/_ingest/<url hash>/` until the page is stored. A crashed run
+therefore picks every page up at its next stage instead of starting over, and
+`unfinished()` lists exactly the pages that still need work.
+"""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+STAGES = ("fetched", "parsed", "embedded", "stored")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    stage TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def manifest_path(db_path: str, suffix: str = "") -> str:
+    return os.path.join(db_path, f"_ingest_manifest{suffix}.sqlite")
+
+
+def _write_atomic(path: str, write):
+    """Write through a temporary file so a crash never leaves a truncated artifact"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class IngestManifest:
+    """Stage checkpoints and intermediate outputs for pages being ingested into `db_path`"""
+
+    def __init__(self, db_path: str, suffix: str = ""):
+        self.path = manifest_path(db_path, suffix)
+        self.artifact_dir = os.path.join(db_path, f"_ingest{suffix}")
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stage(self, url: str) -> Optional[str]:
+        """The last stage `url` finished, or None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT stage FROM pages WHERE url = ?", (url,)).fetchone()
+        return row["stage"] if row else None
+
+    def stages(self, urls: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+        """Last finished stage per URL (every recorded URL if `urls` is None)"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT url, stage FROM pages").fetchall()
+        recorded = {row["url"]: row["stage"] for row in rows}
+        return recorded if urls is None else {url: recorded.get(url) for url in urls}
+
+    def mark(self, url: str, stage: str):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown ingestion stage '{stage}'")
+        with self._connect() as conn:
+            conn.execute("INSERT INTO pages (url, stage, error, updated_at) VALUES (?, ?, NULL, ?) "
+                         "ON CONFLICT(url) DO UPDATE SET stage = excluded.stage, error = NULL, "
+                         "updated_at = excluded.updated_at", (url, stage, time.time()))
+        if stage == "stored":
+            shutil.rmtree(self._dir(url), ignore_errors=True)
+
+    def fail(self, url: str, error: str):
+        """Record an error; the page keeps its last finished stage"""
+        with self._connect() as conn:
+            conn.execute("INSERT INTO pages (url, error, attempts, updated_at) VALUES (?, ?, 1, ?) "
+                         "ON CONFLICT(url) DO UPDATE SET error = excluded.error, attempts = attempts + 1, "
+                         "updated_at = excluded.updated_at", (url, error, time.time()))
+
+    def forget(self, url: str):
+        """Drop a page's checkpoints so it is ingested from scratch"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+        shutil.rmtree(self._dir(url), ignore_errors=True)
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Recorded pages that are not stored yet, oldest first"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM pages WHERE stage IS NULL OR stage != 'stored' "
+                                "ORDER BY updated_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self) -> Dict[str, int]:
+        """Number of pages per last finished stage ("none" for pages that failed before fetching)"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT COALESCE(stage, 'none') AS stage, COUNT(*) AS n FROM pages "
+                                "GROUP BY stage").fetchall()
+        return {row["stage"]: row["n"] for row in rows}
+
+    def _dir(self, url: str) -> str:
+        return os.path.join(self.artifact_dir, hashlib.md5(url.encode()).hexdigest())
+
+    def save_html(self, url: str, html: bytes):
+        os.makedirs(self._dir(url), exist_ok=True)
+        _write_atomic(os.path.join(self._dir(url), "page.html"), lambda f: f.write(html))
+        self.mark(url, "fetched")
+
+    def load_html(self, url: str) -> bytes:
+        with open(os.path.join(self._dir(url), "page.html"), "rb") as f:
+            return f.read()
+
+    def save_parsed(self, url: str, xml_content: str, title: str, sections: List[Dict[str, Any]]):
+        os.makedirs(self._dir(url), exist_ok=True)
+        data = json.dumps({"xml_content": xml_content, "title": title, "sections": sections}).encode()
+        _write_atomic(os.path.join(self._dir(url), "parsed.json"), lambda f: f.write(data))
+        self.mark(url, "parsed")
+
+    def load_parsed(self, url: str) -> Dict[str, Any]:
+        with open(os.path.join(self._dir(url), "parsed.json")) as f:
+            return json.load(f)
+
+    def save_embeddings(self, url: str, doc_vector: np.ndarray, chunk_vectors: np.ndarray):
+        os.makedirs(self._dir(url), exist_ok=True)
+        _write_atomic(os.path.join(self._dir(url), "embeddings.npz"),
+                      lambda f: np.savez(f, doc=doc_vector, chunks=chunk_vectors))
+        self.mark(url, "embedded")
+
+    def load_embeddings(self, url: str):
+        with np.load(os.path.join(self._dir(url), "embeddings.npz")) as data:
+            return data["doc"], data["chunks"]
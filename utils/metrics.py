@@ -0,0 +1,231 @@
+"""Lightweight in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms live in a module-level registry and are
+rendered by `render_prometheus()` for the `/metrics` route. `timer()` records
+a duration into a histogram and, while a request is being timed (see
+`MetricsMiddleware`), also adds it to that request's Server-Timing breakdown.
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond vector math to multi-second generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+DEBUG_TIMING = os.getenv("FASTRAG_DEBUG", "").lower() in ("1", "true", "yes")
+
+# Stage timings for the request currently being handled, when enabled
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "fastrag_request_timings", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        """Sum and count for one label set (handy for reports and tests)"""
+        state = self._values.get(self._key(labels))
+        return {"sum": state[-2], "count": state[-1]} if state else {"sum": 0.0, "count": 0.0}
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    le = _format_labels(self.label_names, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {count}")
+                inf = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, cls, name: str, help: str, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.get_or_create(Counter, name, help, labels=labels)
+
+
+def gauge(name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.get_or_create(Gauge, name, help, labels=labels)
+
+
+def histogram(name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.get_or_create(Histogram, name, help, labels=labels, buckets=buckets)
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
+
+
+def record_stage(stage: str, seconds: float):
+    """Add a stage duration to the current request's Server-Timing breakdown, if one is active"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds * 1000))
+
+
+@contextmanager
+def timer(metric: Histogram, stage: Optional[str] = None, **labels):
+    """Time a block into `metric`; `stage` names it in the request's Server-Timing header"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metric.observe(elapsed, **labels)
+        if stage:
+            record_stage(stage, elapsed)
+
+
+HTTP_REQUEST_SECONDS = histogram(
+    "fastrag_http_request_seconds", "Time until the response body starts, by route",
+    labels=("method", "route", "status"))
+
+
+def _server_timing_header(timings: List[Tuple[str, float]], total_ms: float) -> bytes:
+    parts = [f"{name};dur={ms:.2f}" for name, ms in timings]
+    parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request; adds Server-Timing headers when FASTRAG_DEBUG is set"""
+
+    def __init__(self, app, debug: bool = DEBUG_TIMING):
+        self.app = app
+        self.debug = debug
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        token = _request_timings.set([] if self.debug else None)
+        timings = _request_timings.get()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                status = message.get("status", 0)
+                # Keep label cardinality bounded: label by the matched route's template
+                # (`/jobs/{job_id}`), so unknown paths share one series
+                route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+                HTTP_REQUEST_SECONDS.observe(elapsed, method=scope.get("method", ""), route=route, status=status)
+                if timings is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing_header(timings, elapsed * 1000)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
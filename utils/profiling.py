@@ -0,0 +1,140 @@
+"""Opt-in cProfile captures for single ingests and queries.
+
+Profiling is off unless FASTRAG_PROFILE is set (`ingest`, `query` or `all`)
+or a route is called with `profile=1`. Each capture is written to
+FASTRAG_PROFILE_DIR (default ./profiles) as a `.prof` file, loadable with
+pstats or snakeviz, next to a `.json` file holding its label and timing.
+
+Usage: python -m utils.profiling ingest <url> | query "<question>" [--db ./lancedb]
+"""
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import threading
+import argparse
+from io import StringIO
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+
+PROFILE_DIR = os.getenv("FASTRAG_PROFILE_DIR", "./profiles")
+PROFILE_KINDS = ("ingest", "query")
+
+_env_setting = os.getenv("FASTRAG_PROFILE", "").lower()
+ENABLED_KINDS = set(PROFILE_KINDS) if _env_setting in ("1", "true", "yes", "all") else set(
+    k for k in _env_setting.split(",") if k in PROFILE_KINDS)
+
+# Only one cProfile profiler can be active per process on recent Pythons
+_profiler_lock = threading.Lock()
+
+
+def is_enabled(kind: str, requested: bool = False) -> bool:
+    return requested or kind in ENABLED_KINDS
+
+
+def _slug(label: str, max_length: int = 48) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-")[:max_length] or "capture"
+
+
+@contextmanager
+def profiled(label: str, kind: str, enabled: bool = False, profile_dir: Optional[str] = None):
+    """Profile the block with cProfile when `enabled`, saving it under `label`"""
+    if not enabled:
+        yield
+        return
+    if not _profiler_lock.acquire(blocking=False):
+        print(f"Warning: profiler busy, not profiling {kind} '{label}'")
+        yield
+        return
+
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+        save_profile(profile, label, kind, time.perf_counter() - start, profile_dir)
+    finally:
+        _profiler_lock.release()
+
+
+def save_profile(profile: cProfile.Profile, label: str, kind: str, seconds: float,
+                 profile_dir: Optional[str] = None) -> str:
+    """Write the .prof stats and .json metadata; returns the capture name"""
+    profile_dir = profile_dir or PROFILE_DIR
+    os.makedirs(profile_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{kind}-{_slug(label)}"
+    profile.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+    meta = {"name": name, "kind": kind, "label": label, "seconds": seconds,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    with open(os.path.join(profile_dir, f"{name}.json"), "w") as f:
+        json.dump(meta, f)
+    return name
+
+
+def list_profiles(profile_dir: Optional[str] = None) -> List[Dict]:
+    """Metadata of the stored captures, newest first"""
+    profile_dir = profile_dir or PROFILE_DIR
+    if not os.path.isdir(profile_dir):
+        return []
+    captures = []
+    for filename in os.listdir(profile_dir):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(profile_dir, filename)) as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(captures, key=lambda c: c["name"], reverse=True)
+
+
+def profile_path(name: str, profile_dir: Optional[str] = None) -> Optional[str]:
+    """Path of a capture's .prof file, or None for unknown (or unsafe) names"""
+    profile_dir = profile_dir or PROFILE_DIR
+    if not re.fullmatch(r"[A-Za-z0-9-]+", name):
+        return None
+    path = os.path.join(profile_dir, f"{name}.prof")
+    return path if os.path.exists(path) else None
+
+
+def profile_summary(name: str, limit: int = 30, profile_dir: Optional[str] = None) -> Optional[str]:
+    """Top functions by cumulative time, as pstats text"""
+    path = profile_path(name, profile_dir)
+    if path is None:
+        return None
+    out = StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=PROFILE_KINDS)
+    parser.add_argument("target", help="URL to ingest or question to search")
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase
+    from utils.scraper import fetch_page
+    database = FastHTMLDatabase(args.db)
+    if args.kind == "ingest":
+        from utils.batch import store_page
+        if database.url_exists(args.target):
+            import tempfile
+            print(f"{args.target} is already stored; profiling into a scratch database")
+            database = FastHTMLDatabase(tempfile.mkdtemp(prefix="fastrag-profile-"))
+        soup = fetch_page(args.target)  # network time stays out of the profile
+        with profiled(args.target, "ingest", enabled=True):
+            store_page(database, args.target, soup)
+    else:
+        with profiled(args.target, "query", enabled=True):
+            database.search_similar(args.target, limit=args.limit)
+    latest = list_profiles()[0]
+    print(profile_summary(latest["name"]))
+    print(f"Saved {os.path.join(PROFILE_DIR, latest['name'])}.prof")
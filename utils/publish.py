@@ -0,0 +1,138 @@
+"""Published table versions: what searches read while ingestion writes.
+
+LanceDB keeps every version of a table, so searches can stay on a complete,
+consistent version while the ingestion worker appends new ones. At safe points
+(between pages) ingestion calls `FastHTMLDatabase.publish()`, which records the
+current docs and chunks versions in `<db_path>/_published.json` (suffixed per
+corpus). The file is replaced atomically. Pinned databases (the web app) check
+the file before every read and move to a newly published version by opening
+fresh table handles; a query already running keeps the handles, and so the
+version, it started with.
+
+Old versions are pruned as each publication is made, but only those older
+than the publication that was in force `FASTRAG_VERSION_GRACE_SECONDS` ago, so
+no reader can still be on them. Nothing is pruned until a publication is that
+old. Pruning compacts the table, which writes new versions holding the same
+rows, so it runs first and the compacted versions are the ones published.
+Until then each publication still compacts the tables, keeping every version;
+either way the scalar indexes are brought up to date with the rows added since
+they were built.
+
+`migrate` adds the columns of the current schema to tables created by an
+older version. Writers (batch ingestion, the job worker) do this on start;
+pinned readers never rewrite tables.
+
+Usage: python -m utils.publish status|publish|migrate [--db ./lancedb] [--corpus fasthtml]
+"""
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+HISTORY = 20
+# Versions written shortly before the one being kept are kept too, since the
+# cleanup cutoff is computed before compaction runs
+PRUNE_MARGIN = timedelta(seconds=5)
+# Cleanup horizon of a compaction that must not remove any version
+KEEP_ALL = timedelta(days=36500)
+
+
+def published_path(db_path: str, suffix: str = "") -> str:
+    return os.path.join(db_path, f"_published{suffix}.json")
+
+
+class PublishedVersions:
+    """The published-version pointer of one corpus, with the last few publications"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._stamp = None
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def changed(self) -> bool:
+        """Whether the pointer was written (or removed) since the last call; one stat per call"""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+    def write(self, docs_version: int, chunks_version: int) -> Dict[str, Any]:
+        """Publish a docs/chunks version pair; returns the new pointer"""
+        previous = self.read()
+        history: List[Dict[str, Any]] = []
+        if previous is not None:
+            history = [{k: previous[k] for k in ("docs_version", "chunks_version", "published_at")}]
+            history += previous.get("history", [])
+        record = {"docs_version": docs_version, "chunks_version": chunks_version,
+                  "published_at": time.time(), "history": history[:HISTORY]}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.path)
+        return record
+
+    @staticmethod
+    def in_force_at(record: Dict[str, Any], when: float) -> Optional[Dict[str, Any]]:
+        """The publication readers were on at time `when` (None if it predates all of them)"""
+        for publication in [record] + record.get("history", []):
+            if publication["published_at"] <= when:
+                return publication
+        return None
+
+
+def prune_versions(table, keep_version: int) -> bool:
+    """Compact the table and remove versions older than `keep_version`; False if it is unknown"""
+    timestamps = {v["version"]: v["timestamp"] for v in table.list_versions()}
+    if keep_version not in timestamps:
+        return False
+    ts = timestamps[keep_version]
+    now = datetime.now(ts.tzinfo) if ts.tzinfo else datetime.now()
+    table.optimize(cleanup_older_than=max(timedelta(0), now - ts) + PRUNE_MARGIN)
+    return True
+
+
+def compact(table):
+    """Compact the table and update its indexes, keeping every version"""
+    table.optimize(cleanup_older_than=KEEP_ALL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "publish", "migrate"])
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--corpus", default=None, help="Corpus (default: FASTRAG_CORPUS or fasthtml)")
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase
+    db = FastHTMLDatabase(args.db, corpus=args.corpus)
+    if args.command == "migrate":
+        added = db.migrate()
+        print(f"Added {', '.join(added)}" if added else f"'{db.corpus}' is up to date")
+    elif args.command == "publish":
+        db.publish()
+    record = db.published.read()
+    if record is None:
+        print(f"Nothing published for '{db.corpus}': searches read the latest versions")
+        return
+    print(f"Latest: docs v{db.docs_table.version}, chunks v{db.chunks_table.version}")
+    for i, publication in enumerate([record] + record["history"]):
+        when = datetime.fromtimestamp(publication["published_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{'published' if i == 0 else '':<10} docs v{publication['docs_version']:<6} "
+              f"chunks v{publication['chunks_version']:<6} {when}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Compact encodings for normalized embedding matrices.
+
+- float16: half precision, 2 bytes per dimension
+- int8: symmetric scalar quantization with one scale per dimension, 1 byte per dimension
+- binary: sign bits packed 8 per byte, used as a Hamming-distance prefilter
+"""
+from typing import Optional, Tuple
+import numpy as np
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Number of set bits for every byte value, for vectorized popcount
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def quantize(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode a float matrix as `dtype`, returning (codes, per-dimension scales or None)"""
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported storage dtype '{dtype}', expected one of {STORAGE_DTYPES}")
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype != "int8":
+        return matrix.astype(dtype), None
+
+    if matrix.size == 0:
+        return matrix.astype(np.int8), np.ones(matrix.shape[1] if matrix.ndim == 2 else 0, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decode quantized rows back to float32"""
+    matrix = np.asarray(codes, dtype=np.float32)
+    return matrix * scales if scales is not None else matrix
+
+
+def binary_codes(matrix: np.ndarray) -> np.ndarray:
+    """Pack the sign of every dimension into bits (rows x ceil(dim / 8) uint8)"""
+    return np.packbits(np.asarray(matrix) > 0, axis=1)
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """Hamming distance between every packed row and one packed query"""
+    return POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.uint32)
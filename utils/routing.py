@@ -0,0 +1,117 @@
+"""Pick the Claude model and token budget for a question.
+
+A policy lists named routes (model + max_tokens) and ordered rules. The first
+rule whose conditions all match the query features decides the route;
+otherwise the policy's default route is used. Features are computed from the
+question text and the retrieved chunks:
+
+    words           number of words in the question
+    wants_code      the question asks for code / an example / an implementation
+    top_similarity  cosine similarity of the best chunk (from LanceDB's `_distance`);
+                    None when no chunk has one, e.g. exact API symbol matches
+    mode            "rag" or "no_rag"
+
+Rule conditions: min_words, max_words, wants_code, min_similarity,
+max_similarity, mode. Point FASTRAG_ROUTING_POLICY at a JSON file to override
+any part of DEFAULT_POLICY, e.g.
+
+    {"routes": {"quick": {"model": "claude-3-5-haiku-20241022", "max_tokens": 500}},
+     "rules": [{"route": "quick", "when": {"max_words": 10, "min_similarity": 0.6}}]}
+
+Prices are USD per million tokens and only feed cost reporting.
+"""
+import os
+import re
+import json
+from typing import List, Dict, Any, Optional
+
+DEFAULT_POLICY = {
+    "default": "standard",
+    "routes": {
+        "quick": {"model": "claude-3-5-haiku-20241022", "max_tokens": 600},
+        "standard": {"model": "claude-3-5-sonnet-20241022", "max_tokens": 2000},
+        "code": {"model": "claude-3-5-sonnet-20241022", "max_tokens": 3000},
+    },
+    "rules": [
+        {"route": "code", "when": {"wants_code": True}},
+        # Short lookups that the retrieved docs clearly cover
+        {"route": "quick", "when": {"max_words": 12, "min_similarity": 0.55, "mode": "rag"}},
+    ],
+    "prices": {
+        "claude-3-5-haiku-20241022": {"input": 0.8, "output": 4.0},
+        "claude-3-5-sonnet-20241022": {"input": 3.0, "output": 15.0},
+    },
+}
+
+CODE_PATTERN = re.compile(
+    r"\b(code|example|examples|snippet|snippets|implement|implementation|write (?:a|an|the|me)|show me)\b",
+    re.IGNORECASE)
+
+
+def query_features(query: str, search_results: Optional[List[Dict]] = None) -> Dict[str, Any]:
+    distances = [r["_distance"] for r in search_results or [] if r.get("_distance") is not None]
+    # `_distance` is squared L2 between unit vectors, i.e. 2 - 2cos
+    top_similarity = 1 - min(distances) / 2 if distances else None
+    return {
+        "words": len(query.split()),
+        "wants_code": bool(CODE_PATTERN.search(query)) or "```" in query,
+        "top_similarity": top_similarity,
+        "mode": "rag" if search_results else "no_rag",
+    }
+
+
+def _matches(when: Dict[str, Any], features: Dict[str, Any]) -> bool:
+    similarity = features["top_similarity"]
+    checks = {
+        "min_words": lambda v: features["words"] >= v,
+        "max_words": lambda v: features["words"] <= v,
+        "wants_code": lambda v: features["wants_code"] == v,
+        "min_similarity": lambda v: similarity is not None and similarity >= v,
+        "max_similarity": lambda v: similarity is not None and similarity <= v,
+        "mode": lambda v: features["mode"] == v,
+    }
+    for name, value in when.items():
+        if name not in checks:
+            raise ValueError(f"Unknown routing condition '{name}'")
+        if not checks[name](value):
+            return False
+    return True
+
+
+def load_policy(path: Optional[str] = None) -> Dict[str, Any]:
+    """DEFAULT_POLICY with the JSON file at `path` (or FASTRAG_ROUTING_POLICY) laid over it"""
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    path = path or os.getenv("FASTRAG_ROUTING_POLICY")
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for key in ("routes", "prices"):
+            policy[key].update(overrides.pop(key, {}))
+        policy.update(overrides)
+    if policy["default"] not in policy["routes"]:
+        raise ValueError(f"Default route '{policy['default']}' is not defined")
+    for rule in policy["rules"]:
+        if rule["route"] not in policy["routes"]:
+            raise ValueError(f"Rule refers to unknown route '{rule['route']}'")
+    return policy
+
+
+class ModelRouter:
+    """Applies a routing policy to questions"""
+
+    def __init__(self, policy_path: Optional[str] = None):
+        self.policy = load_policy(policy_path)
+
+    def route(self, query: str, search_results: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """The route name, model and max_tokens for a question, plus the features behind the choice"""
+        features = query_features(query, search_results)
+        name = next((rule["route"] for rule in self.policy["rules"] if _matches(rule.get("when", {}), features)),
+                    self.policy["default"])
+        return {"route": name, **self.policy["routes"][name], "features": features}
+
+    def estimate_cost(self, model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+        """USD cost of a call from the policy's price table (None for unpriced models)"""
+        price = self.policy["prices"].get(model)
+        if price is None:
+            return None
+        return (input_tokens * price["input"] + output_tokens * price["output"]) / 1_000_000
@@ -1,13 +1,23 @@
+import os
 import requests
 import textwrap
 from bs4 import BeautifulSoup, NavigableString
 import re
 from typing import List, Dict, Any
+from utils.symbols import code_symbols, inline_symbols
 
-def fetch_page(url):
-    response = requests.get(url)
+# Seconds to wait for a connection and then between bytes of the response, so a
+# stalled server fails the page instead of holding a fetch thread forever
+FETCH_TIMEOUT = (float(os.getenv("FASTRAG_FETCH_CONNECT_TIMEOUT", "10")),
+                 float(os.getenv("FASTRAG_FETCH_READ_TIMEOUT", "30")))
+
+def fetch_html(url, timeout=FETCH_TIMEOUT) -> bytes:
+    response = requests.get(url, timeout=timeout)
     response.raise_for_status()
-    return BeautifulSoup(response.content, 'html.parser')
+    return response.content
+
+def fetch_page(url):
+    return BeautifulSoup(fetch_html(url), 'html.parser')
 
 def get_page_text(url):
     soup = fetch_page(url)
@@ -145,6 +155,8 @@ def html_to_xml(content, source_url=""):
     # Process content maintaining natural flow
     current_section = None
     current_container = doc  # Start with document root
+    # API symbols named in each section's code examples and inline code
+    section_symbols = []
     
     # Get all relevant elements in document order
     elements = content.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'pre', 'ul', 'ol', 'div'])
@@ -157,6 +169,7 @@ def html_to_xml(content, source_url=""):
             current_section = section
             current_container = section  # Content now goes into this section
             doc.append(section)
+            section_symbols.append((section, []))
             
         elif element.name == 'div' and 'cell-output' in element.get('class', []):
             # Handle Jupyter cell output
@@ -202,6 +215,8 @@ def html_to_xml(content, source_url=""):
             else:
                 code_tag.string = code_text.strip()
             code_example.append(code_tag)
+            if section_symbols:
+                section_symbols[-1][1].extend(code_symbols(code_tag.string))
             
             current_container.append(code_example)
                 
@@ -216,6 +231,9 @@ def html_to_xml(content, source_url=""):
                 list_tag.append(item_tag)
             
             current_container.append(list_tag)
+            if section_symbols:
+                for code_elem in element.find_all('code'):
+                    section_symbols[-1][1].extend(inline_symbols(code_elem.get_text()))
 
         elif element.name == 'p':
             # Simple approach: convert inline code to markers
@@ -226,11 +244,19 @@ def html_to_xml(content, source_url=""):
             soup_temp = BeautifulSoup(text_content, 'html.parser')
             clean_text = soup_temp.get_text().strip()
             
+            if section_symbols:
+                for code_elem in element.find_all('code'):
+                    section_symbols[-1][1].extend(inline_symbols(code_elem.get_text()))
+
             if clean_text:
                 content_tag = xml_soup.new_tag('content')
                 content_tag.string = clean_text
                 current_container.append(content_tag)
     
+    for section, names in section_symbols:
+        if names:
+            section['symbols'] = ' '.join(dict.fromkeys(names))
+
     # Custom formatting to make specific tags inline
     xml_output = xml_soup.prettify()
     
@@ -308,7 +334,38 @@ def extract_sections_from_xml(xml_content: str) -> List[Dict[str, Any]]:
             sections.append({
                 'title': title,
                 'level': level,
-                'content': full_content
+                'content': full_content,
+                'symbols': section.get('symbols', '').split()
             })
     
     return sections
+
+def section_parents(sections: List[Dict[str, Any]]) -> List[int]:
+    """Position of each section's parent: the closest earlier section with a lower level (-1 at the top)"""
+    parents, open_sections = [], []
+    for i, section in enumerate(sections):
+        level = section.get('level', 1)
+        while open_sections and sections[open_sections[-1]].get('level', 1) >= level:
+            open_sections.pop()
+        parents.append(open_sections[-1] if open_sections else -1)
+        open_sections.append(i)
+    return parents
+
+def document_summary(xml_content: str) -> str:
+    """Title, description and section titles of a document, used for its document-level embedding"""
+    soup = BeautifulSoup(xml_content, 'xml')
+    parts = []
+    metadata = soup.find('metadata')
+    if metadata:
+        for tag in ('title', 'description'):
+            elem = metadata.find(tag)
+            if elem and elem.string and elem.string.strip():
+                parts.append(elem.string.strip())
+    titles = [s.get('title', '').strip() for s in soup.find_all('section')]
+    parts.extend(t for t in titles if t)
+    return '\n'.join(parts)
+
+def doc_category(url: str) -> str:
+    """Docs section a page belongs to: the path segment after /docs/ (tutorials, explains, ref, api), else overview"""
+    path = url.split('/docs/', 1)[-1] if '/docs/' in url else ''
+    return path.split('/', 1)[0] if '/' in path else 'overview'
@@ -0,0 +1,224 @@
+"""Read-only, memory-mapped snapshot format for the chunk corpus.
+
+A snapshot is a directory holding:
+
+    manifest.json   counts, dimensions, field layout and per-document row ranges
+    vectors.npy     normalized (rows x dim) embedding matrix (float32, float16 or int8)
+    vectors_scales.npy / vectors_codes.npy
+                    int8 per-dimension scales / packed sign bits, when enabled
+    levels.npy      int32 section levels
+    sections.npy    int32 (rows x 2) position of each section in its document and of its parent (-1 at the top)
+    offsets.npy     int64 byte offsets into strings.bin, one span per (row, field)
+    strings.bin     UTF-8 text blob holding every string field back to back
+
+Every file is opened with mmap, so several worker processes serving the same
+snapshot share one copy of the pages through the OS page cache.
+"""
+import os
+import json
+import mmap
+import shutil
+import argparse
+from typing import List, Dict, Optional
+import numpy as np
+from utils.vector_index import QuantizedMatrix, normalize_rows, cosine_to_distance, filter_rows
+from utils.symbols import content_symbols
+from utils.scraper import doc_category, section_parents
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# String columns stored in the blob, in on-disk order ("symbols" space-separated)
+STRING_FIELDS = ["id", "doc_id", "url", "section_title", "content", "symbols"]
+# Integer columns stored side by side in sections.npy
+SECTION_FIELDS = ["section_index", "parent_index"]
+
+
+def _chunk_number(chunk_id: str) -> int:
+    """Position of a chunk within its document, parsed from `<doc_id>_chunk_<i>`"""
+    try:
+        return int(chunk_id.rsplit("_", 1)[-1])
+    except ValueError:
+        return 0
+
+
+def export_snapshot(db, out_dir: str, dtype: str = "float32", binary: bool = False) -> Dict:
+    """Export the chunks table of a FastHTMLDatabase into a snapshot directory"""
+    arrow_table = db.chunks_table.to_arrow().select(STRING_FIELDS + SECTION_FIELDS + ["section_level", "vector"])
+    rows = arrow_table.to_pylist()
+    # Group rows by document, in chunk order, so each document is one contiguous range
+    rows.sort(key=lambda r: (r["doc_id"], r["section_index"]))
+
+    if rows:
+        vectors = normalize_rows(np.asarray([r["vector"] for r in rows], dtype=np.float32))
+    else:
+        vectors = np.empty((0, 0), dtype=np.float32)
+
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    offsets = np.zeros(len(rows) * len(STRING_FIELDS) + 1, dtype=np.int64)
+    docs = {}
+    position = 0
+    with open(os.path.join(tmp_dir, "strings.bin"), "wb") as blob:
+        for i, row in enumerate(rows):
+            row["symbols"] = " ".join(row["symbols"] or [])
+            for j, field in enumerate(STRING_FIELDS):
+                data = (row[field] or "").encode("utf-8")
+                blob.write(data)
+                position += len(data)
+                offsets[i * len(STRING_FIELDS) + j + 1] = position
+            start, _ = docs.get(row["doc_id"], (i, i))
+            docs[row["doc_id"]] = (start, i + 1)
+
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "levels.npy"), np.asarray([r["section_level"] for r in rows], dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "sections.npy"),
+            np.asarray([[r[field] for field in SECTION_FIELDS] for r in rows], dtype=np.int32).reshape(-1, 2))
+    QuantizedMatrix.build(vectors, dtype, binary).save(os.path.join(tmp_dir, "vectors"))
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "table": db.chunks_table.name,
+        "table_version": db.chunks_table.version,
+        "count": len(rows),
+        "dim": int(vectors.shape[1]) if rows else 0,
+        "dtype": dtype,
+        "binary": binary,
+        "string_fields": STRING_FIELDS,
+        "docs": docs,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    # Swap the finished snapshot into place
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+def import_snapshot(db, snapshot_dir: str) -> int:
+    """Load a snapshot's rows back into the chunks table (e.g. to rebuild a database)"""
+    snapshot = ChunkSnapshot(snapshot_dir)
+    records = []
+    for i in range(len(snapshot)):
+        record = snapshot.row(i)
+        if "symbols" not in record:  # exported before symbols were stored
+            record["symbols"] = content_symbols(record["content"])
+        record["category"] = doc_category(record["url"])
+        record["vector"] = snapshot.matrix.row(i).tolist()
+        records.append(record)
+    if records:
+        db.chunks_table.add(records)
+    return len(records)
+
+
+class ChunkSnapshot:
+    """Memory-mapped, read-only view over a snapshot directory"""
+
+    def __init__(self, path: str, binary: bool = True):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format in {path}")
+
+        self.fields = self.manifest["string_fields"]
+        self.docs = self.manifest["docs"]
+        self.matrix = QuantizedMatrix.load(os.path.join(path, "vectors"), binary=binary)
+        self.levels = np.load(os.path.join(path, "levels.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        sections_path = os.path.join(path, "sections.npy")
+        if os.path.exists(sections_path):
+            self.sections = np.load(sections_path, mmap_mode="r")
+        else:
+            self.sections = None  # exported before section links were stored, worked out on first use
+
+        self._blob_file = open(os.path.join(path, "strings.bin"), "rb")
+        if os.fstat(self._blob_file.fileno()).st_size:
+            self.strings = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.strings = b""  # mmap refuses zero-length files
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def _string(self, row: int, field_index: int) -> str:
+        k = row * len(self.fields) + field_index
+        return self.strings[int(self.offsets[k]):int(self.offsets[k + 1])].decode("utf-8")
+
+    def row(self, i: int) -> Dict:
+        """Materialize one row as a dict (without its vector)"""
+        record = {field: self._string(i, j) for j, field in enumerate(self.fields)}
+        if "symbols" in record:
+            record["symbols"] = record["symbols"].split()
+        record["section_level"] = int(self.levels[i])
+        if self.sections is None:
+            self.sections = self._section_links()
+        record["section_index"], record["parent_index"] = (int(v) for v in self.sections[i])
+        return record
+
+    def _section_links(self) -> np.ndarray:
+        """Section and parent positions of a snapshot without sections.npy, from its ids and levels"""
+        id_field = self.fields.index("id")
+        sections = np.full((len(self), 2), -1, dtype=np.int32)
+        for start, end in self.docs.values():
+            positions = [_chunk_number(self._string(i, id_field)) for i in range(start, end)]
+            parents = section_parents([{"level": int(level)} for level in self.levels[start:end]])
+            sections[start:end, 0] = positions
+            sections[start:end, 1] = [-1 if parent < 0 else positions[parent] for parent in parents]
+        return sections
+
+    def search(self, query_embedding, limit: int = 5, doc_ids: Optional[List[str]] = None,
+               section_level: Optional[int] = None) -> List[Dict]:
+        """Exact top-k search (optionally only within `doc_ids` and sections of `section_level`),
+        returning records shaped like LanceDB results"""
+        if not len(self):
+            return []
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        if doc_ids is None and section_level is None:
+            indices, scores = self.matrix.search(query, limit)
+        else:
+            if doc_ids is not None:
+                ranges = [np.arange(*self.docs[d]) for d in doc_ids if d in self.docs]
+                rows = np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+            else:
+                rows = np.arange(len(self))
+            indices, scores = self.matrix.search_rows(query, filter_rows(rows, self.levels, section_level), limit)
+        results = []
+        for i, distance in zip(indices, cosine_to_distance(scores)):
+            record = self.row(int(i))
+            record["_distance"] = float(distance)
+            results.append(record)
+        return results
+
+    def get_document_chunks(self, doc_id: str) -> List[Dict]:
+        """All chunks of one document, in chunk order"""
+        if doc_id not in self.docs:
+            return []
+        start, end = self.docs[doc_id]
+        return [self.row(i) for i in range(start, end)]
+
+    def close(self):
+        if isinstance(self.strings, mmap.mmap):
+            self.strings.close()
+        self._blob_file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a memory-mapped chunk snapshot")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Snapshot directory")
+    parser.add_argument("--db", default="./lancedb")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--binary", action="store_true", help="Also store sign codes for a Hamming prefilter")
+    args = parser.parse_args()
+
+    from utils.database import FastHTMLDatabase
+    database = FastHTMLDatabase(args.db)
+    database.migrate()  # snapshots hold the current columns
+    if args.command == "export":
+        manifest = export_snapshot(database, args.path, dtype=args.dtype, binary=args.binary)
+        print(f"Exported {manifest['count']} chunks ({manifest['dtype']}) to {args.path}")
+    else:
+        print(f"Imported {import_snapshot(database, args.path)} chunks from {args.path}")
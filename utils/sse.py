@@ -0,0 +1,53 @@
+"""Helpers for Server-Sent Event endpoints."""
+import asyncio
+from typing import AsyncIterator
+from utils.metrics import counter
+
+SSE_DISCONNECTS = counter("fastrag_sse_disconnects_total", "SSE clients that went away mid-stream",
+                          labels=("route",))
+
+
+async def wait_for_disconnect(request):
+    """Return once the client has closed the connection"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def until_disconnected(request, source: AsyncIterator, route: str = "") -> AsyncIterator:
+    """Relay `source` until it ends or the client disconnects.
+
+    On disconnect the pending read is cancelled inside `source`, which closes
+    it right away instead of at the next write to the dead socket.
+    """
+    items = source.__aiter__()
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    next_item = None
+    ended = False  # `source` finished or failed on its own
+    try:
+        while True:
+            next_item = asyncio.ensure_future(anext(items))
+            done, _ = await asyncio.wait({next_item, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if next_item not in done:
+                return
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                ended = True
+                return
+            except Exception:
+                ended = True
+                raise
+            next_item = None
+            yield item
+    finally:
+        disconnected.cancel()
+        if not ended:
+            SSE_DISCONNECTS.inc(route=route)
+        if next_item is not None and not next_item.done():
+            # Not awaited: the server may be cancelling this response, and the
+            # cancellation ends `source` from inside its own task anyway
+            next_item.cancel()
+        else:
+            await source.aclose()
@@ -0,0 +1,166 @@
+"""Exact-match index of FastHTML API symbols.
+
+Questions like "what does `hx_swap_oob` do" name an identifier; an embedding
+blurs it into its neighbours. While a page is converted to XML, the function
+and class names and keyword arguments in its code examples and inline code
+spans are recorded on each `<section symbols="...">`, and stored with the
+section's chunk. `SymbolIndex` maps every symbol to the rows of the chunks
+that mention it; it is built in memory from the chunks table (one dict of
+small int32 arrays), so a lookup is a few hash probes.
+
+A query's symbols are the identifiers that look like code: `backticked`,
+called(), dotted, snake_case or CamelCase. Plain words are left to the
+vector search.
+"""
+import re
+import ast
+import keyword
+import builtins
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from utils.metrics import counter
+
+SYMBOL_MODES = ("off", "boost", "exact")
+
+IDENTIFIER = re.compile(r"[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*")
+INLINE_CODE = re.compile(r"`([^`\n]+)`")
+FENCED_CODE = re.compile(r"```[^\n]*\n(.*?)```", re.S)
+# Fallbacks for snippets that don't parse (shell, notebook magics, fragments)
+CALL = re.compile(r"([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)\s*\(")
+KEYWORD_ARG = re.compile(r"[(,]\s*([A-Za-z_]\w*)\s*=(?!=)")
+DEFINITION = re.compile(r"\b(?:def|class)\s+([A-Za-z_]\w*)")
+QUERY_TOKEN = re.compile(rf"({IDENTIFIER.pattern})(\s*\()?")
+
+IGNORED = set(keyword.kwlist) | set(dir(builtins)) | {"self", "cls"}
+
+SYMBOL_LOOKUPS = counter("fastrag_symbol_lookups_total", "Searches whose query named indexed API symbols",
+                         labels=("result",))
+
+
+def _keep(name: str) -> bool:
+    return name not in IGNORED and not (len(name) == 1 and name.islower())
+
+
+def _dotted(node) -> Optional[str]:
+    """`app.route` for an attribute chain on a name, `fast_app` for a name"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+    elif not parts:
+        return None
+    return ".".join(reversed(parts))
+
+
+def _unique(names: Iterable[str]) -> List[str]:
+    return [name for name in dict.fromkeys(names) if name and _keep(name.rsplit(".", 1)[-1])]
+
+
+def code_symbols(code: str) -> List[str]:
+    """Names defined, imported or called in a code snippet, and the keyword arguments passed"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return _unique(CALL.findall(code) + KEYWORD_ARG.findall(code) + DEFINITION.findall(code))
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.append(node.name)
+            names += [_dotted(d.func if isinstance(d, ast.Call) else d) for d in node.decorator_list]
+        elif isinstance(node, ast.Call):
+            names.append(_dotted(node.func))
+            names += [kw.arg for kw in node.keywords if kw.arg]
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names += [alias.name for alias in node.names if alias.name != "*"]
+    return _unique(names)
+
+
+def inline_symbols(span: str) -> List[str]:
+    """Identifiers in an inline code span such as `hx_swap_oob` or `app.route()`"""
+    return _unique(IDENTIFIER.findall(span))
+
+
+def content_symbols(content: str) -> List[str]:
+    """Symbols of a stored section's text (fenced code blocks and inline spans), for chunks
+    stored before symbols were extracted from the XML"""
+    names = [name for code in FENCED_CODE.findall(content) for name in code_symbols(code)]
+    names += [name for span in INLINE_CODE.findall(FENCED_CODE.sub(" ", content)) for name in inline_symbols(span)]
+    return _unique(names)
+
+
+def query_symbols(query: str) -> List[str]:
+    """Identifiers in a question that look like code"""
+    names = [name for span in INLINE_CODE.findall(query) for name in IDENTIFIER.findall(span)]
+    for match in QUERY_TOKEN.finditer(INLINE_CODE.sub(" ", query)):
+        name = match.group(1)
+        if match.group(2) or "_" in name or "." in name or any(c.isupper() for c in name[1:]):
+            names.append(name)
+    return _unique(names)
+
+
+class SymbolIndex:
+    """Symbol -> rows of the chunks that mention it, over one version of a chunks table"""
+
+    def __init__(self, ids: List[str], doc_ids: List[str], levels: Iterable[int], symbols: Iterable[List[str]]):
+        self.ids = ids
+        self.doc_ids = doc_ids
+        self.levels = np.asarray(list(levels), dtype=np.int32)
+        postings: Dict[str, List[int]] = {}
+        for row, names in enumerate(symbols):
+            for name in names or ():
+                # `app.route` is also found as `route`
+                for key in (name, name.rsplit(".", 1)[1]) if "." in name else (name,):
+                    rows = postings.setdefault(key, [])
+                    if not rows or rows[-1] != row:
+                        rows.append(row)
+        self.postings = {name: np.asarray(rows, dtype=np.int32) for name, rows in postings.items()}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> "SymbolIndex":
+        rows = list(rows)
+        return cls([r["id"] for r in rows], [r["doc_id"] for r in rows], [r["section_level"] for r in rows],
+                   [r.get("symbols") or [] for r in rows])
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(rows.nbytes for rows in self.postings.values())
+
+    def known(self, names: List[str]) -> List[str]:
+        """The names that are indexed, each as its dotted form or else its last part"""
+        known = []
+        for name in names:
+            if name in self.postings:
+                known.append(name)
+            elif "." in name and name.rsplit(".", 1)[1] in self.postings:
+                known.append(name.rsplit(".", 1)[1])
+        return list(dict.fromkeys(known))
+
+    def lookup(self, names: List[str], doc_ids: Optional[List[str]] = None,
+               section_level: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, number of the names each mentions), most matches first, optionally only
+        within `doc_ids` and sections of `section_level`"""
+        known = self.known(names)
+        SYMBOL_LOOKUPS.inc(result="hit" if known else "miss")
+        if not known:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        if len(known) == 1:
+            rows = self.postings[known[0]]
+            counts = np.ones(len(rows), dtype=np.int64)
+        else:
+            rows, counts = np.unique(np.concatenate([self.postings[name] for name in known]), return_counts=True)
+            order = np.argsort(-counts, kind="stable")
+            rows, counts = rows[order], counts[order]
+        if doc_ids is not None or section_level is not None:
+            keep = np.ones(len(rows), dtype=bool)
+            if doc_ids is not None:
+                allowed = set(doc_ids)
+                keep &= np.fromiter((self.doc_ids[row] in allowed for row in rows), dtype=bool, count=len(rows))
+            if section_level is not None:
+                keep &= self.levels[rows] == section_level
+            rows, counts = rows[keep], counts[keep]
+        return rows, counts
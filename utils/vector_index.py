@@ -0,0 +1,297 @@
+import os
+import re
+import glob
+import time
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+from utils.quantization import STORAGE_DTYPES, quantize, dequantize, binary_codes, hamming_distances
+
+# Columns returned alongside each hit, mirroring a LanceDB search record
+RESULT_FIELDS = ["id", "doc_id", "url", "section_title", "section_level", "section_index", "parent_index", "content"]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of a matrix (zero rows are left as zeros)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def cosine_scores(matrix: np.ndarray, query: np.ndarray, scales: Optional[np.ndarray] = None,
+                  block_size: int = 8192) -> np.ndarray:
+    """Score every row against a normalized query with a single matrix-vector product.
+
+    Reduced precision matrices are upcast block by block so the product runs
+    through BLAS without materializing a full float32 copy. Per-dimension int8
+    scales are folded into the query instead of the matrix.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    if scales is not None:
+        query = query * scales
+    if matrix.dtype == np.float32:
+        return matrix @ query
+
+    scores = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], block_size):
+        block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+        scores[start:start + block_size] = block @ query
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return indices of the k highest scores, best first, via argpartition"""
+    n = scores.shape[0]
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    k = min(k, n)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def filter_rows(rows: np.ndarray, levels: np.ndarray, section_level: Optional[int] = None) -> np.ndarray:
+    """Keep the rows whose section level matches (all of them when no level is given)"""
+    if section_level is None:
+        return rows
+    return rows[np.asarray(levels)[rows] == section_level]
+
+
+def cosine_to_distance(scores: np.ndarray) -> np.ndarray:
+    """Convert cosine similarity of unit vectors to LanceDB's squared L2 `_distance`"""
+    return np.maximum(0.0, 2.0 - 2.0 * scores)
+
+
+class QuantizedMatrix:
+    """A normalized embedding matrix in float32, float16 or int8, with optional binary codes.
+
+    With binary codes, search first ranks rows by Hamming distance between
+    sign bits and then rescores the best `rescore_factor * k` candidates
+    against the stored vectors.
+
+    float16 rows are upcast to float32 once, on the first search, and the copy
+    is kept: numpy converts half floats without SIMD, so upcasting blocks on
+    every query made float16 several times slower than int8. float16 thus
+    halves the stored and mapped size but not the memory searches use.
+    """
+
+    def __init__(self, vectors: np.ndarray, scales: Optional[np.ndarray] = None,
+                 codes: Optional[np.ndarray] = None, rescore_factor: int = 10):
+        self.vectors = vectors
+        self.scales = scales
+        self.codes = codes
+        self.rescore_factor = rescore_factor
+        self._float32 = None  # upcast copy of float16 vectors
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, dtype: str = "float32", binary: bool = False, **kwargs) -> "QuantizedMatrix":
+        """Quantize an already normalized float matrix"""
+        vectors, scales = quantize(matrix, dtype)
+        codes = binary_codes(matrix) if binary and len(matrix) else None
+        return cls(vectors, scales, codes, **kwargs)
+
+    def save(self, prefix: str):
+        """Write `<prefix>.npy` plus `<prefix>_scales.npy` / `<prefix>_codes.npy` when present"""
+        for suffix, array in (("", self.vectors), ("_scales", self.scales), ("_codes", self.codes)):
+            if array is None:
+                continue
+            path = f"{prefix}{suffix}.npy"
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, prefix: str, binary: bool = True, **kwargs) -> "QuantizedMatrix":
+        """Memory-map a matrix written by `save`"""
+        def optional(suffix):
+            path = f"{prefix}{suffix}.npy"
+            return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        return cls(np.load(f"{prefix}.npy", mmap_mode="r"), optional("_scales"),
+                   optional("_codes") if binary else None, **kwargs)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.vectors, self.scales, self.codes) if a is not None)
+
+    @property
+    def search_nbytes(self) -> int:
+        """Memory used by searches: `nbytes` plus the float32 copy of float16 vectors, once made"""
+        return self.nbytes + (self._float32.nbytes if self._float32 is not None else 0)
+
+    def _scored(self) -> np.ndarray:
+        """The matrix searches score: the stored vectors, or the float32 copy of float16 ones"""
+        if self.vectors.dtype != np.float16:
+            return self.vectors
+        if self._float32 is None:
+            self._float32 = np.asarray(self.vectors, dtype=np.float32)
+        return self._float32
+
+    def row(self, i: int) -> np.ndarray:
+        """Decode one row to float32"""
+        return dequantize(self.vectors[i], self.scales)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, cosine scores) of the top k rows for a normalized query"""
+        n = len(self)
+        if n == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        n_candidates = min(n, k * self.rescore_factor)
+        if self.codes is not None and n_candidates < n:
+            distances = hamming_distances(self.codes, binary_codes(query.reshape(1, -1))[0])
+            candidates = np.sort(np.argpartition(distances, n_candidates - 1)[:n_candidates])
+            scores = cosine_scores(np.asarray(self._scored()[candidates]), query, self.scales)
+            order = top_k(scores, k)
+            return candidates[order], scores[order]
+
+        scores = cosine_scores(self._scored(), query, self.scales)
+        indices = top_k(scores, k)
+        return indices, scores[indices]
+
+    def search_rows(self, query: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Like `search`, but only over the given row indices (scored exactly, no prefilter)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = cosine_scores(np.asarray(self._scored()[rows]), query, self.scales)
+        order = top_k(scores, k)
+        return rows[order], scores[order]
+
+
+class NumpyVectorIndex:
+    """In-process exact vector index over the chunks table.
+
+    Holds a normalized matrix of all chunk vectors, memory-mapped from a
+    per-version cache file, plus the metadata columns needed to build search
+    records. Reloads automatically when the table version changes.
+
+    Cache files of versions older than the published one (or, with nothing
+    published, than the loaded one) are removed on load; newer ones may still be
+    mapped by processes reading a version that isn't published yet.
+    """
+
+    def __init__(self, table, cache_dir: str, dtype: str = "float32", binary: bool = False,
+                 refresh_interval: float = 1.0, published=None):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported index dtype '{dtype}', expected one of {STORAGE_DTYPES}")
+        self.table = table
+        self.cache_dir = cache_dir
+        self.dtype = dtype
+        self.binary = binary
+        self.refresh_interval = refresh_interval
+        self.published = published  # utils.publish.PublishedVersions of the table's corpus
+
+        self.version = None
+        self.matrix = None
+        self.rows: List[Dict] = []
+        self.doc_rows: Dict[str, np.ndarray] = {}
+        self._last_check = 0.0
+
+    @property
+    def table(self):
+        return self._table
+
+    @table.setter
+    def table(self, table):
+        # A new handle (e.g. a pinned database moving to a new publication) is checked on the next search
+        self._table = table
+        self._last_check = 0.0
+
+    @property
+    def _storage_tag(self) -> str:
+        return f"{self.dtype}_bin" if self.binary else self.dtype
+
+    def _cache_prefix(self, version) -> str:
+        return os.path.join(self.cache_dir, f"{self.table.name}_v{version}_{self._storage_tag}")
+
+    def _read_columns(self, columns: List[str]):
+        """Only the given columns of every row, skipping those (e.g. the vector) not asked for"""
+        # Versions stored before section links lack their columns
+        present = [c for c in columns if c in self.table.schema.names]
+        return self.table.search().select(present).limit(None).to_arrow()
+
+    def load(self):
+        """(Re)load vectors and metadata for the current table version"""
+        version = self.table.version
+        prefix = self._cache_prefix(version)
+
+        if os.path.exists(f"{prefix}.npy"):
+            arrow_table = self._read_columns(RESULT_FIELDS)
+        else:
+            arrow_table = self._read_columns(RESULT_FIELDS + ["vector"])
+            if arrow_table.num_rows:
+                matrix = np.asarray(arrow_table.column("vector").to_pylist(), dtype=np.float32)
+            else:
+                matrix = np.empty((0, 0), dtype=np.float32)
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            QuantizedMatrix.build(normalize_rows(matrix), self.dtype, self.binary).save(prefix)
+            arrow_table = arrow_table.select([c for c in arrow_table.schema.names if c != "vector"])
+
+        self.matrix = QuantizedMatrix.load(prefix, binary=self.binary)
+        self.rows = arrow_table.to_pylist()
+        doc_rows: Dict[str, List[int]] = {}
+        for i, row in enumerate(self.rows):
+            doc_rows.setdefault(row["doc_id"], []).append(i)
+        self.doc_rows = {doc_id: np.asarray(rows, dtype=np.int64) for doc_id, rows in doc_rows.items()}
+        self.levels = np.asarray([row["section_level"] for row in self.rows], dtype=np.int32)
+        self.version = version
+        self._remove_stale_files(version)
+
+    def _remove_stale_files(self, loaded_version: int):
+        record = self.published.read() if self.published is not None else None
+        oldest_kept = min(loaded_version, record["chunks_version"]) if record else loaded_version
+        base = os.path.join(self.cache_dir, f"{self.table.name}_v*_{self._storage_tag}")
+        version_of = re.compile(re.escape(f"{self.table.name}_v") + r"(\d+)_")
+        for suffix in ("", "_scales", "_codes"):
+            for stale in glob.glob(f"{base}{suffix}.npy"):
+                match = version_of.match(os.path.basename(stale))
+                if match and int(match.group(1)) < oldest_kept:
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass  # Another worker may still have it mapped (Windows)
+
+    def ensure_fresh(self):
+        """Reload if the table has moved to a new version (checked at most once per interval)"""
+        now = time.monotonic()
+        if self.matrix is not None and now - self._last_check < self.refresh_interval:
+            return
+        self._last_check = now
+        if self.matrix is None or self.table.version != self.version:
+            self.load()
+
+    def search_indices(self, query_embedding, limit: int, doc_ids: Optional[List[str]] = None,
+                       section_level: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, cosine scores) of the top `limit` rows, optionally only
+        within `doc_ids` and sections of `section_level`"""
+        self.ensure_fresh()
+        if not self.rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        if doc_ids is None and section_level is None:
+            return self.matrix.search(query, limit)
+        if doc_ids is not None:
+            rows = [self.doc_rows[d] for d in doc_ids if d in self.doc_rows]
+            rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        else:
+            rows = np.arange(len(self.rows))
+        return self.matrix.search_rows(query, filter_rows(rows, self.levels, section_level), limit)
+
+    def search(self, query_embedding, limit: int = 5, doc_ids: Optional[List[str]] = None,
+               section_level: Optional[int] = None) -> List[Dict]:
+        """Search the index, returning records shaped like LanceDB results"""
+        indices, scores = self.search_indices(query_embedding, limit, doc_ids, section_level)
+        distances = cosine_to_distance(scores)
+        results = []
+        for i, distance in zip(indices, distances):
+            record = dict(self.rows[i])
+            record["_distance"] = float(distance)
+            results.append(record)
+        return results